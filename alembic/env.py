@@ -10,12 +10,13 @@ config = context.config
 fileConfig(config.config_file_name)
 
 # Import your models' MetaData object here
-from app.database import Base
+from app.database import Base, DATABASE_URL as APP_DATABASE_URL
+from app import models  # noqa: F401  (registra as tabelas no metadata)
 target_metadata = Base.metadata
 
-# Lê a URL do .env
-DATABASE_URL = os.getenv("DATABASE_URL")
-config.set_main_option("sqlalchemy.url", DATABASE_URL)
+# Lê a URL do .env; sem DATABASE_URL usa a mesma URL do app (DB_USER, DB_HOST, ...)
+DATABASE_URL = os.getenv("DATABASE_URL") or APP_DATABASE_URL
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
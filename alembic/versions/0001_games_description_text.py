@@ -0,0 +1,38 @@
+"""games.description_text (texto sem HTML da descrição)
+
+Revision ID: 0001_games_description_text
+Revises:
+Create Date: 2026-10-19
+
+Bancos criados antes desta coluna não a ganham via Base.metadata.create_all
+(que só cria tabelas novas). Idempotente: em bancos novos, onde o create_all
+já criou a coluna, não faz nada. Depois de aplicar, preencha os valores com
+python -m app.jobs.backfill_description_text.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_games_description_text"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_column("games", "description_text"):
+        op.add_column("games", sa.Column("description_text", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_column("games", "description_text"):
+        op.drop_column("games", "description_text")
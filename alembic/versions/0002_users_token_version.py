@@ -0,0 +1,39 @@
+"""users.token_version (revogação de JWTs de acesso)
+
+Revision ID: 0002_users_token_version
+Revises: 0001_games_description_text
+Create Date: 2026-10-19
+
+Usuários existentes ficam com versão 0, que é a versão gravada nos tokens
+emitidos a partir daí. Idempotente, como a 0001.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_users_token_version"
+down_revision: Union[str, Sequence[str], None] = "0001_games_description_text"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_column("users", "token_version"):
+        op.add_column(
+            "users",
+            sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_column("users", "token_version"):
+        op.drop_column("users", "token_version")
@@ -0,0 +1,38 @@
+"""índice em remember_tokens.expires_at (purga de tokens expirados)
+
+Revision ID: 0003_remember_tokens_expires_at
+Revises: 0002_users_token_version
+Create Date: 2026-10-19
+
+O job app.jobs.purge_remember_tokens busca lotes por expires_at < agora;
+sem o índice cada lote varre a tabela inteira. Idempotente, como a 0001.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_remember_tokens_expires_at"
+down_revision: Union[str, Sequence[str], None] = "0002_users_token_version"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_remember_tokens_expires_at"
+
+
+def _has_index(table: str, name: str) -> bool:
+    return any(i["name"] == name for i in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_index("remember_tokens", INDEX_NAME):
+        op.create_index(INDEX_NAME, "remember_tokens", ["expires_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_index("remember_tokens", INDEX_NAME):
+        op.drop_index(INDEX_NAME, table_name="remember_tokens")
@@ -0,0 +1,36 @@
+"""users.avatar_variants (mapa tamanho -> URL das variantes do avatar)
+
+Revision ID: 0004_users_avatar_variants
+Revises: 0003_remember_tokens_expires_at
+Create Date: 2026-10-19
+
+Coluna nula nos usuários existentes: o app cai no avatar_url original até o
+worker de variantes processar o próximo upload. Idempotente, como a 0001.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_users_avatar_variants"
+down_revision: Union[str, Sequence[str], None] = "0003_remember_tokens_expires_at"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_column("users", "avatar_variants"):
+        op.add_column("users", sa.Column("avatar_variants", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_column("users", "avatar_variants"):
+        op.drop_column("users", "avatar_variants")
@@ -1,16 +1,21 @@
 import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 from . import crud, schemas, models
 from .database import get_db
+from .principals import Principal, get_principal
+from .hashing import verify_password, get_password_hash, averify_password, aget_password_hash
+from app.utils.cache import TTLCache
 
 import secrets
 import hashlib
@@ -20,24 +25,15 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "troque_esta_chave")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Chaves antigas ainda aceitas na verificação durante a rotação (separadas por vírgula).
+SECRET_KEY_PREVIOUS = [k.strip() for k in os.getenv("SECRET_KEY_PREVIOUS", "").split(",") if k.strip()]
+# Tolerância de relógio (segundos) para exp/nbf/iat.
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", "30"))
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-# --- Password helpers ---
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception:
-        return False
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 # --- Authentication helpers ---
 def authenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
     user = crud.get_user_by_email(db, email)
@@ -48,6 +44,16 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[models
     return user
 
 
+async def aauthenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
+    """Versão async: consulta no threadpool e bcrypt no pool de hashing (ver app.hashing)."""
+    user = await run_in_threadpool(crud.get_user_by_email, db, email)
+    if not user:
+        return None
+    if not await averify_password(password, user.hashed_password):
+        return None
+    return user
+
+
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None, extra_claims: Optional[Dict[str, Any]] = None) -> str:
     now = datetime.utcnow()
     if expires_delta:
@@ -70,8 +76,58 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None,
     return token
 
 
+def create_user_access_token(user: models.User, expires_delta: Optional[timedelta] = None) -> str:
+    """Access token com o id do usuário em `sub` e a versão atual dos tokens em `ver`."""
+    return create_access_token(
+        subject=str(user.id),
+        expires_delta=expires_delta,
+        extra_claims={"ver": int(user.token_version or 0), "type": "access"},
+    )
+
+
+# --- Verificação com cache ---
+# Tokens já verificados ficam num LRU (chave = sha256 do token) até o próprio
+# exp (+ leeway); o mesmo bearer repetido não refaz HMAC nem parse das claims.
+# Só decodificações bem-sucedidas entram no cache.
+_verify_keys: List[str] = [SECRET_KEY, *SECRET_KEY_PREVIOUS]
+_decoded_tokens = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def configure_signing_keys(secret_key: str, previous_keys: Iterable[str] = ()) -> None:
+    """Troca a chave de assinatura (e as antigas aceitas) e descarta os tokens em cache."""
+    global SECRET_KEY
+    SECRET_KEY = secret_key
+    _verify_keys[:] = [secret_key, *previous_keys]
+    _decoded_tokens.clear()
+
+
+def _decode_with_keys(token: str) -> Dict[str, Any]:
+    last_error: Optional[JWTError] = None
+    for key in _verify_keys:
+        try:
+            return jwt.decode(token, key, algorithms=[ALGORITHM], options={"leeway": JWT_LEEWAY_SECONDS})
+        except JWTError as e:
+            last_error = e
+    raise last_error
+
+
 def decode_access_token(token: str) -> Dict[str, Any]:
-    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = _decoded_tokens.get(digest)
+    if cached is not None:
+        return dict(cached)
+
+    payload = _decode_with_keys(token)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        remaining = exp + JWT_LEEWAY_SECONDS - time.time()
+        if remaining > 0:
+            _decoded_tokens.set(digest, payload, ttl=remaining)
+    return dict(payload)
+
+
+def jwt_cache_stats() -> dict:
+    return _decoded_tokens.stats()
 
 
 # --- Confirmation token helpers ---
@@ -107,28 +163,52 @@ def verify_confirmation_token(token: str) -> str:
 
 
 # --- FastAPI dependencias ---
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    credentials_exception = HTTPException(
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: int
+    token_version: int
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
     try:
         payload = decode_access_token(token)
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
 
-    user = crud.get_user_by_email(db, email=email)
-    if not user:
-        raise credentials_exception
+    sub = payload.get("sub")
+    if payload.get("type") == "confirm" or not isinstance(sub, str) or not sub.isdigit():
+        raise _credentials_exception()
+    try:
+        version = int(payload.get("ver", 0))
+    except (TypeError, ValueError):
+        raise _credentials_exception()
+    return TokenClaims(user_id=int(sub), token_version=version)
+
+
+def get_current_user_id(claims: TokenClaims = Depends(get_token_claims)) -> int:
+    """
+    Identidade só a partir das claims (sem banco). Para rotas que só precisam do id;
+    não enxerga revogação por token_version até o token expirar.
+    """
+    return claims.user_id
+
+
+def get_current_user(claims: TokenClaims = Depends(get_token_claims), db: Session = Depends(get_db)) -> Principal:
+    user = get_principal(db, claims.user_id)
+    if not user or user.token_version != claims.token_version:
+        raise _credentials_exception()
     return user
 
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     is_active = getattr(current_user, "is_active", True)
     if not is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
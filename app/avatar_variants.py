@@ -0,0 +1,138 @@
+"""
+Variantes de avatar em tamanhos fixos (WebP), geradas num pool de processos.
+
+Depois do upload o original fica disponível na hora; as miniaturas (32, 64,
+128 e 256 px, recorte quadrado central) são geradas em background e gravadas
+ao lado do blob como <sha256>_<tamanho>.webp. Como o nome deriva do hash do
+original, uploads repetidos reaproveitam as variantes já existentes.
+Quando terminam, o mapa {tamanho: url} vai para users.avatar_variants.
+Com backend remoto (S3) o original é baixado para um diretório temporário,
+as variantes são geradas ali e enviadas ao bucket.
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, storage
+from .storage_backends import LocalStorageBackend, get_backend
+from .database import SessionLocal
+
+logger = logging.getLogger("app.avatar_variants")
+
+AVATAR_VARIANT_SIZES = tuple(
+    int(s) for s in os.getenv("AVATAR_VARIANT_SIZES", "32,64,128,256").split(",") if s.strip()
+)
+AVATAR_VARIANT_QUALITY = int(os.getenv("AVATAR_VARIANT_QUALITY", "80"))
+AVATAR_VARIANT_WORKERS = int(os.getenv("AVATAR_VARIANT_WORKERS", "2"))
+# limite contra "decompression bombs" (PNG pequeno que abre em gigapixels)
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", str(40_000_000)))
+
+
+def variant_relpath(sha256: str, size: int) -> str:
+    return f"{sha256[:2]}/{sha256}_{size}.webp"
+
+
+def variant_urls(sha256: str, sizes: Sequence[int] = AVATAR_VARIANT_SIZES) -> Dict[str, str]:
+    backend = get_backend()
+    return {str(size): backend.url(variant_relpath(sha256, size)) for size in sizes}
+
+
+def render_variants(src_path: str, media_dir: str, sha256: str, sizes: Sequence[int],
+                    quality: int, max_pixels: int) -> Dict[str, str]:
+    """Roda no processo filho: gera as variantes que ainda não existem."""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    todo = [s for s in sizes if not os.path.exists(os.path.join(media_dir, variant_relpath(sha256, s)))]
+    if todo:
+        with Image.open(src_path) as im:
+            im = ImageOps.exif_transpose(im)
+            im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+            for size in sorted(todo, reverse=True):
+                thumb = ImageOps.fit(im, (size, size), method=Image.Resampling.LANCZOS)
+                dest = os.path.join(media_dir, variant_relpath(sha256, size))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        thumb.save(f, format="WEBP", quality=quality, method=4)
+                    os.chmod(tmp_name, 0o644)
+                    os.replace(tmp_name, dest)
+                except BaseException:
+                    if os.path.exists(tmp_name):
+                        os.remove(tmp_name)
+                    raise
+    return {str(s): variant_relpath(sha256, s) for s in sizes}
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=AVATAR_VARIANT_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def generate_avatar_variants(user_id: int, blob: storage.StoredBlob) -> None:
+    """Background task do upload: gera as variantes e grava o mapa no usuário."""
+    loop = asyncio.get_running_loop()
+    backend = get_backend()
+    try:
+        if isinstance(backend, LocalStorageBackend):
+            await loop.run_in_executor(
+                _get_executor(), render_variants,
+                str(backend.path(blob.relpath)), str(backend.root), blob.sha256,
+                AVATAR_VARIANT_SIZES, AVATAR_VARIANT_QUALITY, AVATAR_MAX_PIXELS,
+            )
+        else:
+            await _generate_remote(loop, backend, blob)
+    except Exception:
+        logger.exception("Falha ao gerar variantes do avatar %s (user %s)", blob.sha256, user_id)
+        return
+    await run_in_threadpool(_save_variants, user_id, blob.url, variant_urls(blob.sha256))
+
+
+async def _generate_remote(loop, backend, blob: storage.StoredBlob) -> None:
+    workdir = await run_in_threadpool(tempfile.mkdtemp, dir=storage.MEDIA_TMP_DIR)
+    try:
+        src = os.path.join(workdir, "original" + blob.ext)
+        await run_in_threadpool(backend.fetch, blob.relpath, src)
+        rendered = await loop.run_in_executor(
+            _get_executor(), render_variants,
+            src, workdir, blob.sha256,
+            AVATAR_VARIANT_SIZES, AVATAR_VARIANT_QUALITY, AVATAR_MAX_PIXELS,
+        )
+        for key in rendered.values():
+            await run_in_threadpool(backend.save, key, os.path.join(workdir, key), "image/webp")
+    finally:
+        await run_in_threadpool(shutil.rmtree, workdir, True)
+
+
+def _save_variants(user_id: int, avatar_url: str, variants: Dict[str, str]) -> None:
+    db = SessionLocal()
+    try:
+        crud.set_user_avatar_variants(db, user_id, avatar_url, variants)
+    finally:
+        db.close()
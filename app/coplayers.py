@@ -0,0 +1,200 @@
+"""
+Índice de sobreposição de sessões (user_games) por game, para co-players.
+
+Cada game ganha uma árvore de intervalos centrada, montada a partir de uma
+consulta só (id, user_id, started_at, finished_at pelo índice de game_id) e
+guardada num cache LRU + TTL. A consulta de sobreposição custa O(log n + k)
+em vez de varrer todas as sessões do game com o OR de NULLs.
+
+Datas viram timestamps; started_at NULL vale -inf e finished_at NULL vale
++inf, o que reproduz a regra antiga (NULL = intervalo aberto, sobrepõe).
+Sessões antigas com finished_at < started_at (gravadas antes da validação em
+schemas.UserGameBase) entram com os extremos trocados.
+
+Escritas em user_games feitas pelo crud invalidam o game no after_commit;
+mudanças de outros workers (e cascatas de delete) aparecem no máximo após
+COPLAYER_INDEX_TTL_SECONDS.
+"""
+import os
+import math
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger("app.coplayers")
+
+COPLAYER_INDEX_SIZE = int(os.getenv("COPLAYER_INDEX_SIZE", "2000"))
+COPLAYER_INDEX_TTL_SECONDS = float(os.getenv("COPLAYER_INDEX_TTL_SECONDS", "60"))
+
+_EVENTS_KEY = "coplayer_index_events"
+
+# (start, end, user_game_id, user_id)
+Interval = Tuple[float, float, int, int]
+
+
+def to_bound(value: Optional[datetime], open_value: float) -> float:
+    if value is None:
+        return open_value
+    if value.tzinfo is None:
+        # o MySQL devolve datetimes sem fuso; tudo é gravado em UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class _Node:
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center: float, by_start: List[Interval], by_end: List[Interval],
+                 left: "Optional[_Node]", right: "Optional[_Node]") -> None:
+        self.center = center
+        self.by_start = by_start  # intervalos que contêm o centro, por início crescente
+        self.by_end = by_end      # os mesmos, por fim decrescente
+        self.left = left
+        self.right = right
+
+
+def _normalized(iv: Interval) -> Interval:
+    start, end, ug_id, user_id = iv
+    return (end, start, ug_id, user_id) if start > end else iv
+
+
+def _build(intervals: List[Interval]) -> Optional[_Node]:
+    """Intervalos com início <= fim (ver _normalized); senão a recursão não termina."""
+    if not intervals:
+        return None
+    points = sorted(p for iv in intervals for p in iv[:2] if math.isfinite(p))
+    center = points[len(points) // 2] if points else 0.0
+
+    here: List[Interval] = []
+    left: List[Interval] = []
+    right: List[Interval] = []
+    for iv in intervals:
+        if iv[1] < center:
+            left.append(iv)
+        elif iv[0] > center:
+            right.append(iv)
+        else:
+            here.append(iv)
+    return _Node(
+        center,
+        sorted(here, key=lambda iv: iv[0]),
+        sorted(here, key=lambda iv: iv[1], reverse=True),
+        _build(left),
+        _build(right),
+    )
+
+
+class IntervalTree:
+    """Árvore de intervalos centrada, estática (remontada quando o game muda)."""
+
+    def __init__(self, intervals: Sequence[Interval]) -> None:
+        self.size = len(intervals)
+        self._root = _build([_normalized(iv) for iv in intervals])
+
+    def overlapping(self, start: float, end: float) -> List[Interval]:
+        """Intervalos [s, e] com s <= end e e >= start (extremos inclusivos)."""
+        if start > end:
+            start, end = end, start
+        out: List[Interval] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                # todos aqui terminam depois do centro (> end >= start): basta s <= end
+                for iv in node.by_start:
+                    if iv[0] > end:
+                        break
+                    out.append(iv)
+                stack.append(node.left)
+            elif start > node.center:
+                # todos aqui começam antes do centro (< start <= end): basta e >= start
+                for iv in node.by_end:
+                    if iv[1] < start:
+                        break
+                    out.append(iv)
+                stack.append(node.right)
+            else:
+                out.extend(node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return out
+
+
+class CoplayerIndex:
+    def __init__(self, maxsize: int = COPLAYER_INDEX_SIZE, ttl: float = COPLAYER_INDEX_TTL_SECONDS) -> None:
+        self._trees = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # incrementado a cada invalidação: uma árvore montada antes dela não é guardada
+        self._generation: Dict[int, int] = {}
+
+    def _load(self, db: Session, game_id: int) -> IntervalTree:
+        with self._lock:
+            generation = self._generation.get(game_id, 0)
+        rows = db.query(
+            models.UserGame.id, models.UserGame.user_id, models.UserGame.started_at, models.UserGame.finished_at
+        ).filter(models.UserGame.game_id == game_id).all()
+        tree = IntervalTree([
+            (to_bound(started, -math.inf), to_bound(finished, math.inf), ug_id, user_id)
+            for ug_id, user_id, started, finished in rows
+        ])
+        with self._lock:
+            if self._generation.get(game_id, 0) == generation:
+                self._trees.set(game_id, tree)
+        return tree
+
+    def tree(self, db: Session, game_id: int) -> IntervalTree:
+        tree = self._trees.get(game_id)
+        if tree is None:
+            tree = self._load(db, game_id)
+        return tree
+
+    def coplayer_ids(self, db: Session, ref: models.UserGame) -> Set[int]:
+        """user_ids com sessão do mesmo game sobrepondo a sessão `ref` (exceto o próprio dono)."""
+        start = to_bound(ref.started_at, -math.inf)
+        end = to_bound(ref.finished_at, math.inf)
+        return {
+            user_id
+            for _, _, _, user_id in self.tree(db, ref.game_id).overlapping(start, end)
+            if user_id != ref.user_id
+        }
+
+    def invalidate(self, game_id: int) -> None:
+        with self._lock:
+            self._generation[game_id] = self._generation.get(game_id, 0) + 1
+            self._trees.pop(game_id)
+
+    def stats(self) -> dict:
+        return self._trees.stats()
+
+
+coplayer_index = CoplayerIndex()
+
+
+def queue_user_game_change(db: Session, game_id: Optional[int]) -> None:
+    """O game é invalidado no índice só quando a transação commitar."""
+    if game_id is not None:
+        db.info.setdefault(_EVENTS_KEY, set()).add(game_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed_games(session: Session) -> None:
+    for game_id in session.info.pop(_EVENTS_KEY, ()):
+        try:
+            coplayer_index.invalidate(game_id)
+        except Exception:
+            logger.exception("Falha ao invalidar o índice de co-players do game %s", game_id)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_rolled_back_changes(session: Session) -> None:
+    session.info.pop(_EVENTS_KEY, None)
@@ -1,11 +1,19 @@
-from datetime import datetime
-from typing import List, Optional, Any, Union, Dict
+from datetime import datetime, timedelta
+from typing import List, Optional, Any, Union, Dict, Iterator, NamedTuple, Sequence, Tuple
 
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session, joinedload, load_only
+from sqlalchemy import func, or_, and_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 from . import models, schemas
+from .coplayers import coplayer_index, queue_user_game_change
+from .friend_graph import Edge, friend_graph, friendship_status, queue_friendship_change
+from .leaderboard import queue_review_change
+from .principals import invalidate_principal
+from .remember_tokens import invalidate_remember_token, invalidate_user_remember_tokens
+from .serializers import fields_serializer, USER_SEARCH_FIELDS
 from app.utils.security import hash_token, token_expiration
+from app.storage import StoredBlob, blob_sha_from_url
 from pathlib import Path
 
 # --- Users ---
@@ -40,6 +48,7 @@ def activate_user_by_email(db: Session, email: str) -> Optional[models.User]:
     user.updated_at = datetime.utcnow()
     db.add(user)
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
@@ -54,6 +63,7 @@ def activate_user(db: Session, user: models.User) -> Optional[models.User]:
     user.updated_at = datetime.utcnow()
     db.add(user)
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
@@ -92,11 +102,15 @@ def update_user(db: Session, user_id: int, user_in: Union[schemas.UserUpdate, Di
     allowed = {"name", "bio", "avatar_url"}
     for k, v in data.items():
         if k in allowed:
-            setattr(user, k, v)
+            if k == "avatar_url":
+                change_user_avatar(db, user, v)
+            else:
+                setattr(user, k, v)
 
     user.updated_at = datetime.utcnow()
     db.add(user)
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
@@ -106,12 +120,36 @@ def set_user_password(db: Session, user_id: int, hashed_password: str) -> bool:
     if not user:
         return False
     user.hashed_password = hashed_password
+    user.token_version = (user.token_version or 0) + 1  # derruba tokens emitidos com a senha antiga
     user.updated_at = datetime.utcnow()
     db.add(user)
+    # remember tokens também: senão /auth/refresh emitiria access tokens novos com o cookie antigo
+    delete_user_remember_tokens(db, user.id)
     db.commit()
+    invalidate_principal(user.id)
+    invalidate_user_remember_tokens(user.id)
     return True
 
 
+def bump_token_version(db: Session, user_id: int) -> None:
+    """Invalida todos os access tokens e remember tokens já emitidos para o usuário."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1},
+        synchronize_session=False,
+    )
+    delete_user_remember_tokens(db, user_id)
+    db.commit()
+    invalidate_principal(user_id)
+    invalidate_user_remember_tokens(user_id)
+
+
+def delete_user_remember_tokens(db: Session, user_id: int) -> None:
+    """Sem commit: entra na transação de quem chama."""
+    db.query(models.RememberToken).filter(models.RememberToken.user_id == user_id).delete(
+        synchronize_session=False
+    )
+
+
 # --- Games ---
 def create_game(db: Session, user_id: int, game_in) -> models.Game:
     g = models.Game(
@@ -136,8 +174,12 @@ def get_game(db: Session, game_id: int) -> Optional[models.Game]:
     return db.query(models.Game).filter(models.Game.id == game_id).first()
 
 
-def get_games_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 50) -> List[models.Game]:
-    return db.query(models.Game).filter(models.Game.user_id == user_id).offset(skip).limit(limit).all()
+def get_games_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 50,
+                      fields: Optional[Sequence[str]] = None) -> List[models.Game]:
+    q = db.query(models.Game).filter(models.Game.user_id == user_id)
+    if fields:
+        q = q.options(load_only(*[getattr(models.Game, f) for f in fields]))
+    return q.offset(skip).limit(limit).all()
 
 
 def delete_game(db: Session, game: models.Game) -> None:
@@ -171,6 +213,7 @@ def create_review(db: Session, user_id: int, game_id: int, review_in) -> Optiona
         updated_at=datetime.utcnow()
     )
     db.add(r)
+    apply_review_stats(db, None, review_contribution(r))
     db.commit()
     db.refresh(r)
     return r
@@ -181,17 +224,20 @@ def get_review(db: Session, review_id: int) -> Optional[models.Review]:
 
 
 def update_review(db: Session, review: models.Review, data: Dict[str, Any]) -> models.Review:
+    before = review_contribution(review)
     for k, v in data.items():
         if v is not None:
             setattr(review, k, v)
     review.updated_at = datetime.utcnow()
     db.add(review)
+    apply_review_stats(db, before, review_contribution(review))
     db.commit()
     db.refresh(review)
     return review
 
 
 def delete_review(db: Session, review: models.Review) -> None:
+    apply_review_stats(db, review_contribution(review), None)
     db.delete(review)
     db.commit()
 
@@ -205,19 +251,243 @@ def get_reviews_by_game(db: Session, game_id: int, public_only: bool = True, ski
     return total, items
 
 
-# --- avatar ---
-def set_user_avatar(db: Session, user_id: int, avatar_url: Optional[str]) -> Optional[models.User]:
+# --- Game stats (agregados de reviews públicas) ---
+RATING_BUCKETS = 11  # notas 0..10
+
+
+class ReviewContribution(NamedTuple):
+    game_id: int
+    rating: Optional[int]
+    created_at: Optional[datetime]
+
+
+def review_contribution(review: Optional[models.Review]) -> Optional[ReviewContribution]:
+    """
+    O que uma review soma em game_stats (None se não conta: inexistente ou privada).
+    Capture antes e depois de alterar a review e passe para apply_review_stats.
+    """
+    if review is None or review.is_public is False:
+        return None
+    return ReviewContribution(review.game_id, review.rating, review.created_at)
+
+
+def _lock_game_stats(db: Session, game_id: int) -> models.GameStats:
+    db.execute(
+        mysql_insert(models.GameStats)
+        .values(game_id=game_id, reviews_count=0, ratings_count=0, rating_sum=0,
+                rating_histogram=[0] * RATING_BUCKETS, version=0)
+        .on_duplicate_key_update(game_id=game_id)
+    )
+    return (
+        db.query(models.GameStats)
+        .filter(models.GameStats.game_id == game_id)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+
+
+def _bump_game_stats(db: Session, c: ReviewContribution, sign: int) -> None:
+    stats = _lock_game_stats(db, c.game_id)
+    stats.reviews_count = max(0, (stats.reviews_count or 0) + sign)
+    histogram = list(stats.rating_histogram or [0] * RATING_BUCKETS)
+    if c.rating is not None:
+        stats.ratings_count = max(0, (stats.ratings_count or 0) + sign)
+        stats.rating_sum = (stats.rating_sum or 0) + sign * c.rating
+        if 0 <= c.rating < RATING_BUCKETS:
+            histogram[c.rating] = max(0, histogram[c.rating] + sign)
+    stats.rating_histogram = histogram
+
+    if sign > 0:
+        at = c.created_at or datetime.utcnow()
+        if stats.last_review_at is None or at > stats.last_review_at:
+            stats.last_review_at = at
+    elif stats.reviews_count == 0:
+        stats.last_review_at = None
+
+    stats.version = (stats.version or 0) + 1
+    db.add(stats)
+
+
+def apply_review_stats(db: Session, before: Optional[ReviewContribution],
+                       after: Optional[ReviewContribution]) -> None:
+    """
+    Aplica em game_stats a diferença entre duas contribuições de uma review.
+    Não faz commit: roda na mesma transação da escrita da review.
+    """
+    if before == after:
+        return
+    if before is not None:
+        _bump_game_stats(db, before, -1)
+    if after is not None:
+        _bump_game_stats(db, after, +1)
+    queue_review_change(db, before, after)
+
+
+def discount_user_reviews_from_stats(db: Session, user_id: int) -> None:
+    """Remove dos agregados as reviews de um usuário prestes a ser apagado (cascade não passa pelo ORM)."""
+    reviews = db.query(models.Review).filter(models.Review.user_id == user_id).all()
+    for r in reviews:
+        apply_review_stats(db, review_contribution(r), None)
+
+
+def get_game_stats(db: Session, game_id: int) -> Optional[models.GameStats]:
+    return db.get(models.GameStats, game_id)
+
+
+def rebuild_game_stats(db: Session) -> int:
+    """Recalcula game_stats do zero a partir de reviews públicas. Retorna o nº de games."""
+    rows = (
+        db.query(
+            models.Review.game_id,
+            models.Review.rating,
+            func.count(models.Review.id),
+            func.max(models.Review.created_at),
+        )
+        .filter(models.Review.is_public == True)
+        .group_by(models.Review.game_id, models.Review.rating)
+        .all()
+    )
+
+    by_game: Dict[int, models.GameStats] = {}
+    for game_id, rating, count, last_at in rows:
+        stats = by_game.get(game_id)
+        if stats is None:
+            stats = by_game[game_id] = models.GameStats(
+                game_id=game_id, reviews_count=0, ratings_count=0, rating_sum=0,
+                rating_histogram=[0] * RATING_BUCKETS, version=0,
+            )
+        count = int(count or 0)
+        stats.reviews_count += count
+        if rating is not None:
+            stats.ratings_count += count
+            stats.rating_sum += int(rating) * count
+            if 0 <= rating < RATING_BUCKETS:
+                stats.rating_histogram[rating] += count
+        if last_at is not None and (stats.last_review_at is None or last_at > stats.last_review_at):
+            stats.last_review_at = last_at
+
+    db.query(models.GameStats).delete(synchronize_session=False)
+    db.add_all(by_game.values())
+    db.commit()
+    return len(by_game)
+
+
+# --- avatar / media blobs ---
+def retain_media_blob(db: Session, sha256: str, blob: Optional[StoredBlob] = None) -> None:
+    """+1 referência (cria a linha quando o blob acabou de ser gravado). Sem commit."""
+    if blob is not None:
+        db.execute(
+            mysql_insert(models.MediaBlob)
+            .values(sha256=blob.sha256, ext=blob.ext, content_type=blob.content_type,
+                    size=blob.size, ref_count=1)
+            .on_duplicate_key_update(ref_count=models.MediaBlob.ref_count + 1)
+        )
+        return
+    db.query(models.MediaBlob).filter(models.MediaBlob.sha256 == sha256).update(
+        {models.MediaBlob.ref_count: models.MediaBlob.ref_count + 1}, synchronize_session=False
+    )
+
+
+def release_media_blob(db: Session, sha256: str) -> None:
+    """
+    -1 referência. Sem commit. O arquivo não é apagado aqui: outro upload com os
+    mesmos bytes pode estar reaproveitando o blob nesse instante; blobs sem
+    referência ficam para a coleta de lixo.
+    """
+    db.query(models.MediaBlob).filter(
+        models.MediaBlob.sha256 == sha256, models.MediaBlob.ref_count > 0
+    ).update({models.MediaBlob.ref_count: models.MediaBlob.ref_count - 1}, synchronize_session=False)
+
+
+def delete_unreferenced_media_blob(db: Session, sha256: str) -> bool:
+    """
+    Apaga a linha do blob só se continua sem referências (ou nem existe) e faz
+    commit. False = alguém voltou a referenciar o blob: o arquivo deve ficar.
+    """
+    row = db.query(models.MediaBlob.ref_count).filter(models.MediaBlob.sha256 == sha256).first()
+    if row is None:
+        return True
+    deleted = db.query(models.MediaBlob).filter(
+        models.MediaBlob.sha256 == sha256, models.MediaBlob.ref_count == 0
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted == 1
+
+
+def list_unreferenced_media_blobs(db: Session, older_than: datetime, limit: int = 10000) -> List[Tuple[str, str, int]]:
+    """(sha256, ext, size) dos blobs com ref_count 0 sem mudança desde `older_than`."""
+    rows = (
+        db.query(models.MediaBlob.sha256, models.MediaBlob.ext, models.MediaBlob.size)
+        .filter(models.MediaBlob.ref_count == 0, models.MediaBlob.updated_at < older_than)
+        .order_by(models.MediaBlob.updated_at)
+        .limit(limit)
+        .all()
+    )
+    return [(sha, ext, size) for sha, ext, size in rows]
+
+
+def iter_avatar_urls(db: Session, batch_size: int = 5000) -> Iterator[str]:
+    """users.avatar_url em streaming (cursor no servidor), sem carregar a tabela."""
+    result = db.execute(
+        select(models.User.avatar_url)
+        .where(models.User.avatar_url.isnot(None))
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for (url,) in result:
+        yield url
+
+
+def _swap_avatar_refs(db: Session, old_url: Optional[str], new_url: Optional[str],
+                      blob: Optional[StoredBlob] = None) -> None:
+    if old_url == new_url:
+        return
+    new_sha = blob.sha256 if blob is not None else blob_sha_from_url(new_url)
+    if new_sha:
+        retain_media_blob(db, new_sha, blob)
+    old_sha = blob_sha_from_url(old_url)
+    if old_sha:
+        release_media_blob(db, old_sha)
+
+
+def change_user_avatar(db: Session, user: models.User, avatar_url: Optional[str],
+                       blob: Optional[StoredBlob] = None) -> None:
+    """Troca o avatar acertando o ref_count dos blobs. Sem commit: entra na transação de quem chama."""
+    if avatar_url != user.avatar_url:
+        _swap_avatar_refs(db, user.avatar_url, avatar_url, blob)
+        user.avatar_variants = None
+    user.avatar_url = avatar_url
+
+
+def set_user_avatar(db: Session, user_id: int, avatar_url: Optional[str],
+                    blob: Optional[StoredBlob] = None) -> Optional[models.User]:
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         return None
-    user.avatar_url = avatar_url
+    change_user_avatar(db, user, avatar_url, blob)
     user.updated_at = datetime.utcnow()
     db.add(user)
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
 
+def set_user_avatar_variants(db: Session, user_id: int, avatar_url: str, variants: Dict[str, str]) -> bool:
+    """Grava o mapa de variantes só se o usuário ainda estiver com o mesmo avatar."""
+    updated = db.query(models.User).filter(
+        models.User.id == user_id, models.User.avatar_url == avatar_url
+    ).update(
+        {models.User.avatar_variants: variants, models.User.updated_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.commit()
+    if updated:
+        # /users/me serve avatar_variants e usa updated_at no ETag
+        invalidate_principal(user_id)
+    return bool(updated)
+
+
 def get_user_avatar_url(db: Session, user_id: int) -> Optional[str]:
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
@@ -230,7 +500,7 @@ def create_remember_token(db: Session, user: models.User, raw_token: str, expire
                           user_agent: Optional[str] = None, ip: Optional[str] = None) -> models.RememberToken:
     token_hash = hash_token(raw_token)
     if expires_at is None:
-        expires_at = token_expiration(days=30)
+        expires_at = token_expiration(minutes=30 * 24 * 60)
     obj = models.RememberToken(
         user_id=user.id,
         token_hash=token_hash,
@@ -252,13 +522,41 @@ def get_remember_token_by_raw(db: Session, raw_token: str) -> Optional[models.Re
 
 def revoke_remember_token(db: Session, token_obj: models.RememberToken) -> None:
     if token_obj:
+        token_hash = token_obj.token_hash
         db.delete(token_obj)
         db.commit()
+        invalidate_remember_token(token_hash)
 
 
 def revoke_all_user_tokens(db: Session, user: models.User) -> None:
-    db.query(models.RememberToken).filter_by(user_id=user.id).delete()
-    db.commit()
+    # remember tokens e access tokens numa transação só (ver bump_token_version)
+    bump_token_version(db, user.id)
+
+
+def purge_expired_remember_tokens(db: Session, batch_size: int = 1000, now: Optional[datetime] = None) -> int:
+    """
+    Remove tokens expirados em lotes pequenos (um commit por lote) para não
+    segurar locks longos na tabela. Retorna o total removido.
+    """
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        ids = [
+            row.id for row in
+            db.query(models.RememberToken.id)
+            .filter(models.RememberToken.expires_at < now)
+            .order_by(models.RememberToken.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        db.query(models.RememberToken).filter(models.RememberToken.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
 
 
 # --- UserGames (sessions/pivô) ---
@@ -273,6 +571,7 @@ def create_user_game(db: Session, user_id: int, game_id: int, started_at: Option
         updated_at=datetime.utcnow()
     )
     db.add(ug)
+    queue_user_game_change(db, game_id)
     db.commit()
     db.refresh(ug)
     return ug
@@ -283,17 +582,20 @@ def get_user_game(db: Session, user_game_id: int) -> Optional[models.UserGame]:
 
 
 def update_user_game(db: Session, user_game: models.UserGame, data: Dict[str, Any]) -> models.UserGame:
+    queue_user_game_change(db, user_game.game_id)
     for k, v in data.items():
         if hasattr(user_game, k) and v is not None:
             setattr(user_game, k, v)
     user_game.updated_at = datetime.utcnow()
     db.add(user_game)
+    queue_user_game_change(db, user_game.game_id)
     db.commit()
     db.refresh(user_game)
     return user_game
 
 
 def delete_user_game(db: Session, user_game: models.UserGame) -> None:
+    queue_user_game_change(db, user_game.game_id)
     db.delete(user_game)
     db.commit()
 
@@ -310,34 +612,15 @@ def find_coplayers_for_user_game(db: Session, user_game_id: int) -> List[models.
     """
     Dado um user_game_id (uma sessão), retorna usuários que jogaram o MESMO game e cuja sessão
     se sobrepõe com a sessão de referência.
-    Condição de overlap considera NULL finished_at como 'aberto' (overlap).
+    Condição de overlap considera NULL em started_at/finished_at como 'aberto' (overlap).
+    As sessões sobrepostas vêm do índice por game (app.coplayers); só os usuários vão ao banco.
     """
-    ref = db.query(models.UserGame).filter(models.UserGame.id == user_game_id).first()
+    # db.get usa o identity map: a rota já carregou a sessão para checar o dono
+    ref = db.get(models.UserGame, user_game_id)
     if not ref:
         return []
 
-    q = db.query(models.UserGame).filter(
-        models.UserGame.game_id == ref.game_id,
-        models.UserGame.user_id != ref.user_id
-    )
-
-    overlap_cond = and_(
-        or_(
-            models.UserGame.finished_at == None,
-            ref.started_at == None,
-            models.UserGame.finished_at >= ref.started_at
-        ),
-        or_(
-            ref.finished_at == None,
-            models.UserGame.started_at == None,
-            models.UserGame.started_at <= ref.finished_at
-        )
-    )
-
-    q = q.filter(overlap_cond)
-
-    user_game_rows = q.all()
-    user_ids = {ug.user_id for ug in user_game_rows}
+    user_ids = coplayer_index.coplayer_ids(db, ref)
     if not user_ids:
         return []
 
@@ -350,56 +633,135 @@ def get_friendship_between(db: Session, user_id: int, other_id: int) -> Optional
     return db.query(models.Friendship).filter_by(user_id=user_id, friend_id=other_id).first()
 
 
-def create_friend_request(db: Session, user_id: int, friend_id: int, message: Optional[str] = None) -> Optional[models.Friendship]:
-    if user_id == friend_id:
-        return None
+def get_friendship_status(db: Session, user_id: int, other_id: int) -> Tuple[str, Optional[int]]:
+    """(status, friendship_id) visto por user_id; do índice em memória quando carregado."""
+    if friend_graph.loaded:
+        return friend_graph.status(user_id, other_id)
+    rows = db.query(
+        models.Friendship.id, models.Friendship.user_id, models.Friendship.status
+    ).filter(
+        or_(
+            and_(models.Friendship.user_id == user_id, models.Friendship.friend_id == other_id),
+            and_(models.Friendship.user_id == other_id, models.Friendship.friend_id == user_id),
+        )
+    ).all()
+    edges = {row.user_id: Edge(row.status, row.id) for row in rows}
+    return friendship_status(edges.get(user_id), edges.get(other_id))
+
 
-    blocked = db.query(models.Friendship).filter(
+def get_friendship_statuses(db: Session, user_id: int, other_ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[int]]]:
+    """
+    get_friendship_status para vários usuários de uma vez: do índice em memória
+    ou, antes dele carregar, numa única query com IN nos dois sentidos.
+    """
+    ids = [i for i in dict.fromkeys(other_ids) if i != user_id]
+    out: Dict[int, Tuple[str, Optional[int]]] = {}
+    if user_id in other_ids:
+        out[user_id] = ("self", None)
+    if not ids:
+        return out
+    if friend_graph.loaded:
+        out.update((i, friend_graph.status(user_id, i)) for i in ids)
+        return out
+
+    rows = db.query(
+        models.Friendship.id, models.Friendship.user_id, models.Friendship.friend_id, models.Friendship.status
+    ).filter(
         or_(
-            and_(models.Friendship.user_id == user_id, models.Friendship.friend_id == friend_id, models.Friendship.status == "blocked"),
-            and_(models.Friendship.user_id == friend_id, models.Friendship.friend_id == user_id, models.Friendship.status == "blocked"),
+            and_(models.Friendship.user_id == user_id, models.Friendship.friend_id.in_(ids)),
+            and_(models.Friendship.friend_id == user_id, models.Friendship.user_id.in_(ids)),
         )
-    ).first()
-    if blocked:
-        return None
+    ).all()
+    sent: Dict[int, Edge] = {}
+    received: Dict[int, Edge] = {}
+    for row in rows:
+        if row.user_id == user_id:
+            sent[row.friend_id] = Edge(row.status, row.id)
+        else:
+            received[row.user_id] = Edge(row.status, row.id)
+    out.update((i, friendship_status(sent.get(i), received.get(i))) for i in ids)
+    return out
+
+
+def _lock_user_pair(db: Session, user_id: int, other_id: int) -> bool:
+    """
+    SELECT ... FOR UPDATE nas duas linhas de users, sempre em ordem de id (sem
+    deadlock entre A->B e B->A). Serializa as escritas de amizade do par até o
+    commit. False se algum dos usuários não existe.
+    """
+    rows = (
+        db.query(models.User.id)
+        .filter(models.User.id.in_([user_id, other_id]))
+        .order_by(models.User.id)
+        .with_for_update()
+        .all()
+    )
+    return len(rows) == 2
 
-    existing = db.query(models.Friendship).filter_by(user_id=user_id, friend_id=friend_id).first()
-    if existing:
+
+def _friendship_edges(db: Session, user_id: int, other_id: int) -> Dict[int, models.Friendship]:
+    """As duas arestas do par numa consulta, indexadas pelo user_id de origem."""
+    rows = db.query(models.Friendship).filter(
+        or_(
+            and_(models.Friendship.user_id == user_id, models.Friendship.friend_id == other_id),
+            and_(models.Friendship.user_id == other_id, models.Friendship.friend_id == user_id),
+        )
+    ).all()
+    return {f.user_id: f for f in rows}
+
+
+def _upsert_accepted(db: Session, pairs: Sequence[Tuple[int, int]], message: Optional[str] = None) -> None:
+    """Grava as arestas como accepted num único INSERT ... ON DUPLICATE KEY UPDATE."""
+    now = datetime.utcnow()
+    stmt = mysql_insert(models.Friendship).values([
+        {"user_id": u, "friend_id": f, "status": "accepted", "message": message,
+         "created_at": now, "accepted_at": now, "updated_at": now}
+        for u, f in pairs
+    ])
+    db.execute(stmt.on_duplicate_key_update(
+        status=stmt.inserted.status,
+        accepted_at=stmt.inserted.accepted_at,
+        updated_at=stmt.inserted.updated_at,
+    ))
+
+
+def create_friend_request(db: Session, user_id: int, friend_id: int, message: Optional[str] = None) -> Optional[models.Friendship]:
+    if user_id == friend_id:
+        return None
+    # bloqueio conhecido pelo índice: recusa sem ir ao banco
+    if friend_graph.loaded and friend_graph.is_blocked(user_id, friend_id):
         return None
 
-    reverse = db.query(models.Friendship).filter_by(user_id=friend_id, friend_id=user_id).first()
-    if reverse:
-        if reverse.status == "pending":
-            reverse.status = "accepted"
-            reverse.accepted_at = datetime.utcnow()
-            reverse.updated_at = datetime.utcnow()
-            f = models.Friendship(
-                user_id=user_id,
-                friend_id=friend_id,
-                status="accepted",
-                message=message,
-                created_at=datetime.utcnow(),
-                accepted_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
-            db.add(f)
-            db.add(reverse)
-            db.commit()
-            db.refresh(f)
-            return f
+    # pedidos cruzados simultâneos (A->B e B->A) esperam um pelo outro aqui
+    if not _lock_user_pair(db, user_id, friend_id):
+        db.rollback()
+        return None
+    edges = _friendship_edges(db, user_id, friend_id)
+    existing, reverse = edges.get(user_id), edges.get(friend_id)
+    if existing or (reverse and reverse.status != "pending"):
+        db.rollback()
         return None
 
-    f = models.Friendship(
-        user_id=user_id,
-        friend_id=friend_id,
-        status="pending",
-        message=message,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
-    )
-    db.add(f)
+    if reverse:
+        # o outro já tinha pedido: vira amizade nos dois sentidos
+        _upsert_accepted(db, [(friend_id, user_id), (user_id, friend_id)], message=message)
+        db.expire(reverse)
+        edges = _friendship_edges(db, user_id, friend_id)
+        f = edges[user_id]
+        queue_friendship_change(db, edges[friend_id])
+    else:
+        f = models.Friendship(
+            user_id=user_id,
+            friend_id=friend_id,
+            status="pending",
+            message=message,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        db.add(f)
+        db.flush()
+    queue_friendship_change(db, f)
     db.commit()
-    db.refresh(f)
     return f
 
 
@@ -410,27 +772,26 @@ def get_friend_request(db: Session, request_id: int) -> Optional[models.Friendsh
 def accept_friend_request(db: Session, request: models.Friendship) -> Optional[models.Friendship]:
     if not request or request.status != "pending":
         return None
-    request.status = "accepted"
-    request.accepted_at = datetime.utcnow()
-    request.updated_at = datetime.utcnow()
-    db.add(request)
-    exists_inverse = db.query(models.Friendship).filter(
-        models.Friendship.user_id == request.friend_id,
-        models.Friendship.friend_id == request.user_id
-    ).first()
-    if not exists_inverse:
-        inverse = models.Friendship(
-            user_id=request.friend_id,
-            friend_id=request.user_id,
-            status="accepted",
-            created_at=datetime.utcnow(),
-            accepted_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
-        db.add(inverse)
+    user_id, friend_id = request.user_id, request.friend_id
+    if not _lock_user_pair(db, user_id, friend_id):
+        db.rollback()
+        return None
+    # relê com o par travado: o pedido pode ter sido cancelado ou aceito em paralelo
+    edges = _friendship_edges(db, user_id, friend_id)
+    current, inverse = edges.get(user_id), edges.get(friend_id)
+    if current is None or current.status != "pending" or (inverse and inverse.status == "blocked"):
+        db.rollback()
+        return None
+
+    _upsert_accepted(db, [(user_id, friend_id), (friend_id, user_id)])
+    db.expire(current)
+    if inverse is not None:
+        db.expire(inverse)
+    edges = _friendship_edges(db, user_id, friend_id)
+    queue_friendship_change(db, edges[user_id])
+    queue_friendship_change(db, edges[friend_id])
     db.commit()
-    db.refresh(request)
-    return request
+    return edges[user_id]
 
 
 def reject_friend_request(db: Session, request: models.Friendship) -> Optional[models.Friendship]:
@@ -439,13 +800,18 @@ def reject_friend_request(db: Session, request: models.Friendship) -> Optional[m
     request.status = "rejected"
     request.updated_at = datetime.utcnow()
     db.add(request)
+    queue_friendship_change(db, request)
     db.commit()
     db.refresh(request)
     return request
 
 
-def block_user(db: Session, user_id: int, block_id: int) -> models.Friendship:
-    existing = db.query(models.Friendship).filter_by(user_id=user_id, friend_id=block_id).first()
+def block_user(db: Session, user_id: int, block_id: int) -> Optional[models.Friendship]:
+    if not _lock_user_pair(db, user_id, block_id):
+        db.rollback()
+        return None
+    edges = _friendship_edges(db, user_id, block_id)
+    existing, inverse = edges.get(user_id), edges.get(block_id)
     if existing:
         existing.status = "blocked"
         existing.updated_at = datetime.utcnow()
@@ -460,10 +826,12 @@ def block_user(db: Session, user_id: int, block_id: int) -> models.Friendship:
         )
         db.add(existing)
 
-    inverse = db.query(models.Friendship).filter_by(user_id=block_id, friend_id=user_id).first()
     if inverse and inverse.status != "blocked":
         db.delete(inverse)
+        queue_friendship_change(db, inverse, deleted=True)
 
+    db.flush()
+    queue_friendship_change(db, existing)
     db.commit()
     db.refresh(existing)
     return existing
@@ -474,6 +842,7 @@ def cancel_friend_request(db: Session, request_id: int, user_id: int) -> bool:
     if not f:
         return False
     db.delete(f)
+    queue_friendship_change(db, f, deleted=True)
     db.commit()
     return True
 
@@ -485,8 +854,10 @@ def remove_friend(db: Session, user_id: int, friend_id: int) -> bool:
         return False
     if f1:
         db.delete(f1)
+        queue_friendship_change(db, f1, deleted=True)
     if f2:
         db.delete(f2)
+        queue_friendship_change(db, f2, deleted=True)
     db.commit()
     return True
 
@@ -502,6 +873,12 @@ def get_sent_friend_requests(db: Session, user_id: int) -> List[models.Friendshi
 
 
 def get_friends_for_user(db: Session, user_id: int) -> List[models.User]:
+    if friend_graph.loaded:
+        friend_ids = friend_graph.friend_ids(user_id)
+        if not friend_ids:
+            return []
+        return db.query(models.User).filter(models.User.id.in_(list(friend_ids))).all()
+
     sent_ids = {
         f.friend_id
         for f in db.query(models.Friendship.friend_id)
@@ -519,57 +896,82 @@ def get_friends_for_user(db: Session, user_id: int) -> List[models.User]:
         return []
     return db.query(models.User).filter(models.User.id.in_(list(friend_ids))).all()
 
-def search_users(db: Session, q: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+# --- Sugestões de amizade ---
+def replace_friend_suggestions(db: Session, rows: Sequence[dict], batch_size: int = 5000) -> int:
+    """
+    Troca todas as sugestões pelas recém-calculadas numa transação só: quem lê
+    continua vendo o conjunto anterior até o commit.
+    """
+    table = models.FriendSuggestion.__table__
+    db.execute(table.delete())
+    for start in range(0, len(rows), batch_size):
+        db.execute(table.insert(), list(rows[start:start + batch_size]))
+    db.commit()
+    return len(rows)
+
+
+def get_friend_suggestions(db: Session, user_id: int, limit: int = 20) -> List[models.FriendSuggestion]:
+    """
+    Leitura pelo índice (user_id, score). Descarta quem virou amigo, tem pedido
+    pendente ou bloqueio desde o último cálculo (índice em memória do grafo).
+    """
+    q = (
+        db.query(models.FriendSuggestion)
+        .join(models.User, models.User.id == models.FriendSuggestion.suggested_id)
+        .options(joinedload(models.FriendSuggestion.suggested))
+        .filter(models.FriendSuggestion.user_id == user_id, models.User.is_active == True)
+        .order_by(models.FriendSuggestion.score.desc(), models.FriendSuggestion.suggested_id.asc())
+    )
+    if not friend_graph.loaded:
+        return q.limit(limit).all()
+
+    out: List[models.FriendSuggestion] = []
+    for s in q.limit(limit * 2 + 10).all():
+        if friend_graph.status(user_id, s.suggested_id)[0] == "none" and not friend_graph.is_blocked(user_id, s.suggested_id):
+            out.append(s)
+            if len(out) >= limit:
+                break
+    return out
+
+
+def search_users(db: Session, q: str, page: int = 1, page_size: int = 20,
+                 exclude_user_id: Optional[int] = None,
+                 fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
     if not q or not str(q).strip():
         return {"total": 0, "items": []}
 
     term = f"%{q.strip().lower()}%"
 
-    name_or_email = or_(
-        func.lower(models.User.name).like(term),
-        func.lower(models.User.email).like(term),
-    )
-
-    total_q = db.query(func.count(models.User.id)).filter(
+    filters = [
         models.User.is_active == True,
-        name_or_email,
-    )
-    total = int(total_q.scalar() or 0)
-
+        or_(
+            func.lower(models.User.name).like(term),
+            func.lower(models.User.email).like(term),
+        ),
+    ]
+    if exclude_user_id is not None:
+        filters.append(models.User.id != exclude_user_id)
+
+    total = int(db.query(func.count(models.User.id)).filter(*filters).scalar() or 0)
+
+    selected = tuple(fields or USER_SEARCH_FIELDS)
+    columns = [
+        func.count(models.Game.id).label(f) if f == "games_count" else getattr(models.User, f).label(f)
+        for f in selected
+    ]
+    items_q = db.query(*columns).filter(*filters)
+    if "games_count" in selected:
+        # o join com games só é feito quando a contagem foi pedida
+        items_q = items_q.outerjoin(models.Game, models.Game.user_id == models.User.id).group_by(models.User.id)
     items_q = (
-        db.query(
-            models.User.id.label("id"),
-            models.User.email.label("email"),
-            models.User.name.label("name"),
-            models.User.bio.label("bio"),
-            models.User.avatar_url.label("avatar_url"),
-            models.User.is_active.label("is_active"),
-            models.User.created_at.label("created_at"),
-            func.count(models.Game.id).label("games_count"),
-        )
-        .outerjoin(models.Game, models.Game.user_id == models.User.id)
-        .filter(models.User.is_active == True, name_or_email)
-        .group_by(models.User.id)
+        items_q
         .order_by(models.User.name.asc())
         .offset(max(0, (page - 1)) * page_size)
         .limit(page_size)
     )
 
-    rows = items_q.all()
-
-    items = []
-    for r in rows:
-        items.append({
-            "id": r.id,
-            "email": r.email,
-            "name": r.name,
-            "bio": r.bio,
-            "avatar_url": r.avatar_url,
-            "is_active": bool(r.is_active),
-            "created_at": r.created_at.isoformat() if r.created_at is not None else None,
-            "games_count": int(r.games_count or 0),
-        })
-
+    serialize = fields_serializer(selected)
+    items = [serialize(r) for r in items_q.all()]
     return {"total": total, "items": items}
 
 
@@ -589,3 +991,90 @@ def get_friend_requests_for_user(db: Session, user_id: int, only_pending: bool =
         q = q.limit(int(limit))
 
     return q.all()
+
+
+# --- Email outbox ---
+def enqueue_email(db: Session, recipient: str, subject: str, body: str, subtype: str = "plain",
+                  kind: str = "generic") -> models.EmailOutbox:
+    """Adiciona o e-mail à outbox na transação corrente (quem chama faz o commit)."""
+    row = models.EmailOutbox(
+        kind=kind,
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        subtype=subtype,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(row)
+    return row
+
+
+class OutboxMessage(NamedTuple):
+    id: int
+    recipient: str
+    subject: str
+    body: str
+    subtype: str
+
+
+def claim_outbox_batch(db: Session, limit: int, lease_seconds: int) -> List[OutboxMessage]:
+    """
+    Reserva até `limit` e-mails prontos para envio. SELECT ... FOR UPDATE SKIP LOCKED
+    deixa vários dispatchers (workers/processos) rodarem sem pegar a mesma linha;
+    linhas em 'sending' com lease vencido (dispatcher morreu no meio) voltam a valer.
+    """
+    now = datetime.utcnow()
+    rows = (
+        db.query(models.EmailOutbox)
+        .filter(or_(
+            and_(models.EmailOutbox.status == "pending", models.EmailOutbox.next_attempt_at <= now),
+            and_(models.EmailOutbox.status == "sending", models.EmailOutbox.locked_until < now),
+        ))
+        .order_by(models.EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    claimed = []
+    for row in rows:
+        row.status = "sending"
+        row.attempts = (row.attempts or 0) + 1
+        row.locked_until = now + timedelta(seconds=lease_seconds)
+        claimed.append(OutboxMessage(row.id, row.recipient, row.subject, row.body, row.subtype))
+    db.commit()
+    return claimed
+
+
+def finish_outbox_batch(db: Session, results: Dict[int, Optional[str]], max_attempts: int,
+                        backoff_base_seconds: int, backoff_max_seconds: int) -> Dict[str, int]:
+    """
+    Grava o resultado de um lote: {outbox_id: None (enviado) | erro}. Falhas voltam a
+    'pending' com backoff exponencial; após max_attempts viram 'dead'.
+    """
+    now = datetime.utcnow()
+    counts = {"sent": 0, "retry": 0, "dead": 0}
+    if not results:
+        return counts
+    rows = db.query(models.EmailOutbox).filter(models.EmailOutbox.id.in_(list(results))).all()
+    for row in rows:
+        error = results[row.id]
+        row.locked_until = None
+        if error is None:
+            row.status = "sent"
+            row.sent_at = now
+            row.last_error = None
+            counts["sent"] += 1
+        elif row.attempts >= max_attempts:
+            row.status = "dead"
+            row.last_error = error
+            counts["dead"] += 1
+        else:
+            delay = min(backoff_max_seconds, backoff_base_seconds * 2 ** (row.attempts - 1))
+            row.status = "pending"
+            row.next_attempt_at = now + timedelta(seconds=delay)
+            row.last_error = error
+            counts["retry"] += 1
+    db.commit()
+    return counts
@@ -0,0 +1,153 @@
+"""
+Links de confirmação guardados para ambientes sem e-mail (DISABLE_EMAILS=True).
+
+- O store é um SQLite local (WAL) em vez de um dict por processo: todos os
+  workers do uvicorn enxergam os mesmos links, e o tamanho é limitado por
+  idade (DEV_CONFIRMATIONS_TTL_SECONDS) e quantidade (DEV_CONFIRMATIONS_MAX).
+- O log dev/confirmation_links.log é escrito por um QueueListener numa thread
+  própria; quem registra o link só enfileira, sem I/O de arquivo no event loop.
+"""
+import os
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+DEV_DIR = os.getenv("DEV_DIR", "dev")
+DEV_CONFIRMATIONS_DB = os.getenv("DEV_CONFIRMATIONS_DB", os.path.join(DEV_DIR, "confirmations.sqlite3"))
+DEV_CONFIRMATIONS_LOG = os.getenv("DEV_CONFIRMATIONS_LOG", os.path.join(DEV_DIR, "confirmation_links.log"))
+DEV_CONFIRMATIONS_MAX = int(os.getenv("DEV_CONFIRMATIONS_MAX", "1000"))
+DEV_CONFIRMATIONS_TTL = int(os.getenv("DEV_CONFIRMATIONS_TTL_SECONDS", str(24 * 60 * 60)))
+
+logger = logging.getLogger("app.dev_confirmations")
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DEV_CONFIRMATIONS_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(DEV_CONFIRMATIONS_DB, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS confirmations ("
+                " email TEXT PRIMARY KEY, token TEXT NOT NULL, url TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_confirmations_created_at ON confirmations (created_at)")
+            _schema_ready = True
+    return conn
+
+
+def put(email: str, token: str, url: str) -> None:
+    now = time.time()
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO confirmations (email, token, url, created_at) VALUES (?, ?, ?, ?)",
+            (email, token, url, now),
+        )
+        conn.execute("DELETE FROM confirmations WHERE created_at < ?", (now - DEV_CONFIRMATIONS_TTL,))
+        conn.execute(
+            "DELETE FROM confirmations WHERE email IN ("
+            " SELECT email FROM confirmations ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (DEV_CONFIRMATIONS_MAX,),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _row_to_dict(row) -> dict:
+    return {"token": row[1], "url": row[2], "created_at": row[3]}
+
+
+def get(email: str) -> Optional[dict]:
+    row = _connect().execute(
+        "SELECT email, token, url, created_at FROM confirmations WHERE email = ? AND created_at >= ?",
+        (email, time.time() - DEV_CONFIRMATIONS_TTL),
+    ).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def all_confirmations() -> Dict[str, dict]:
+    rows = _connect().execute(
+        "SELECT email, token, url, created_at FROM confirmations WHERE created_at >= ? ORDER BY created_at DESC",
+        (time.time() - DEV_CONFIRMATIONS_TTL,),
+    ).fetchall()
+    return {row[0]: _row_to_dict(row) for row in rows}
+
+
+def pop(email: str) -> Optional[dict]:
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT email, token, url, created_at FROM confirmations WHERE email = ?", (email,)
+        ).fetchone()
+        if row:
+            conn.execute("DELETE FROM confirmations WHERE email = ?", (email,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return _row_to_dict(row) if row else None
+
+
+# --- Log de links (escrita assíncrona) ---
+_link_logger = logging.getLogger("app.dev_confirmations.links")
+_link_logger.propagate = False
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is not None:
+            return
+        os.makedirs(os.path.dirname(DEV_CONFIRMATIONS_LOG) or ".", exist_ok=True)
+        file_handler = logging.FileHandler(DEV_CONFIRMATIONS_LOG, encoding="utf-8", delay=True)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        _link_logger.addHandler(QueueHandler(records))
+        _link_logger.setLevel(logging.INFO)
+        _listener = QueueListener(records, file_handler)
+        _listener.start()
+
+
+def log_link(email: str, url: str) -> None:
+    """Enfileira a linha do log; a gravação em disco acontece na thread do listener."""
+    try:
+        _ensure_listener()
+        _link_logger.info("%s %s", email, url)
+    except Exception:
+        logger.exception("Não consegui registrar o link em %s", DEV_CONFIRMATIONS_LOG)
+
+
+def shutdown() -> None:
+    """Esvazia a fila do log e fecha o arquivo (chamado no shutdown do app)."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        for handler in list(_link_logger.handlers):
+            _link_logger.removeHandler(handler)
+        _listener = None
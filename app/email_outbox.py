@@ -0,0 +1,78 @@
+"""
+Dispatcher da outbox de e-mails (tabela email_outbox).
+
+As rotas só gravam a linha na mesma transação do evento (ver
+mail.queue_confirmation_email); o envio acontece aqui, fora do request:
+reserva um lote com SELECT ... FOR UPDATE SKIP LOCKED, envia pelas conexões
+SMTP do mail worker e grava o resultado. Falhas voltam com backoff
+exponencial até OUTBOX_MAX_ATTEMPTS; depois disso a linha fica 'dead'.
+"""
+import os
+import asyncio
+import logging
+
+from fastapi_mail import MessageType
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+from .database import SessionLocal
+from .mail import build_message, mail_worker
+
+logger = logging.getLogger("app.email_outbox")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = int(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+
+
+def _claim(limit: int):
+    db = SessionLocal()
+    try:
+        return crud.claim_outbox_batch(db, limit=limit, lease_seconds=OUTBOX_LEASE_SECONDS)
+    finally:
+        db.close()
+
+
+def _finish(results):
+    db = SessionLocal()
+    try:
+        return crud.finish_outbox_batch(
+            db,
+            results,
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            backoff_base_seconds=OUTBOX_BACKOFF_BASE_SECONDS,
+            backoff_max_seconds=OUTBOX_BACKOFF_MAX_SECONDS,
+        )
+    finally:
+        db.close()
+
+
+async def dispatch_once(limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Envia um lote da outbox. Retorna quantas linhas foram reservadas."""
+    claimed = await run_in_threadpool(_claim, limit)
+    if not claimed:
+        return 0
+
+    messages = [build_message(m.subject, [m.recipient], m.body, MessageType(m.subtype)) for m in claimed]
+    errors = await mail_worker.send_many(messages)
+    counts = await run_in_threadpool(_finish, {m.id: err for m, err in zip(claimed, errors)})
+    logger.info("Outbox: %d enviados, %d para nova tentativa, %d descartados",
+                counts["sent"], counts["retry"], counts["dead"])
+    return len(claimed)
+
+
+async def run_dispatcher() -> None:
+    """Loop do dispatcher: lote cheio emenda no próximo; caso contrário espera o poll."""
+    while True:
+        try:
+            claimed = await dispatch_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Dispatcher da outbox falhou")
+            claimed = 0
+        if claimed < OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(OUTBOX_POLL_SECONDS)
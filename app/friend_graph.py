@@ -0,0 +1,217 @@
+"""
+Índice do grafo de amizades em memória, por worker.
+
+Guarda todas as arestas de friendships (user_id -> friend_id, com status e id
+da linha) em dicionários de adjacência nos dois sentidos, mais o conjunto de
+amigos aceitos de cada usuário. Lista de amigos, status entre dois usuários e
+checagem de bloqueio saem daqui sem consulta; só a hidratação final das linhas
+de users vai ao banco (uma query com IN).
+
+Atualização:
+- refresh(): recarga completa (uma query só nas colunas id/user_id/friend_id/
+  status). Roda no startup e a cada FRIEND_GRAPH_REFRESH_SECONDS (ver app.main),
+  o que limita a defasagem em relação a escritas feitas por outros workers.
+- Escritas deste worker entram na hora: o crud registra a mudança na sessão
+  (queue_friendship_change) e ela é aplicada no after_commit, como no leaderboard.
+"""
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger("app.friend_graph")
+
+REFRESH_SECONDS = int(os.getenv("FRIEND_GRAPH_REFRESH_SECONDS", "30"))
+
+_EVENTS_KEY = "friend_graph_events"
+
+
+class Edge(NamedTuple):
+    status: str
+    friendship_id: int
+
+
+def friendship_status(sent: Optional[Edge], received: Optional[Edge]) -> Tuple[str, Optional[int]]:
+    """
+    Status visto por quem pergunta, a partir das arestas nos dois sentidos.
+    Se o outro usuário bloqueou quem pergunta, o bloqueio não é revelado ("none").
+    """
+    if sent is not None:
+        if sent.status == "blocked":
+            return "blocked", sent.friendship_id
+        if sent.status == "accepted":
+            return "accepted", sent.friendship_id
+        if sent.status == "pending":
+            return "pending_sent", sent.friendship_id
+    if received is not None:
+        if received.status == "accepted":
+            return "accepted", received.friendship_id
+        if received.status == "pending":
+            return "pending_received", received.friendship_id
+    return "none", None
+
+
+class FriendGraph:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._out: Dict[int, Dict[int, Edge]] = {}
+        self._in: Dict[int, Dict[int, Edge]] = {}
+        self._friends: Dict[int, Set[int]] = {}
+        # mudanças aplicadas enquanto uma recarga está em andamento (reaplicadas no fim)
+        self._replay: Optional[List[Tuple[int, int, Optional[Edge]]]] = None
+        self.refreshed_at: Optional[datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    def refresh(self, db: Optional[Session] = None) -> None:
+        own_session = db is None
+        db = db or SessionLocal()
+        with self._lock:
+            self._replay = []
+        try:
+            rows = db.query(
+                models.Friendship.id,
+                models.Friendship.user_id,
+                models.Friendship.friend_id,
+                models.Friendship.status,
+            ).all()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+        out: Dict[int, Dict[int, Edge]] = {}
+        inc: Dict[int, Dict[int, Edge]] = {}
+        friends: Dict[int, Set[int]] = {}
+        for fid, user_id, friend_id, status in rows:
+            edge = Edge(status, fid)
+            out.setdefault(user_id, {})[friend_id] = edge
+            inc.setdefault(friend_id, {})[user_id] = edge
+            if status == "accepted":
+                friends.setdefault(user_id, set()).add(friend_id)
+                friends.setdefault(friend_id, set()).add(user_id)
+
+        with self._lock:
+            replay, self._replay = self._replay or [], None
+            self._out, self._in, self._friends = out, inc, friends
+            for user_id, friend_id, edge in replay:
+                self._set_edge(user_id, friend_id, edge)
+            self.refreshed_at = datetime.utcnow()
+
+    # --- escrita (chamar com o lock) ---
+    def _set_edge(self, user_id: int, friend_id: int, edge: Optional[Edge]) -> None:
+        if edge is None:
+            self._out.get(user_id, {}).pop(friend_id, None)
+            self._in.get(friend_id, {}).pop(user_id, None)
+        else:
+            self._out.setdefault(user_id, {})[friend_id] = edge
+            self._in.setdefault(friend_id, {})[user_id] = edge
+
+        accepted = any(
+            e is not None and e.status == "accepted"
+            for e in (self._out.get(user_id, {}).get(friend_id), self._out.get(friend_id, {}).get(user_id))
+        )
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            if accepted:
+                self._friends.setdefault(a, set()).add(b)
+            else:
+                self._friends.get(a, set()).discard(b)
+
+    def apply_change(self, user_id: int, friend_id: int, edge: Optional[Edge]) -> None:
+        with self._lock:
+            self._set_edge(user_id, friend_id, edge)
+            if self._replay is not None:
+                self._replay.append((user_id, friend_id, edge))
+
+    def remove_user(self, user_id: int) -> None:
+        with self._lock:
+            for friend_id in list(self._out.get(user_id, {})):
+                self._set_edge(user_id, friend_id, None)
+                if self._replay is not None:
+                    self._replay.append((user_id, friend_id, None))
+            for other_id in list(self._in.get(user_id, {})):
+                self._set_edge(other_id, user_id, None)
+                if self._replay is not None:
+                    self._replay.append((other_id, user_id, None))
+            self._out.pop(user_id, None)
+            self._in.pop(user_id, None)
+            self._friends.pop(user_id, None)
+
+    # --- leitura ---
+    def edge(self, user_id: int, friend_id: int) -> Optional[Edge]:
+        with self._lock:
+            return self._out.get(user_id, {}).get(friend_id)
+
+    def edges_between(self, user_id: int, other_id: int) -> Tuple[Optional[Edge], Optional[Edge]]:
+        """(aresta user -> other, aresta other -> user)"""
+        with self._lock:
+            return self._out.get(user_id, {}).get(other_id), self._out.get(other_id, {}).get(user_id)
+
+    def friend_ids(self, user_id: int) -> Set[int]:
+        with self._lock:
+            return set(self._friends.get(user_id, ()))
+
+    def is_blocked(self, user_id: int, other_id: int) -> bool:
+        """Algum dos dois bloqueou o outro."""
+        sent, received = self.edges_between(user_id, other_id)
+        return (sent is not None and sent.status == "blocked") or (
+            received is not None and received.status == "blocked"
+        )
+
+    def status(self, user_id: int, other_id: int) -> Tuple[str, Optional[int]]:
+        return friendship_status(*self.edges_between(user_id, other_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+                "users": sum(1 for edges in self._out.values() if edges),
+                "edges": sum(len(v) for v in self._out.values()),
+            }
+
+
+friend_graph = FriendGraph()
+
+
+def queue_friendship_change(db: Session, friendship: models.Friendship, deleted: bool = False) -> None:
+    """
+    Guarda a aresta na sessão; só entra no índice quando a transação commitar.
+    Chamar depois do flush (o id da linha nova já precisa existir).
+    """
+    edge = None if deleted else Edge(friendship.status, friendship.id)
+    db.info.setdefault(_EVENTS_KEY, []).append((friendship.user_id, friendship.friend_id, edge))
+
+
+def queue_user_removed(db: Session, user_id: int) -> None:
+    """As amizades somem junto com o usuário (ON DELETE CASCADE)."""
+    db.info.setdefault(_EVENTS_KEY, []).append((user_id, None, None))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_committed_changes(session: Session) -> None:
+    for user_id, friend_id, edge in session.info.pop(_EVENTS_KEY, ()):
+        try:
+            if friend_id is None:
+                friend_graph.remove_user(user_id)
+            else:
+                friend_graph.apply_change(user_id, friend_id, edge)
+        except Exception:
+            logger.exception("Falha ao aplicar mudança de amizade no índice")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_rolled_back_changes(session: Session) -> None:
+    session.info.pop(_EVENTS_KEY, None)
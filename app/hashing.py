@@ -0,0 +1,121 @@
+"""
+Hash/verificação de senhas (bcrypt) fora do threadpool das rotas.
+
+O bcrypt é CPU-bound e propositalmente lento; rodando inline ele ocupa as
+threads do anyio e trava as demais rotas síncronas do worker. Aqui ele vai
+para um ProcessPoolExecutor dedicado e limitado. Quando já há
+PASSWORD_HASH_MAX_PENDING operações em andamento/na fila, a rota responde
+503 com Retry-After em vez de empilhar.
+"""
+import os
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "2"))
+# "process" (padrão) ou "thread" (ambientes onde fork/spawn não é desejado)
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process").lower()
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# --- Versões síncronas (também são o que roda dentro do pool) ---
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    except Exception:
+        return False
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+# --- Pool ---
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "pending": 0,
+    "max_pending_seen": 0,
+    "completed": 0,
+    "rejected": 0,
+    "total_seconds": 0.0,
+}
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if PASSWORD_HASH_EXECUTOR == "thread":
+                    _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                   thread_name_prefix="password-hash")
+                else:
+                    # spawn: o worker do uvicorn já tem threads, fork herdaria locks no meio do uso
+                    _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado, tente novamente em instantes",
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+    )
+
+
+async def _submit(fn: Callable, *args):
+    with _metrics_lock:
+        if _metrics["pending"] >= PASSWORD_HASH_MAX_PENDING:
+            _metrics["rejected"] += 1
+            raise _overloaded()
+        _metrics["pending"] += 1
+        _metrics["max_pending_seen"] = max(_metrics["max_pending_seen"], _metrics["pending"])
+
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _metrics_lock:
+            _metrics["pending"] -= 1
+            _metrics["completed"] += 1
+            _metrics["total_seconds"] += time.perf_counter() - started
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _submit(verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    return await _submit(get_password_hash, password)
+
+
+def hashing_metrics() -> dict:
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    completed = snapshot["completed"]
+    snapshot["avg_seconds"] = snapshot.pop("total_seconds") / completed if completed else 0.0
+    snapshot["workers"] = PASSWORD_HASH_WORKERS
+    snapshot["max_pending"] = PASSWORD_HASH_MAX_PENDING
+    snapshot["executor"] = PASSWORD_HASH_EXECUTOR
+    return snapshot
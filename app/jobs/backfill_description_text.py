@@ -0,0 +1,53 @@
+"""
+Preenche games.description_text (descrição sem HTML) para linhas antigas.
+
+Percorre a tabela em lotes por id e não altera updated_at.
+Uso: python -m app.jobs.backfill_description_text [tamanho_do_lote]
+"""
+import sys
+
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.models import Game
+from app.utils.text import strip_html
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def backfill(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    db = SessionLocal()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            rows = (
+                db.query(Game.id, Game.description)
+                .filter(Game.id > last_id, Game.description.isnot(None), Game.description_text.is_(None))
+                .order_by(Game.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for game_id, description in rows:
+                db.execute(
+                    update(Game)
+                    .where(Game.id == game_id)
+                    .values(description_text=strip_html(description), updated_at=Game.updated_at)
+                )
+            db.commit()
+            updated += len(rows)
+            last_id = rows[-1].id
+            print(f"[description_text] {updated} games atualizados (último id {last_id})")
+    except Exception as e:
+        db.rollback()
+        print("[description_text] Erro no backfill:", e)
+        raise
+    finally:
+        db.close()
+    return updated
+
+
+if __name__ == "__main__":
+    backfill(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE)
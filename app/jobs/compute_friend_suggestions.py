@@ -0,0 +1,126 @@
+"""
+Recalcula a tabela friend_suggestions (amigos de amigos).
+
+Com A = matriz de adjacência (esparsa, simétrica) das amizades aceitas,
+A @ A dá o número de amigos em comum para cada par. Pares que já têm alguma
+relação (amizade, pedido pendente ou bloqueio, em qualquer sentido) saem; os
+restantes ganham score = amigos em comum + GAME_WEIGHT * games em comum
+(games identificados pelo external_guid) e cada usuário guarda os
+FRIEND_SUGGESTIONS_PER_USER melhores.
+
+Uso: python -m app.jobs.compute_friend_suggestions
+(agendar via cron, ex. a cada hora; a leitura em /users/me/friends/suggestions
+é só uma consulta indexada na tabela)
+"""
+import os
+from datetime import datetime
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.database import SessionLocal
+from app import crud, models
+
+FRIEND_SUGGESTIONS_PER_USER = int(os.getenv("FRIEND_SUGGESTIONS_PER_USER", "50"))
+GAME_WEIGHT = float(os.getenv("FRIEND_SUGGESTIONS_GAME_WEIGHT", "0.25"))
+# pares processados por vez no cálculo de games em comum (limita a memória)
+_PAIR_CHUNK = 200_000
+
+_EXCLUDING_STATUSES = ("accepted", "pending", "blocked")
+
+
+def _pair_keys(rows: np.ndarray, cols: np.ndarray, n: int) -> np.ndarray:
+    return rows.astype(np.int64) * n + cols.astype(np.int64)
+
+
+def compute(friendships: Sequence[Tuple[int, int, str]], games: Sequence[Tuple[int, str]],
+            per_user: int = FRIEND_SUGGESTIONS_PER_USER,
+            game_weight: float = GAME_WEIGHT) -> List[Tuple[int, int, int, int, float]]:
+    """(user_id, suggested_id, amigos_em_comum, games_em_comum, score) para cada sugestão."""
+    accepted = np.array([(u, f) for u, f, st in friendships if st == "accepted"], dtype=np.int64).reshape(-1, 2)
+    if not len(accepted):
+        return []
+    excluded = np.array([(u, f) for u, f, st in friendships if st in _EXCLUDING_STATUSES],
+                        dtype=np.int64).reshape(-1, 2)
+
+    user_ids = np.unique(accepted)
+    n = len(user_ids)
+    a_idx = np.searchsorted(user_ids, accepted)
+    rows = np.concatenate([a_idx[:, 0], a_idx[:, 1]])
+    cols = np.concatenate([a_idx[:, 1], a_idx[:, 0]])
+    adj = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(n, n))
+    adj.data[:] = 1  # as duas linhas de uma amizade aceita somam 2 na mesma célula
+
+    mutual = (adj @ adj).tocoo()
+    keep = mutual.row != mutual.col
+    r, c, m = mutual.row[keep], mutual.col[keep], mutual.data[keep]
+
+    # pares com alguma relação (nos dois sentidos) não são sugeridos
+    ex = excluded[np.isin(excluded[:, 0], user_ids) & np.isin(excluded[:, 1], user_ids)]
+    if len(ex):
+        e_idx = np.searchsorted(user_ids, ex)
+        ex_keys = np.concatenate([_pair_keys(e_idx[:, 0], e_idx[:, 1], n), _pair_keys(e_idx[:, 1], e_idx[:, 0], n)])
+        keep = ~np.isin(_pair_keys(r, c, n), ex_keys)
+        r, c, m = r[keep], c[keep], m[keep]
+    if not len(r):
+        return []
+
+    shared = np.zeros(len(r), dtype=np.int64)
+    game_rows = [(u, g) for u, g in games if g]
+    if game_rows and game_weight:
+        g_users = np.array([u for u, _ in game_rows], dtype=np.int64)
+        guids, g_idx = np.unique(np.array([g for _, g in game_rows], dtype=object), return_inverse=True)
+        mask = np.isin(g_users, user_ids)
+        u_idx = np.searchsorted(user_ids, g_users[mask])
+        lib = sparse.csr_matrix(
+            (np.ones(int(mask.sum()), dtype=np.int32), (u_idx, g_idx[mask])), shape=(n, len(guids))
+        )
+        lib.data[:] = 1  # o mesmo game repetido na biblioteca conta uma vez
+        for start in range(0, len(r), _PAIR_CHUNK):
+            end = start + _PAIR_CHUNK
+            shared[start:end] = np.asarray(lib[r[start:end]].multiply(lib[c[start:end]]).sum(axis=1)).ravel()
+
+    score = m + game_weight * shared
+    order = np.lexsort((c, -score, r))
+    r, c, m, shared, score = r[order], c[order], m[order], shared[order], score[order]
+    # posição de cada par dentro do bloco do seu usuário
+    starts = np.searchsorted(r, r, side="left")
+    top = (np.arange(len(r)) - starts) < per_user
+
+    return list(zip(
+        user_ids[r[top]].tolist(), user_ids[c[top]].tolist(),
+        m[top].tolist(), shared[top].tolist(), score[top].tolist(),
+    ))
+
+
+def rebuild() -> int:
+    db = SessionLocal()
+    try:
+        friendships = db.query(
+            models.Friendship.user_id, models.Friendship.friend_id, models.Friendship.status
+        ).all()
+        games = db.query(models.Game.user_id, models.Game.external_guid).filter(
+            models.Game.external_guid.isnot(None)
+        ).distinct().all()
+
+        computed_at = datetime.utcnow()
+        suggestions = compute(friendships, games)
+        rows = [
+            {"user_id": u, "suggested_id": s, "mutual_friends": m, "shared_games": g,
+             "score": score, "computed_at": computed_at}
+            for u, s, m, g, score in suggestions
+        ]
+        count = crud.replace_friend_suggestions(db, rows)
+        print(f"[friend_suggestions] {count} sugestões gravadas.")
+        return count
+    except Exception as e:
+        db.rollback()
+        print("[friend_suggestions] Erro ao recalcular:", e)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild()
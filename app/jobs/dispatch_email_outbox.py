@@ -0,0 +1,32 @@
+"""
+Envia os e-mails pendentes da outbox até esvaziar os que já estão prontos.
+
+Uso: python -m app.jobs.dispatch_email_outbox
+"""
+import asyncio
+
+from app.email_outbox import dispatch_once, OUTBOX_BATCH_SIZE
+from app.mail import mail_worker
+
+
+async def _drain() -> int:
+    total = 0
+    try:
+        while True:
+            claimed = await dispatch_once()
+            total += claimed
+            if claimed < OUTBOX_BATCH_SIZE:
+                break
+    finally:
+        await mail_worker.close()
+    return total
+
+
+def dispatch() -> int:
+    total = asyncio.run(_drain())
+    print(f"[outbox] {total} e-mails processados.")
+    return total
+
+
+if __name__ == "__main__":
+    dispatch()
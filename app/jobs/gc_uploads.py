@@ -0,0 +1,259 @@
+"""
+Coleta de lixo dos uploads de avatar.
+
+Compara os arquivos em disco com users.avatar_url (lido em streaming) e apaga
+o que ninguém referencia e é mais velho que o período de carência:
+- blobs de static/media sem usuário apontando (e as variantes <sha>_<tam>.webp);
+  a linha de media_blobs só sai se ref_count continua 0, senão o arquivo fica;
+- arquivos legados de static/avatars e static/uploads/avatars;
+- temporários .part esquecidos por uploads interrompidos.
+
+Com backend remoto (STORAGE_BACKEND=s3) não há disco para varrer: os
+candidatos saem de media_blobs (ref_count 0 e sem mudança durante a
+carência) e o objeto original e as variantes são apagados via backend.delete.
+Objetos no bucket sem linha em media_blobs não são vistos (listar o bucket
+fica fora deste job).
+
+Uso: python -m app.jobs.gc_uploads [--dry-run] [--grace-hours H]
+                                    [--max-deletes N] [--rate R] [--verbose]
+"""
+import os
+import re
+import time
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from app.database import SessionLocal
+from app import crud, storage
+from app.avatar_variants import AVATAR_VARIANT_SIZES, variant_relpath
+from app.storage_backends import LocalStorageBackend, StorageBackend, get_backend
+from app.utils.static_files import invalidate_static_file
+
+GC_GRACE_HOURS = float(os.getenv("UPLOADS_GC_GRACE_HOURS", "24"))
+# limite de remoções por segundo (0 = sem limite), para não saturar o disco
+GC_DELETE_RATE = float(os.getenv("UPLOADS_GC_DELETE_RATE", "50"))
+GC_MAX_DELETES = int(os.getenv("UPLOADS_GC_MAX_DELETES", "10000"))
+
+_BLOB_NAME_RE = re.compile(r"^(?P<sha>[0-9a-f]{64})(?:_\d+\.webp|\.(?:jpg|png|webp))$")
+
+
+@dataclass
+class GcReport:
+    scanned: int = 0
+    kept: int = 0
+    too_recent: int = 0
+    still_referenced: int = 0
+    deleted: int = 0
+    deleted_bytes: int = 0
+    failed: int = 0
+    candidates: List[str] = field(default_factory=list)
+
+
+def _referenced(db) -> Tuple[Set[str], Set[str]]:
+    """(shas de blobs referenciados, caminhos legados referenciados)"""
+    shas: Set[str] = set()
+    legacy: Set[str] = set()
+    for url in crud.iter_avatar_urls(db):
+        # avatar_url pode vir absoluto (http://host/static/...) quando editado via PATCH
+        sha = storage.blob_sha_from_url(url)
+        if sha:
+            shas.add(sha)
+            continue
+        path = urlparse(url).path
+        for prefix, directory in storage.LEGACY_AVATAR_DIRS.items():
+            if path.startswith(prefix + "/"):
+                legacy.add(str(directory / path[len(prefix) + 1:]))
+    return shas, legacy
+
+
+def _walk(directory, skip: Optional[str] = None) -> Iterator[os.DirEntry]:
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.path != skip:
+                yield from _walk(entry.path, skip)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+class _Deleter:
+    def __init__(self, report: GcReport, dry_run: bool, max_deletes: int, rate: float, verbose: bool):
+        self.report = report
+        self.dry_run = dry_run
+        self.max_deletes = max_deletes
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.verbose = verbose
+        self._last = 0.0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.report.deleted >= self.max_deletes
+
+    def delete(self, path: str, size: int, remove: Optional[Callable[[str], None]] = None) -> bool:
+        """Remove um arquivo local ou, com `remove` (ex.: backend.delete), um objeto remoto."""
+        if self.exhausted:
+            return False
+        if self.dry_run:
+            self.report.candidates.append(path)
+            self.report.deleted += 1
+            self.report.deleted_bytes += size
+            return True
+        wait = self._last + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last = time.monotonic()
+        if remove is None:
+            # rodando como job separado é no-op; a API confere o stat de cada acerto do índice
+            invalidate_static_file(path)
+            remove = os.remove
+        try:
+            remove(path)
+        except FileNotFoundError:
+            return True
+        except Exception as e:
+            self.report.failed += 1
+            print(f"[uploads_gc] Falha ao remover {path}: {e}")
+            return False
+        self.report.deleted += 1
+        self.report.deleted_bytes += size
+        if self.verbose:
+            print(f"[uploads_gc] removido {path}")
+        return True
+
+
+def _recently_modified(backend: StorageBackend, key: str, cutoff: float) -> bool:
+    modified = backend.modified_at(key)
+    return modified is not None and modified >= cutoff
+
+
+def _collect_remote(db, backend: StorageBackend, shas: Set[str], cutoff: float,
+                    deleter: _Deleter, report: GcReport, dry_run: bool) -> None:
+    """Blobs sem referência num backend remoto, a partir de media_blobs."""
+    candidates = crud.list_unreferenced_media_blobs(
+        db, datetime.utcfromtimestamp(cutoff), limit=deleter.max_deletes
+    )
+    for sha, ext, size in candidates:
+        if deleter.exhausted:
+            break
+        report.scanned += 1
+        if sha in shas:
+            # ref_count dessincronizado, mas há usuário apontando: fica
+            report.kept += 1
+            continue
+        keys = [(f"{sha[:2]}/{sha}{ext}", size)] + [(variant_relpath(sha, s), 0) for s in AVATAR_VARIANT_SIZES]
+        # upload com os mesmos bytes renova o objeto (touch) antes de voltar a referenciá-lo;
+        # confere antes de apagar a linha e de novo depois, como o stat no disco local
+        if _recently_modified(backend, keys[0][0], cutoff):
+            report.too_recent += 1
+            continue
+        if not dry_run and not crud.delete_unreferenced_media_blob(db, sha):
+            report.still_referenced += 1
+            continue
+        if _recently_modified(backend, keys[0][0], cutoff):
+            report.too_recent += 1
+            continue
+        for key, key_size in keys:
+            deleter.delete(key, key_size, remove=backend.delete)
+
+
+def collect(dry_run: bool = False, grace_hours: float = GC_GRACE_HOURS, max_deletes: int = GC_MAX_DELETES,
+            rate: float = GC_DELETE_RATE, verbose: bool = False, now: Optional[float] = None) -> GcReport:
+    report = GcReport()
+    cutoff = (now if now is not None else time.time()) - grace_hours * 3600
+    deleter = _Deleter(report, dry_run, max_deletes, rate, verbose)
+
+    db = SessionLocal()
+    try:
+        shas, legacy = _referenced(db)
+
+        backend = get_backend()
+        if not isinstance(backend, LocalStorageBackend):
+            _collect_remote(db, backend, shas, cutoff, deleter, report, dry_run)
+        else:
+            # blobs e variantes, agrupados por sha (o blob só sai se todos os arquivos passaram da carência)
+            groups = {}
+            for entry in _walk(storage.MEDIA_DIR, skip=str(storage.MEDIA_TMP_DIR)):
+                report.scanned += 1
+                st = entry.stat(follow_symlinks=False)
+                if entry.name.endswith(".part"):
+                    if st.st_mtime < cutoff:
+                        deleter.delete(entry.path, st.st_size)
+                    else:
+                        report.too_recent += 1
+                    continue
+                m = _BLOB_NAME_RE.match(entry.name)
+                if not m or m.group("sha") in shas:
+                    report.kept += 1
+                    continue
+                groups.setdefault(m.group("sha"), []).append((entry.path, st))
+
+            for sha, files in groups.items():
+                if deleter.exhausted:
+                    break
+                if any(st.st_mtime >= cutoff for _, st in files):
+                    report.too_recent += len(files)
+                    continue
+                if not dry_run and not crud.delete_unreferenced_media_blob(db, sha):
+                    report.still_referenced += len(files)
+                    continue
+                # a carência pode ter sido renovada por um upload entre a varredura e agora
+                for path, st in files:
+                    try:
+                        if os.stat(path).st_mtime >= cutoff:
+                            report.too_recent += 1
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    deleter.delete(path, st.st_size)
+
+        for entry in _walk(storage.MEDIA_TMP_DIR):
+            report.scanned += 1
+            st = entry.stat(follow_symlinks=False)
+            if st.st_mtime < cutoff:
+                deleter.delete(entry.path, st.st_size)
+            else:
+                report.too_recent += 1
+
+        for directory in storage.LEGACY_AVATAR_DIRS.values():
+            for entry in _walk(directory):
+                report.scanned += 1
+                if entry.path in legacy:
+                    report.kept += 1
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime >= cutoff:
+                    report.too_recent += 1
+                    continue
+                deleter.delete(entry.path, st.st_size)
+    finally:
+        db.close()
+
+    verb = "seriam removidos" if dry_run else "removidos"
+    print(f"[uploads_gc] {report.scanned} arquivos analisados, {report.deleted} {verb} "
+          f"({report.deleted_bytes / (1024 * 1024):.1f} MB), {report.kept} referenciados, "
+          f"{report.too_recent} dentro da carência, {report.still_referenced} com ref_count > 0, "
+          f"{report.failed} falhas.")
+    if dry_run:
+        for path in report.candidates:
+            print(f"[uploads_gc] (dry-run) {path}")
+    if deleter.exhausted:
+        print(f"[uploads_gc] Limite de {max_deletes} remoções atingido; rode de novo para continuar.")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="só lista o que seria removido")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_HOURS)
+    parser.add_argument("--max-deletes", type=int, default=GC_MAX_DELETES)
+    parser.add_argument("--rate", type=float, default=GC_DELETE_RATE, help="remoções por segundo (0 = sem limite)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    collect(dry_run=args.dry_run, grace_hours=args.grace_hours, max_deletes=args.max_deletes,
+            rate=args.rate, verbose=args.verbose)
@@ -0,0 +1,31 @@
+"""
+Remove remember tokens expirados, em lotes.
+
+Uso: python -m app.jobs.purge_remember_tokens [--batch-size N]
+"""
+import argparse
+
+from app.database import SessionLocal
+from app import crud
+from app.remember_tokens import REMEMBER_TOKEN_PURGE_BATCH
+
+
+def purge(batch_size: int = REMEMBER_TOKEN_PURGE_BATCH) -> int:
+    db = SessionLocal()
+    try:
+        count = crud.purge_expired_remember_tokens(db, batch_size=batch_size)
+        print(f"[remember_tokens] {count} tokens expirados removidos.")
+        return count
+    except Exception as e:
+        db.rollback()
+        print("[remember_tokens] Erro ao remover tokens:", e)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=REMEMBER_TOKEN_PURGE_BATCH)
+    args = parser.parse_args()
+    purge(args.batch_size)
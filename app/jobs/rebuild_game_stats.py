@@ -0,0 +1,26 @@
+"""
+Recalcula a tabela game_stats a partir das reviews públicas.
+
+Uso: python -m app.jobs.rebuild_game_stats
+"""
+from app.database import SessionLocal, Base, engine
+from app import crud
+
+
+def rebuild() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_game_stats(db)
+        print(f"[game_stats] {count} games recalculados.")
+        return count
+    except Exception as e:
+        db.rollback()
+        print("[game_stats] Erro ao recalcular:", e)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild()
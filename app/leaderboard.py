@@ -0,0 +1,218 @@
+"""
+Ranking de games por média bayesiana, mantido em memória por worker.
+
+- refresh(): recálculo completo (NumPy) a partir de game_stats (all-time) e
+  das reviews recentes (janelas com prazo, ex. 30d). Roda no startup e
+  periodicamente (ver app.main).
+- Entre recálculos, cada commit que altera reviews aplica o delta do game
+  na estrutura ordenada (bisect), sem GROUP BY.
+
+Score bayesiano: (C * m + soma) / (C + n), onde m é a média global e C o
+peso do prior. m e C ficam congelados entre recálculos completos para que
+os scores continuem comparáveis na lista ordenada.
+"""
+import os
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger("app.leaderboard")
+
+WINDOWS: Dict[str, Optional[timedelta]] = {
+    "all": None,
+    "30d": timedelta(days=30),
+}
+PRIOR_WEIGHT = os.getenv("LEADERBOARD_PRIOR_WEIGHT")  # vazio = média de avaliações por game
+REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+
+_EVENTS_KEY = "leaderboard_events"
+
+
+class _Board:
+    """Lista ordenada (-score, game_id) + contadores por game de uma janela."""
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, Tuple[int, int]] = {}
+        self.scores: Dict[int, float] = {}
+        self.keys: List[Tuple[float, int]] = []
+        self.prior_mean = 0.0
+        self.prior_weight = 1.0
+
+    def score(self, n: int, total: int) -> float:
+        return (self.prior_weight * self.prior_mean + total) / (self.prior_weight + n)
+
+    def load(self, game_ids: np.ndarray, n: np.ndarray, total: np.ndarray) -> None:
+        mask = n > 0
+        game_ids, n, total = game_ids[mask], n[mask], total[mask]
+
+        ratings = int(n.sum())
+        self.prior_mean = float(total.sum()) / ratings if ratings else 0.0
+        if PRIOR_WEIGHT:
+            self.prior_weight = float(PRIOR_WEIGHT)
+        else:
+            self.prior_weight = float(n.mean()) if n.size else 1.0
+
+        scores = (self.prior_weight * self.prior_mean + total) / (self.prior_weight + n)
+        order = np.lexsort((game_ids, -scores))
+
+        ids_list = game_ids[order].tolist()
+        scores_list = scores[order].tolist()
+        self.keys = [(-s, gid) for s, gid in zip(scores_list, ids_list)]
+        self.scores = dict(zip(ids_list, scores_list))
+        self.counts = dict(zip(ids_list, zip(n[order].tolist(), total[order].tolist())))
+
+    def apply(self, game_id: int, dn: int, dtotal: int) -> None:
+        old = self.scores.pop(game_id, None)
+        if old is not None:
+            idx = bisect.bisect_left(self.keys, (-old, game_id))
+            if idx < len(self.keys) and self.keys[idx] == (-old, game_id):
+                del self.keys[idx]
+
+        n, total = self.counts.get(game_id, (0, 0))
+        n, total = n + dn, total + dtotal
+        if n <= 0:
+            self.counts.pop(game_id, None)
+            return
+
+        self.counts[game_id] = (n, total)
+        new = self.score(n, total)
+        self.scores[game_id] = new
+        bisect.insort(self.keys, (-new, game_id))
+
+    def top(self, offset: int, limit: int, min_ratings: int) -> List[Tuple[int, float, int, int]]:
+        out = []
+        skipped = 0
+        for neg_score, game_id in self.keys:
+            n, total = self.counts[game_id]
+            if n < min_ratings:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            out.append((game_id, -neg_score, n, total))
+            if len(out) >= limit:
+                break
+        return out
+
+
+class Leaderboard:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._boards: Dict[str, _Board] = {name: _Board() for name in WINDOWS}
+        # deltas aplicados enquanto uma recarga está em andamento (reaplicados no fim)
+        self._replay: Optional[List[Tuple[object, object, datetime]]] = None
+        self.refreshed_at: Optional[datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    def refresh(self, db: Optional[Session] = None) -> None:
+        own_session = db is None
+        db = db or SessionLocal()
+        # aberto antes das consultas, como em FriendGraph.refresh: um commit que cair
+        # entre a leitura e a troca não se perde. O caso inverso (delta já visto pelo
+        # snapshot e reaplicado) fica restrito ao intervalo até a primeira leitura e é
+        # desfeito no próximo refresh, que recalcula tudo do zero.
+        with self._lock:
+            self._replay = []
+        try:
+            now = datetime.utcnow()
+            loaded: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+            for name, span in WINDOWS.items():
+                if span is None:
+                    rows = db.query(
+                        models.GameStats.game_id,
+                        models.GameStats.ratings_count,
+                        models.GameStats.rating_sum,
+                    ).filter(models.GameStats.ratings_count > 0).all()
+                else:
+                    rows = (
+                        db.query(
+                            models.Review.game_id,
+                            func.count(models.Review.rating),
+                            func.coalesce(func.sum(models.Review.rating), 0),
+                        )
+                        .filter(
+                            models.Review.is_public == True,
+                            models.Review.rating.isnot(None),
+                            models.Review.created_at >= now - span,
+                        )
+                        .group_by(models.Review.game_id)
+                        .all()
+                    )
+                arr = np.array(rows, dtype=np.int64).reshape(-1, 3)
+                loaded[name] = (arr[:, 0], arr[:, 1], arr[:, 2])
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            replay, self._replay = self._replay or [], None
+            for name, (game_ids, n, total) in loaded.items():
+                self._boards[name].load(game_ids, n, total)
+            for before, after, at in replay:
+                self._apply(before, after, at)
+            self.refreshed_at = now
+
+    # --- escrita (chamar com o lock) ---
+    def _apply(self, before, after, now: datetime) -> None:
+        for name, span in WINDOWS.items():
+            cutoff = now - span if span is not None else None
+            board = self._boards[name]
+            for contribution, sign in ((before, -1), (after, +1)):
+                if contribution is None or contribution.rating is None:
+                    continue
+                at = contribution.created_at or now
+                if cutoff is not None and at < cutoff:
+                    continue
+                board.apply(contribution.game_id, sign, sign * contribution.rating)
+
+    def apply_change(self, before, after) -> None:
+        """Aplica a troca de contribuição de uma review (ver crud.review_contribution)."""
+        now = datetime.utcnow()
+        with self._lock:
+            self._apply(before, after, now)
+            if self._replay is not None:
+                self._replay.append((before, after, now))
+
+    def top(self, window: str = "all", offset: int = 0, limit: int = 20,
+            min_ratings: int = 1) -> List[Tuple[int, float, int, int]]:
+        """Lista de (game_id, score, n_avaliacoes, soma_notas) em ordem de ranking."""
+        with self._lock:
+            return self._boards[window].top(offset, limit, min_ratings)
+
+
+leaderboard = Leaderboard()
+
+
+def queue_review_change(db: Session, before, after) -> None:
+    """Guarda a mudança na sessão; só entra no ranking quando a transação commitar."""
+    db.info.setdefault(_EVENTS_KEY, []).append((before, after))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_committed_changes(session: Session) -> None:
+    for before, after in session.info.pop(_EVENTS_KEY, ()):
+        try:
+            leaderboard.apply_change(before, after)
+        except Exception:
+            logger.exception("Falha ao aplicar evento de review no leaderboard")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_rolled_back_changes(session: Session) -> None:
+    session.info.pop(_EVENTS_KEY, None)
@@ -1,9 +1,13 @@
 import os
 import logging
+from email.message import EmailMessage
+from email.utils import formataddr
 from dotenv import load_dotenv
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from fastapi import HTTPException
+from fastapi_mail import MessageType
+from sqlalchemy.orm import Session
+from app import crud, dev_confirmations
 from app.auth import create_confirmation_token
+from app.mail_worker import MailWorker, SMTPConnectionPool
 from typing import Optional
 
 load_dotenv()
@@ -21,77 +25,84 @@ MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
 MAIL_USE_TLS = _env_bool("MAIL_USE_TLS", "True")
 MAIL_USE_SSL = _env_bool("MAIL_USE_SSL", "False")
 DISABLE_EMAILS = _env_bool("DISABLE_EMAILS", "False")
+MAIL_VALIDATE_CERTS = _env_bool("MAIL_VALIDATE_CERTS", "True")
+MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", "2"))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
 ENABLE_DEV_EMAIL_ENDPOINTS = _env_bool("ENABLE_DEV_EMAIL_ENDPOINTS", "True")
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=MAIL_USERNAME,
-    MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM=MAIL_FROM,
-    MAIL_FROM_NAME=MAIL_FROM_NAME,
-    MAIL_SERVER=MAIL_SERVER,
-    MAIL_PORT=MAIL_PORT,
-    MAIL_STARTTLS=MAIL_USE_TLS,
-    MAIL_SSL_TLS=MAIL_USE_SSL,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER="app/templates"
+mail_worker = MailWorker(
+    SMTPConnectionPool(
+        hostname=MAIL_SERVER,
+        port=MAIL_PORT,
+        username=MAIL_USERNAME,
+        password=MAIL_PASSWORD,
+        start_tls=MAIL_USE_TLS,
+        use_tls=MAIL_USE_SSL,
+        validate_certs=MAIL_VALIDATE_CERTS,
+        size=MAIL_POOL_SIZE,
+    ),
+    batch_size=MAIL_BATCH_SIZE,
 )
 
-DEV_CONFIRMATIONS: dict[str, dict] = {}
+def build_message(subject: str, recipients: list[str], body: str, subtype: MessageType = MessageType.plain) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((MAIL_FROM_NAME, MAIL_FROM)) if MAIL_FROM else MAIL_FROM_NAME
+    message["To"] = ", ".join(recipients)
+    message.set_content(body, subtype="html" if subtype == MessageType.html else "plain")
+    return message
 
 
-async def send_email(subject: str, recipients: list[str], body: str, subtype: MessageType = MessageType.plain) -> bool:
-    if DISABLE_EMAILS:
-        logger.info("Envio de e-mail desabilitado (DISABLE_EMAILS=True). Simulando envio para %s", recipients)
-        logger.debug("Email subject=%s body=%s", subject, body)
-        return True
+CONFIRMATION_SUBJECT = "Confirme sua conta"
+
+
+def confirmation_url_for(token: str) -> str:
+    base = os.getenv("EMAIL_CONFIRM_URL", os.getenv("VITE_API_BASE", "http://localhost:8000")).rstrip("/")
+    return f"{base}/auth/confirm?token={token}"
+
+
+def confirmation_body(confirmation_url: str) -> str:
+    return f"Olá,\n\nPor favor confirme sua conta clicando no link a seguir:\n\n{confirmation_url}\n\nObrigado!"
 
-    message = MessageSchema(subject=subject, recipients=recipients, body=body, subtype=subtype)
-    fm = FastMail(conf)
+
+def _record_dev_confirmation(user_email: str, token: str, confirmation_url: str) -> None:
     try:
-        await fm.send_message(message)
-        logger.info("E-mail enviado para %s (subject=%s)", recipients, subject)
-        return True
-    except Exception as exc:
-        logger.exception("Falha ao enviar e-mail para %s: %s", recipients, exc)
-        return False
+        dev_confirmations.put(user_email, token, confirmation_url)
+    except Exception:
+        logger.exception("Não consegui guardar o link de confirmação de %s", user_email)
+    dev_confirmations.log_link(user_email, confirmation_url)
 
 
-async def send_confirmation_email(user_email: str, token: Optional[str] = None) -> str:
+def queue_confirmation_email(db: Session, user_email: str, token: Optional[str] = None) -> str:
+    """
+    Grava o e-mail de confirmação na outbox, na transação de `db` (quem chama faz o
+    commit junto com o usuário). O envio fica com o dispatcher (app.email_outbox).
+    """
     if token is None:
         token = create_confirmation_token(user_email)
-
-    base = os.getenv("EMAIL_CONFIRM_URL", os.getenv("VITE_API_BASE", "http://localhost:8000")).rstrip("/")
-    confirmation_url = f"{base}/auth/confirm?token={token}"
-
+    confirmation_url = confirmation_url_for(token)
     logger.info("Confirmation URL for %s: %s", user_email, confirmation_url)
-    print(f"Confirme sua conta acessando: {confirmation_url}")
 
     if DISABLE_EMAILS:
-        DEV_CONFIRMATIONS[user_email] = {
-            "token": token,
-            "url": confirmation_url,
-            "created_at": __import__("time").time()
-        }
-        try:
-            os.makedirs("dev", exist_ok=True)
-            with open("dev/confirmation_links.log", "a", encoding="utf-8") as f:
-                f.write(f"{user_email} {confirmation_url}\n")
-        except Exception:
-            logger.exception("Não consegui gravar dev/confirmation_links.log")
+        _record_dev_confirmation(user_email, token, confirmation_url)
         return confirmation_url
 
-    subject = "Confirme sua conta"
-    recipients = [user_email]
-    body = f"Olá,\n\nPor favor confirme sua conta clicando no link a seguir:\n\n{confirmation_url}\n\nObrigado!"
-    sent = await send_email(subject=subject, recipients=recipients, body=body, subtype=MessageType.plain)
-    if not sent:
-        logger.warning("Falha ao enviar e-mail de confirmação para %s (mas link retornado).", user_email)
+    crud.enqueue_email(
+        db,
+        recipient=user_email,
+        subject=CONFIRMATION_SUBJECT,
+        body=confirmation_body(confirmation_url),
+        subtype=MessageType.plain.value,
+        kind="confirmation",
+    )
     return confirmation_url
 
 
 def get_dev_confirmations() -> dict:
-    return DEV_CONFIRMATIONS
+    return dev_confirmations.all_confirmations()
+
+def get_dev_confirmation(email: str) -> Optional[dict]:
+    return dev_confirmations.get(email)
 
 def pop_dev_confirmation(email: str):
-    return DEV_CONFIRMATIONS.pop(email, None)
+    return dev_confirmations.pop(email)
@@ -0,0 +1,155 @@
+"""
+Worker de envio de e-mails com pool de conexões SMTP persistentes.
+
+- SMTPConnectionPool mantém até `size` conexões autenticadas (aiosmtplib)
+  reaproveitadas entre envios; uma conexão que caiu é descartada e
+  reaberta na próxima vez.
+- MailWorker.send_many divide as mensagens em lotes de até `batch_size` e
+  envia cada lote numa conexão do pool (lotes em paralelo até o tamanho do
+  pool). Quem chama é o dispatcher da outbox (app.email_outbox), que já faz
+  a fila durável e os retries; por isso não há fila em memória aqui.
+
+Para testar localmente sem SMTP real:
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=False MAIL_USERNAME= ...
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from email.message import EmailMessage
+from typing import List, Optional
+
+import aiosmtplib
+
+logger = logging.getLogger("app.mail_worker")
+
+
+class SMTPConnectionPool:
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, start_tls: bool = True, use_tls: bool = False,
+                 validate_certs: bool = True, size: int = 2, timeout: float = 30.0) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.validate_certs = validate_certs
+        self.size = size
+        self.timeout = timeout
+        self._idle: "asyncio.Queue[aiosmtplib.SMTP]" = asyncio.Queue()
+        self._slots = asyncio.Semaphore(size)
+        self.connects = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls if not self.use_tls else False,
+            validate_certs=self.validate_certs,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        if self.username and self.password:
+            await client.login(self.username, self.password)
+        self.connects += 1
+        return client
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        await self._slots.acquire()
+        try:
+            while not self._idle.empty():
+                client = self._idle.get_nowait()
+                if client.is_connected:
+                    return client
+            return await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, client: aiosmtplib.SMTP, broken: bool = False) -> None:
+        if broken or not client.is_connected:
+            client.close()
+        else:
+            self._idle.put_nowait(client)
+        self._slots.release()
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            client = self._idle.get_nowait()
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+
+class MailWorker:
+    def __init__(self, pool: SMTPConnectionPool, batch_size: int = 20) -> None:
+        self.pool = pool
+        self.batch_size = batch_size
+        self._latencies: deque = deque(maxlen=1000)
+        self._metrics = {
+            "sent": 0,
+            "failed": 0,
+            "batches": 0,
+        }
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def send_many(self, messages: List[EmailMessage]) -> List[Optional[str]]:
+        """
+        Envia as mensagens pelo pool, em lotes de até `batch_size` por conexão
+        (lotes em paralelo até o tamanho do pool). Retorna, por mensagem, None
+        (ok) ou o erro, na mesma ordem.
+        """
+        started = time.monotonic()
+        batches = [messages[i:i + self.batch_size] for i in range(0, len(messages), self.batch_size)]
+        results = await asyncio.gather(*(self._send_batch(batch, started) for batch in batches))
+        return [error for batch_errors in results for error in batch_errors]
+
+    async def _send_batch(self, batch: List[EmailMessage], started: float) -> List[Optional[str]]:
+        errors: List[Optional[str]] = []
+        client: Optional[aiosmtplib.SMTP] = None
+        try:
+            for index, message in enumerate(batch):
+                if client is None:
+                    try:
+                        client = await self.pool.acquire()
+                    except Exception as exc:
+                        # sem conexão: o resto do lote falha junto, sem reconectar por mensagem
+                        logger.warning("Não foi possível conectar ao SMTP: %s", exc)
+                        remaining = len(batch) - index
+                        errors.extend([repr(exc)] * remaining)
+                        self._metrics["failed"] += remaining
+                        break
+                try:
+                    await client.send_message(message)
+                    errors.append(None)
+                    self._metrics["sent"] += 1
+                    self._latencies.append(time.monotonic() - started)
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError, OSError) as exc:
+                    errors.append(repr(exc))
+                    self._metrics["failed"] += 1
+                    logger.warning("Conexão SMTP indisponível ao enviar para %s: %s", message["To"], exc)
+                    self.pool.release(client, broken=True)
+                    client = None
+                except Exception as exc:
+                    errors.append(repr(exc))
+                    self._metrics["failed"] += 1
+                    logger.exception("Falha ao enviar e-mail para %s", message["To"])
+        finally:
+            if client is not None:
+                self.pool.release(client)
+        self._metrics["batches"] += 1
+        return errors
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+        snapshot = dict(self._metrics)
+        snapshot["smtp_connects"] = self.pool.connects
+        snapshot["latency_avg_seconds"] = sum(latencies) / len(latencies) if latencies else 0.0
+        snapshot["latency_p95_seconds"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return snapshot
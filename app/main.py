@@ -1,16 +1,36 @@
 import os
+import asyncio
+import logging
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from .database import engine, Base
-from .routers import auth_router, users_router, giantbomb_router, games_router, reviews_router
+from .utils.static_files import CachedStaticFiles, parse_cache_policies
+from .hashing import shutdown_executor as shutdown_password_hashing
+from .avatar_variants import shutdown_executor as shutdown_avatar_variants
+from .mail import mail_worker, DISABLE_EMAILS
+from .email_outbox import run_dispatcher as run_email_outbox_dispatcher
+from . import dev_confirmations
+from .leaderboard import leaderboard, REFRESH_SECONDS as LEADERBOARD_REFRESH_SECONDS
+from .friend_graph import friend_graph, REFRESH_SECONDS as FRIEND_GRAPH_REFRESH_SECONDS
+from .remember_tokens import (
+    flush_last_used as flush_remember_token_usage,
+    REMEMBER_TOKEN_FLUSH_SECONDS,
+    REMEMBER_TOKEN_PURGE_SECONDS,
+)
+from .jobs.purge_remember_tokens import purge as purge_remember_tokens
+from .routers import (
+    auth_router, users_router, giantbomb_router, games_router, reviews_router, metrics_router, media_router,
+)
+
+logger = logging.getLogger("app.main")
 
 Base.metadata.create_all(bind=engine)
 
@@ -18,7 +38,8 @@ ENABLE_DOCS = os.getenv("ENABLE_DOCS", "true").lower() in ("1", "true", "yes")
 DOCS_API_KEY = os.getenv("DOCS_API_KEY")
 
 if DOCS_API_KEY:
-    app = FastAPI(title="MVP API (G4M3)", docs_url=None, redoc_url=None, openapi_url=None)
+    app = FastAPI(title="MVP API (G4M3)", docs_url=None, redoc_url=None, openapi_url=None,
+                  default_response_class=ORJSONResponse)
 else:
     if ENABLE_DOCS:
         app = FastAPI(
@@ -26,9 +47,11 @@ else:
             docs_url="/",    
             redoc_url="/redoc",
             openapi_url="/openapi.json",
+            default_response_class=ORJSONResponse,
         )
     else:
-        app = FastAPI(title="MVP API (G4M3)", docs_url=None, redoc_url=None, openapi_url=None)
+        app = FastAPI(title="MVP API (G4M3)", docs_url=None, redoc_url=None, openapi_url=None,
+                      default_response_class=ORJSONResponse)
 
 # --- CORS ---
 _cors_env = os.getenv("CORS_ORIGINS", "")
@@ -56,6 +79,8 @@ app.include_router(users_router.router)
 app.include_router(giantbomb_router.router)
 app.include_router(games_router.router)
 app.include_router(reviews_router.router)
+app.include_router(metrics_router.router)
+app.include_router(media_router.router)
 
 # --- Static / Avatars ---
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -63,7 +88,77 @@ STATIC_DIR = BASE_DIR / "static"
 AVATAR_DIR = STATIC_DIR / "avatars"
 AVATAR_DIR.mkdir(parents=True, exist_ok=True)
 
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# Cache-Control por prefixo ("prefixo=valor;..."). Blobs endereçados por conteúdo
+# (app.storage) nunca mudam de conteúdo; os diretórios legados de avatar podem mudar.
+STATIC_CACHE_CONTROL = os.getenv(
+    "STATIC_CACHE_CONTROL",
+    "media/=public, max-age=31536000, immutable;"
+    "avatars/=public, max-age=86400;"
+    "uploads/=public, max-age=86400",
+)
+STATIC_DEFAULT_CACHE_CONTROL = os.getenv("STATIC_DEFAULT_CACHE_CONTROL", "public, max-age=3600")
+STATIC_INDEX_SIZE = int(os.getenv("STATIC_INDEX_SIZE", "50000"))
+STATIC_INDEX_TTL_SECONDS = float(os.getenv("STATIC_INDEX_TTL_SECONDS", "300"))
+
+static_files = CachedStaticFiles(
+    directory=str(STATIC_DIR),
+    cache_policies=parse_cache_policies(STATIC_CACHE_CONTROL),
+    default_cache_control=STATIC_DEFAULT_CACHE_CONTROL or None,
+    index_size=STATIC_INDEX_SIZE,
+    index_ttl=STATIC_INDEX_TTL_SECONDS,
+)
+app.mount("/static", static_files, name="static")
+
+
+# --- Jobs periódicos (por worker) ---
+_background_tasks: list[asyncio.Task] = []
+
+
+async def _run_periodically(name: str, seconds: int, job: Callable[[], None]) -> None:
+    while True:
+        try:
+            await run_in_threadpool(job)
+        except Exception:
+            logger.exception("Job periódico %s falhou", name)
+        await asyncio.sleep(seconds)
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    try:
+        indexed = await run_in_threadpool(static_files.build_index)
+        logger.info("Índice de /static: %d arquivos", indexed)
+    except Exception:
+        logger.exception("Falha ao indexar /static")
+    if not DISABLE_EMAILS:
+        _background_tasks.append(asyncio.create_task(run_email_outbox_dispatcher()))
+    _background_tasks.append(asyncio.create_task(
+        _run_periodically("leaderboard", LEADERBOARD_REFRESH_SECONDS, leaderboard.refresh)
+    ))
+    _background_tasks.append(asyncio.create_task(
+        _run_periodically("friend_graph", FRIEND_GRAPH_REFRESH_SECONDS, friend_graph.refresh)
+    ))
+    _background_tasks.append(asyncio.create_task(
+        _run_periodically("remember_tokens_last_used", REMEMBER_TOKEN_FLUSH_SECONDS, flush_remember_token_usage)
+    ))
+    _background_tasks.append(asyncio.create_task(
+        _run_periodically("remember_tokens_purge", REMEMBER_TOKEN_PURGE_SECONDS, purge_remember_tokens)
+    ))
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    shutdown_password_hashing()
+    shutdown_avatar_variants()
+    await mail_worker.close()
+    dev_confirmations.shutdown()
+    try:
+        await run_in_threadpool(flush_remember_token_usage)
+    except Exception:
+        logger.exception("Falha ao gravar last_used_at pendentes dos remember tokens")
 
 
 @app.get("/ping")
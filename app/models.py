@@ -1,9 +1,10 @@
 from sqlalchemy import (
-    Column, Integer, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint
+    Column, Integer, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint, JSON, Index, Float
 )
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from .database import Base
+from app.utils.text import strip_html
 
 # --- Users ---
 class User(Base):
@@ -14,8 +15,11 @@ class User(Base):
     name = Column(String(255), nullable=True)
     bio = Column(Text, nullable=True)
     avatar_url = Column(String(512), nullable=True)
+    # {"32": url, "64": url, ...} gerado em background a partir do avatar (ver app.avatar_variants)
+    avatar_variants = Column(JSON, nullable=True)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
@@ -46,7 +50,7 @@ class RememberToken(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     token_hash = Column(String(128), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
     last_used_at = Column(DateTime(timezone=True), nullable=True)
     user_agent = Column(String(1024), nullable=True)
     ip = Column(String(45), nullable=True)
@@ -62,6 +66,7 @@ class Game(Base):
     external_guid = Column(String(100), nullable=True, index=True)
     cover_url = Column(String(1000), nullable=True)
     description = Column(Text, nullable=True)
+    description_text = Column(Text, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     status = Column(String(50), nullable=False, default="Wishlist")
@@ -75,6 +80,43 @@ class Game(Base):
     sections = relationship("Section", back_populates="game", cascade="all,delete-orphan")
 
     user_games = relationship("UserGame", back_populates="game", cascade="all,delete-orphan")
+    stats = relationship("GameStats", back_populates="game", uselist=False, cascade="all,delete-orphan")
+
+    @validates("description")
+    def _sync_description_text(self, key, value):
+        # texto limpo calculado na escrita; as rotas de leitura só repassam
+        self.description_text = strip_html(value) if value else None
+        return value
+
+    @property
+    def avg_rating(self):
+        return self.stats.avg_rating if self.stats else None
+
+    @property
+    def reviews_count(self) -> int:
+        return int(self.stats.reviews_count or 0) if self.stats else 0
+
+
+# --- Agregados de reviews por game (mantidos nas escritas de review) ---
+class GameStats(Base):
+    __tablename__ = "game_stats"
+
+    game_id = Column(Integer, ForeignKey("games.id", ondelete="CASCADE"), primary_key=True)
+    reviews_count = Column(Integer, nullable=False, default=0)
+    ratings_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_histogram = Column(JSON, nullable=True)
+    last_review_at = Column(DateTime(timezone=True), nullable=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    game = relationship("Game", back_populates="stats")
+
+    @property
+    def avg_rating(self):
+        if not self.ratings_count:
+            return None
+        return round(self.rating_sum / self.ratings_count, 2)
 
 
 class Review(Base):
@@ -145,3 +187,57 @@ class Friendship(Base):
 
     requester = relationship("User", back_populates="sent_friendships", foreign_keys=[user_id])
     receiver = relationship("User", back_populates="received_friendships", foreign_keys=[friend_id])
+
+
+# --- Outbox de e-mails (gravado na mesma transação que o evento que o gerou) ---
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False, default="generic")
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    subtype = Column(String(10), nullable=False, default="plain")
+    # pending -> sending -> sent | (pending de novo, com backoff) | dead
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # horários em UTC gravados pela aplicação (ver crud.enqueue_email / app.email_outbox)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# --- Blobs de mídia endereçados por conteúdo (ver app.storage) ---
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    ext = Column(String(10), nullable=False)
+    content_type = Column(String(50), nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+
+# --- Sugestões de amizade (pré-calculadas por app.jobs.compute_friend_suggestions) ---
+class FriendSuggestion(Base):
+    __tablename__ = "friend_suggestions"
+    __table_args__ = (
+        Index("ix_friend_suggestions_user_score", "user_id", "score"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    suggested_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    mutual_friends = Column(Integer, nullable=False, default=0)
+    shared_games = Column(Integer, nullable=False, default=0)
+    score = Column(Float, nullable=False, default=0)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+    suggested = relationship("User", foreign_keys=[suggested_id])
@@ -0,0 +1,74 @@
+"""
+Cache do usuário autenticado (principal) por worker.
+
+get_current_user resolve o id do token (`sub`) para um Principal imutável e
+desacoplado da sessão do SQLAlchemy; enquanto a entrada estiver no cache,
+a autenticação não consulta o banco. As escritas em crud que mudam dados
+do usuário (senha, ativação, perfil, avatar, remoção) chamam
+invalidate_principal. Em outros workers a entrada expira pelo TTL.
+"""
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+from app.utils.cache import TTLCache
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    name: Optional[str]
+    bio: Optional[str]
+    avatar_url: Optional[str]
+    is_active: bool
+    hashed_password: str
+    token_version: int
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            bio=user.bio,
+            avatar_url=user.avatar_url,
+            is_active=bool(user.is_active),
+            hashed_password=user.hashed_password,
+            token_version=int(user.token_version or 0),
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+        )
+
+
+_principals = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def get_principal(db: Session, user_id: int) -> Optional[Principal]:
+    principal = _principals.get(user_id)
+    if principal is not None:
+        return principal
+    user = db.get(models.User, user_id)
+    if not user:
+        return None
+    principal = Principal.from_user(user)
+    _principals.set(user_id, principal)
+    return principal
+
+
+def invalidate_principal(user_id: Optional[int]) -> None:
+    if user_id is not None:
+        _principals.pop(user_id)
+
+
+def principal_cache_stats() -> dict:
+    return _principals.stats()
@@ -0,0 +1,127 @@
+"""
+Validação de remember tokens com cache por worker.
+
+- validate_remember_token (usado por POST /auth/refresh): hash do token -> cache (TTL curto, nunca além do
+  expires_at); só consulta o banco no miss. Revogações em crud chamam
+  invalidate_remember_token / invalidate_user_remember_tokens.
+- last_used_at não é gravado a cada uso: fica num buffer em memória e
+  flush_last_used grava tudo num único UPDATE em lote (ver app.main).
+"""
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from app.utils.cache import TTLCache
+from app.utils.security import hash_token
+
+REMEMBER_TOKEN_CACHE_SIZE = int(os.getenv("REMEMBER_TOKEN_CACHE_SIZE", "10000"))
+REMEMBER_TOKEN_CACHE_TTL = float(os.getenv("REMEMBER_TOKEN_CACHE_TTL_SECONDS", "60"))
+REMEMBER_TOKEN_FLUSH_SECONDS = int(os.getenv("REMEMBER_TOKEN_FLUSH_SECONDS", "30"))
+REMEMBER_TOKEN_PURGE_SECONDS = int(os.getenv("REMEMBER_TOKEN_PURGE_SECONDS", "3600"))
+REMEMBER_TOKEN_PURGE_BATCH = int(os.getenv("REMEMBER_TOKEN_PURGE_BATCH", "1000"))
+
+
+@dataclass(frozen=True)
+class RememberTokenInfo:
+    id: int
+    user_id: int
+    token_hash: str
+    expires_at: datetime
+
+
+_validated = TTLCache(maxsize=REMEMBER_TOKEN_CACHE_SIZE, ttl=REMEMBER_TOKEN_CACHE_TTL)
+
+_last_used_lock = threading.Lock()
+_last_used: Dict[int, datetime] = {}
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def validate_remember_token(db: Session, raw_token: str) -> Optional[RememberTokenInfo]:
+    """Token válido e não expirado -> info; caso contrário None. Registra o uso."""
+    token_hash = hash_token(raw_token)
+    now = datetime.utcnow()
+
+    info = _validated.get(token_hash)
+    if info is None:
+        obj = db.query(models.RememberToken).filter_by(token_hash=token_hash).first()
+        if not obj:
+            return None
+        info = RememberTokenInfo(
+            id=obj.id,
+            user_id=obj.user_id,
+            token_hash=obj.token_hash,
+            expires_at=_as_naive_utc(obj.expires_at),
+        )
+        remaining = (info.expires_at - now).total_seconds()
+        if remaining > 0:
+            _validated.set(token_hash, info, ttl=min(REMEMBER_TOKEN_CACHE_TTL, remaining))
+
+    if info.expires_at <= now:
+        _validated.pop(token_hash)
+        return None
+
+    with _last_used_lock:
+        _last_used[info.id] = now
+    return info
+
+
+def invalidate_remember_token(token_hash: str) -> None:
+    _validated.pop(token_hash)
+
+
+def invalidate_user_remember_tokens(user_id: int) -> None:
+    _validated.discard_where(lambda _, info: info.user_id == user_id)
+
+
+def flush_last_used(db: Optional[Session] = None) -> int:
+    """
+    Grava os last_used_at pendentes num único UPDATE em lote (executemany por PK).
+    Tokens removidos nesse meio tempo simplesmente não casam nenhuma linha.
+    """
+    with _last_used_lock:
+        if not _last_used:
+            return 0
+        pending = [{"token_id": token_id, "used_at": at} for token_id, at in _last_used.items()]
+        _last_used.clear()
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        table = models.RememberToken.__table__
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("token_id"))
+            .values(last_used_at=bindparam("used_at")),
+            pending,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        # devolve ao buffer sem sobrescrever usos mais recentes
+        with _last_used_lock:
+            for row in pending:
+                _last_used.setdefault(row["token_id"], row["used_at"])
+        raise
+    finally:
+        if own_session:
+            db.close()
+    return len(pending)
+
+
+def remember_token_cache_stats() -> dict:
+    stats = _validated.stats()
+    with _last_used_lock:
+        stats["pending_last_used"] = len(_last_used)
+    return stats
@@ -1,15 +1,21 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from .. import schemas, models, crud, auth
 from ..database import get_db
+from ..principals import get_principal
+from ..remember_tokens import validate_remember_token
+from app.utils.security import token_expiration
 from ..mail import (
-    send_confirmation_email,
+    queue_confirmation_email,
     get_dev_confirmations,
+    get_dev_confirmation,
     pop_dev_confirmation,
     ENABLE_DEV_EMAIL_ENDPOINTS,
     DISABLE_EMAILS,
@@ -17,26 +23,34 @@ from ..mail import (
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+REMEMBER_COOKIE_NAME = "remember"
+REMEMBER_DAYS = int(os.getenv("REMEMBER_TOKEN_DAYS", "30"))
+REMEMBER_MAX_AGE = REMEMBER_DAYS * 24 * 60 * 60
+REMEMBER_COOKIE_SECURE = os.getenv("REMEMBER_COOKIE_SECURE", "False").lower() in ("1", "true", "yes")
+
 
 @router.post("/register")
 async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email já registrado.")
 
     new_user = models.User(
         name=user.name,
         email=user.email,
-        hashed_password=auth.get_password_hash(user.password),
+        hashed_password=await auth.aget_password_hash(user.password),
         is_active=False,
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
 
-    token = auth.create_confirmation_token(new_user.email)
+    def _persist() -> str:
+        # usuário e e-mail de confirmação (outbox) na mesma transação
+        db.add(new_user)
+        confirmation_url = queue_confirmation_email(db, new_user.email)
+        db.commit()
+        db.refresh(new_user)
+        return confirmation_url
 
-    confirmation_url = await send_confirmation_email(new_user.email, token)
+    confirmation_url = await run_in_threadpool(_persist)
 
     return {
         "message": "Conta criada com sucesso! Use o link abaixo para confirmar seu e-mail.",
@@ -45,12 +59,13 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
-    background_tasks: BackgroundTasks,
+async def login(
+    request: Request,
+    response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.aauthenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -59,20 +74,89 @@ def login(
         )
 
     if not getattr(user, "is_active", False):
-        token = auth.create_confirmation_token(user.email)
-        background_tasks.add_task(send_confirmation_email, user.email, token)
+        await run_in_threadpool(_queue_confirmation, db, user.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Account is not active. Confirmation email sent.",
         )
 
     access_token_expires = timedelta(minutes=int(auth.ACCESS_TOKEN_EXPIRE_MINUTES))
-    access_token = auth.create_access_token(
-        subject=user.email, expires_delta=access_token_expires
+    access_token = auth.create_user_access_token(user, expires_delta=access_token_expires)
+
+    # ?remember=true: cookie de longa duração para renovar o access token em /auth/refresh
+    if request.query_params.get("remember") == "true":
+        raw_token = auth.generate_raw_token()
+        await run_in_threadpool(
+            crud.create_remember_token,
+            db,
+            user,
+            raw_token,
+            token_expiration(minutes=REMEMBER_DAYS * 24 * 60),
+            request.headers.get("user-agent"),
+            request.client.host if request.client else None,
+        )
+        _set_remember_cookie(response, raw_token)
+
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+def _set_remember_cookie(response: Response, raw_token: str) -> None:
+    response.set_cookie(
+        key=REMEMBER_COOKIE_NAME,
+        value=raw_token,
+        max_age=REMEMBER_MAX_AGE,
+        httponly=True,
+        secure=REMEMBER_COOKIE_SECURE,
+        samesite="lax",
+        path="/auth",
     )
+
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh(
+    db: Session = Depends(get_db),
+    remember_cookie: Optional[str] = Cookie(default=None, alias=REMEMBER_COOKIE_NAME),
+):
+    """Novo access token a partir do cookie de remember-me (validação com cache, ver app.remember_tokens)."""
+    info = validate_remember_token(db, remember_cookie) if remember_cookie else None
+    user = get_principal(db, info.user_id) if info else None
+    if not user or not user.is_active:
+        # resposta própria (e não HTTPException): o Response injetado é descartado
+        # quando há exceção, e o cookie inválido precisa ser apagado no cliente
+        rejected = JSONResponse(
+            {"detail": "Invalid or expired remember token"},
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        rejected.delete_cookie(
+            key=REMEMBER_COOKIE_NAME, path="/auth", secure=REMEMBER_COOKIE_SECURE, httponly=True, samesite="lax"
+        )
+        return rejected
+    access_token_expires = timedelta(minutes=int(auth.ACCESS_TOKEN_EXPIRE_MINUTES))
+    access_token = auth.create_user_access_token(user, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/logout")
+def logout(
+    response: Response,
+    db: Session = Depends(get_db),
+    remember_cookie: Optional[str] = Cookie(default=None, alias=REMEMBER_COOKIE_NAME),
+):
+    if remember_cookie:
+        token_obj = crud.get_remember_token_by_raw(db, remember_cookie)
+        if token_obj:
+            crud.revoke_remember_token(db, token_obj)
+    response.delete_cookie(key=REMEMBER_COOKIE_NAME, path="/auth")
+    return {"message": "Logout realizado com sucesso"}
+
+
+def _queue_confirmation(db: Session, email: str) -> str:
+    confirmation_url = queue_confirmation_email(db, email)
+    db.commit()
+    return confirmation_url
+
+
 @router.get("/confirm")
 def confirm_email(token: str, db: Session = Depends(get_db)):
     email = auth.verify_confirmation_token(token)
@@ -113,7 +197,7 @@ def confirmed(status: str = "success"):
 
 
 @router.post("/resend-confirmation")
-def resend_confirmation(payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def resend_confirmation(payload: dict, db: Session = Depends(get_db)):
     email = payload.get("email")
     if not email:
         raise HTTPException(status_code=400, detail="Email required")
@@ -124,8 +208,7 @@ def resend_confirmation(payload: dict, background_tasks: BackgroundTasks, db: Se
     if user.is_active:
         return {"message": "Account already active"}
 
-    token = auth.create_confirmation_token(user.email)
-    background_tasks.add_task(send_confirmation_email, user.email, token)
+    _queue_confirmation(db, user.email)
     return {"message": "Confirmation email sent"}
 
 
@@ -141,7 +224,7 @@ def dev_list_confirmations():
 def dev_get_confirmation(email: str):
     if not (DISABLE_EMAILS or ENABLE_DEV_EMAIL_ENDPOINTS):
         raise HTTPException(status_code=404, detail="Not found")
-    conf = get_dev_confirmations().get(email)
+    conf = get_dev_confirmation(email)
     if not conf:
         raise HTTPException(status_code=404, detail="Confirmation not found")
     return conf
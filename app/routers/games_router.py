@@ -1,29 +1,27 @@
-import re
-import html as _html
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Request, Response
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy import func
 from app.database import get_db
 from app import crud, schemas, models
+from app.serializers import (
+    json_response, serialize_many, parse_fields, fields_serializer, GAME_FIELDS, ALL_GAMES_FIELDS,
+)
+from app.utils.http_cache import weak_etag, etag_matches, not_modified
 from app.auth import get_current_user
+from app.principals import Principal
+from app.leaderboard import leaderboard, WINDOWS
 from app.models import Game, Review
 
 router = APIRouter(prefix="/games", tags=["games"])
 
 MAX_REVIEW_LIMIT = 500
-
-
-def _strip_html(text: str) -> str:
-    """Remove all HTML tags and decode entities from text."""
-    no_tags = re.sub(r'<[^>]+>', '', text or '')
-    return _html.unescape(no_tags).strip()
+MAX_TOP_LIMIT = 100
+GAME_FIELDS_QUERY = Query(None, description="Campos a retornar, separados por vírgula: " + ",".join(GAME_FIELDS))
+ALL_GAMES_FIELDS_QUERY = Query(None, description="Campos a retornar, separados por vírgula: " + ",".join(ALL_GAMES_FIELDS))
 
 
 def serialize_game_for_front(game: Game) -> Dict[str, Any]:
-    raw_desc = getattr(game, "description", None) or getattr(game, "summary", None) or ""
-    safe_desc = _strip_html(raw_desc)
-
     image_obj = None
     if getattr(game, "cover_url", None):
         image_obj = {"super_url": game.cover_url, "medium_url": game.cover_url, "small_url": game.cover_url}
@@ -48,7 +46,7 @@ def serialize_game_for_front(game: Game) -> Dict[str, Any]:
         "publishers": publishers,
         "genres": genres,
         "image": image_obj,
-        "description_html": safe_desc,
+        "description_html": game.description_text or "",
         "status": getattr(game, "status", None),
         "start_date": getattr(game, "start_date", None).isoformat() if getattr(game, "start_date", None) else None,
         "finish_date": getattr(game, "finish_date", None).isoformat() if getattr(game, "finish_date", None) else None,
@@ -61,20 +59,33 @@ def serialize_game_for_front(game: Game) -> Dict[str, Any]:
 
 
 @router.post("/", response_model=schemas.GameOut, status_code=status.HTTP_201_CREATED)
-def create_game(game_in: schemas.GameCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_game(game_in: schemas.GameCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     g = crud.create_game(db, current_user.id, game_in)
     return g
 
 
 @router.get("/", response_model=schemas.PaginatedGames)
-def list_my_games(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    items = crud.get_games_by_user(db, current_user.id, skip=skip, limit=limit)
+def list_my_games(skip: int = 0, limit: int = 50, fields: Optional[str] = GAME_FIELDS_QUERY,
+                  db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    selected = parse_fields(fields, GAME_FIELDS) or GAME_FIELDS
+    items = crud.get_games_by_user(db, current_user.id, skip=skip, limit=limit, fields=selected)
     total = db.query(models.Game).filter(models.Game.user_id == current_user.id).count()
-    return {"total": total, "items": items}
+    return json_response({"total": total, "items": serialize_many(fields_serializer(selected), items)})
 
 
 @router.get("/all")
-def list_all_games(db: Session = Depends(get_db)) -> List[Dict]:
+def list_all_games(request: Request, fields: Optional[str] = ALL_GAMES_FIELDS_QUERY,
+                   db: Session = Depends(get_db)) -> List[Dict]:
+    selected = parse_fields(fields, ALL_GAMES_FIELDS) or ALL_GAMES_FIELDS
+    count, max_id, max_updated = (
+        db.query(func.count(Game.id), func.max(Game.id), func.max(Game.updated_at))
+        .filter(Game.external_guid.isnot(None))
+        .one()
+    )
+    etag = weak_etag("games-all", selected, count, max_id, max_updated)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     row_number = func.row_number().over(
         partition_by=Game.external_guid,
         order_by=func.coalesce(Game.updated_at, Game.created_at).desc()
@@ -82,57 +93,84 @@ def list_all_games(db: Session = Depends(get_db)) -> List[Dict]:
 
     reviews_count = func.count(Game.id).over(partition_by=Game.external_guid).label("reviews_count")
 
+    columns = [reviews_count if f == "reviews_count" else getattr(Game, f).label(f) for f in selected]
     subq = (
-        db.query(
-            Game.external_guid.label("external_guid"),
-            Game.id.label("id"),
-            Game.name.label("name"),
-            Game.cover_url.label("cover_url"),
-            Game.description.label("description"),
-            Game.status.label("status"),
-            Game.start_date.label("start_date"),
-            Game.finish_date.label("finish_date"),
-            Game.created_at.label("created_at"),
-            Game.updated_at.label("updated_at"),
-            reviews_count,
-            row_number
-        )
+        db.query(*columns, row_number)
         .filter(Game.external_guid.isnot(None))
         .subquery()
     )
 
-    rows = db.query(subq).filter(subq.c.rn == 1).all()
-
-    result = []
-    for r in rows:
-        result.append({
-            "external_guid": r.external_guid,
-            "reviews_count": int(r.reviews_count),
-            "id": r.id,
-            "name": r.name,
-            "cover_url": r.cover_url,
-            "description": r.description,
-            "status": r.status,
-            "start_date": r.start_date.isoformat() if r.start_date else None,
-            "finish_date": r.finish_date.isoformat() if r.finish_date else None,
-            "created_at": r.created_at.isoformat() if r.created_at else None,
-            "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+    rows = db.query(*[subq.c[f] for f in selected]).filter(subq.c.rn == 1).all()
+    return json_response(serialize_many(fields_serializer(selected), rows), headers={"ETag": etag})
+
+
+@router.get("/top", response_model=schemas.GameRanking)
+def list_top_games(
+    window: str = Query("all", description="Janela do ranking: " + ", ".join(WINDOWS)),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=MAX_TOP_LIMIT),
+    min_ratings: int = Query(1, ge=1),
+    db: Session = Depends(get_db),
+):
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Unknown window '{window}'")
+    if not leaderboard.loaded:
+        leaderboard.refresh(db)
+
+    ranked = leaderboard.top(window, offset=skip, limit=limit, min_ratings=min_ratings)
+    game_ids = [game_id for game_id, _, _, _ in ranked]
+    games = {}
+    if game_ids:
+        rows = (
+            db.query(Game)
+            .options(load_only(Game.id, Game.name, Game.external_guid, Game.cover_url))
+            .filter(Game.id.in_(game_ids))
+            .all()
+        )
+        games = {g.id: g for g in rows}
+
+    items = []
+    for position, (game_id, score, n, total) in enumerate(ranked, start=skip + 1):
+        g = games.get(game_id)
+        if g is None:
+            continue
+        items.append({
+            "rank": position,
+            "id": g.id,
+            "name": g.name,
+            "external_guid": g.external_guid,
+            "cover_url": g.cover_url,
+            "score": round(score, 4),
+            "avg_rating": round(total / n, 2) if n else None,
+            "ratings_count": n,
         })
-
-    return result
+    return {"window": window, "refreshed_at": leaderboard.refreshed_at, "items": items}
 
 
 @router.get("/{game_id}")
-def get_game_public(game_id: int, db: Session = Depends(get_db)):
+def get_game_public(game_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    probe = (
+        db.query(Game.updated_at, models.GameStats.version)
+        .outerjoin(models.GameStats, models.GameStats.game_id == Game.id)
+        .filter(Game.id == game_id)
+        .first()
+    )
+    if not probe:
+        raise HTTPException(status_code=404, detail="Game not found")
+    etag = weak_etag("game", game_id, probe[0], probe[1])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     g = db.get(models.Game, game_id)
     if not g:
         raise HTTPException(status_code=404, detail="Game not found")
     payload = serialize_game_for_front(g)
+    response.headers["ETag"] = etag
     return payload
 
 
 @router.get("/{game_id}/me")
-def get_game_with_my_review(game_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_game_with_my_review(game_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     g = db.get(models.Game, game_id)
     if not g:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -155,7 +193,7 @@ def get_game_with_my_review(game_id: int, db: Session = Depends(get_db), current
 
 
 @router.put("/{game_id}", response_model=schemas.GameOut)
-def update_game(game_id: int, payload: schemas.GameUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_game(game_id: int, payload: schemas.GameUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     g = db.get(models.Game, game_id)
     if not g:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -166,7 +204,7 @@ def update_game(game_id: int, payload: schemas.GameUpdate, db: Session = Depends
 
 
 @router.delete("/{game_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_game(game_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_game(game_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     g = db.get(models.Game, game_id)
     if not g:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -202,7 +240,7 @@ def list_reviews(game_id: int, public_only: bool = True, skip: int = 0, limit: i
 
 
 @router.post("/upsert-status", response_model=Dict)
-def upsert_game_status(payload: Dict, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def upsert_game_status(payload: Dict, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     game_id = payload.get("id")
     external_guid = payload.get("external_guid")
     status_val = payload.get("status")
@@ -240,7 +278,7 @@ def upsert_game_status(payload: Dict, db: Session = Depends(get_db), current_use
 
 @router.post("/{game_id}/sessions", response_model=schemas.UserGameOut, status_code=status.HTTP_201_CREATED)
 def create_session_for_game(game_id: int, payload: schemas.UserGameCreate = Body(...), db: Session = Depends(get_db),
-                            current_user: models.User = Depends(get_current_user)):
+                            current_user: Principal = Depends(get_current_user)):
     g = db.get(models.Game, game_id)
     if not g:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -259,7 +297,7 @@ def list_sessions_for_game(game_id: int, skip: int = 0, limit: int = 100, db: Se
 
 
 @router.get("/sessions/{user_game_id}/coplayers", response_model=List[schemas.ReviewUser])
-def get_coplayers_for_session(user_game_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_coplayers_for_session(user_game_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     users = crud.find_coplayers_for_user_game(db, user_game_id)
     out = []
     for u in users:
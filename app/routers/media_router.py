@@ -0,0 +1,29 @@
+import re
+
+from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import RedirectResponse
+
+from ..storage_backends import get_backend
+
+# aa/<sha256>.<ext> ou aa/<sha256>_<tamanho>.webp (ver app.storage / app.avatar_variants)
+_MEDIA_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}(?:_\d+)?\.(?:jpg|png|webp)$")
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+
+@router.get("/{key:path}", include_in_schema=False)
+def read_media(key: str = Path(...)):
+    """
+    Redireciona para o objeto no backend de storage (URL pré-assinada no S3),
+    assim a imagem é baixada direto do bucket sem passar pelo worker.
+    """
+    if not _MEDIA_KEY_RE.match(key):
+        raise HTTPException(status_code=404, detail="Not Found")
+    backend = get_backend()
+    # o redirect pode ser cacheado enquanto a URL pré-assinada ainda vale
+    max_age = max(0, getattr(backend, "presign_ttl", 3600) // 2 - 60)
+    return RedirectResponse(
+        backend.read_url(key),
+        status_code=307,
+        headers={"Cache-Control": f"private, max-age={max_age}"},
+    )
@@ -0,0 +1,36 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security.api_key import APIKeyHeader
+
+from ..auth import jwt_cache_stats
+from ..coplayers import coplayer_index
+from ..friend_graph import friend_graph
+from ..hashing import hashing_metrics
+from ..mail import mail_worker
+from ..remember_tokens import remember_token_cache_stats
+
+METRICS_API_KEY = os.getenv("METRICS_API_KEY")
+
+_metrics_key_header = APIKeyHeader(name="X-Metrics-Key", auto_error=False)
+
+
+def check_metrics_key(api_key: Optional[str] = Depends(_metrics_key_header)):
+    if METRICS_API_KEY and api_key != METRICS_API_KEY:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"], dependencies=[Depends(check_metrics_key)])
+
+
+@router.get("")
+def read_metrics():
+    return {
+        "password_hashing": hashing_metrics(),
+        "remember_tokens": remember_token_cache_stats(),
+        "jwt_cache": jwt_cache_stats(),
+        "friend_graph": friend_graph.stats(),
+        "coplayer_index": coplayer_index.stats(),
+        "mail": mail_worker.metrics(),
+    }
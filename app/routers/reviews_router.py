@@ -1,18 +1,39 @@
 from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from sqlalchemy.orm import Session, joinedload, load_only
 from sqlalchemy import func, desc
 from app.database import get_db
-from app import models, schemas
-from app.auth import get_current_user
+from app import crud, models, schemas
+from app.auth import get_current_user, get_current_user_id
+from app.serializers import (
+    json_response, serialize_many, parse_fields, review_serializer,
+    REVIEW_FIELDS, REVIEW_RELATIONS, REVIEW_USER_FIELDS, REVIEW_GAME_FIELDS,
+)
+from app.utils.http_cache import weak_etag, etag_matches, not_modified
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
 
 MAX_LIMIT = 500
+REVIEW_LIST_FIELDS = REVIEW_FIELDS + REVIEW_RELATIONS
+FIELDS_QUERY = Query(None, description="Campos a retornar, separados por vírgula: " + ",".join(REVIEW_LIST_FIELDS))
+
+
+def _project_reviews(q, fields):
+    """Restringe colunas e joins da listagem ao que ?fields= pediu (None = payload completo)."""
+    selected = fields or REVIEW_LIST_FIELDS
+    columns = [getattr(models.Review, f) for f in selected if f not in REVIEW_RELATIONS]
+    q = q.options(load_only(models.Review.id, *columns))
+    if "user" in selected:
+        q = q.options(joinedload(models.Review.user).load_only(*[getattr(models.User, f) for f in REVIEW_USER_FIELDS]))
+    if "game" in selected:
+        q = q.options(joinedload(models.Review.game).load_only(*[getattr(models.Game, f) for f in REVIEW_GAME_FIELDS]))
+    return q
 
 
 @router.get("/", response_model=schemas.PaginatedReviews)
-def list_public_reviews(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+def list_public_reviews(request: Request, skip: int = 0, limit: int = 50, fields: Optional[str] = FIELDS_QUERY,
+                        db: Session = Depends(get_db)):
+    selected = parse_fields(fields, REVIEW_LIST_FIELDS)
     if skip < 0:
         skip = 0
     if limit <= 0:
@@ -21,17 +42,37 @@ def list_public_reviews(skip: int = 0, limit: int = 50, db: Session = Depends(ge
         limit = MAX_LIMIT
 
     q = db.query(models.Review).filter(models.Review.is_public == True)
-    total = q.count()
+    # user/game aninhados também entram na versão: editar o nome do usuário ou
+    # o jogo muda o payload sem tocar em reviews (as relações são N:1, o join
+    # não duplica linhas na contagem)
+    version_q = db.query(
+        func.count(models.Review.id), func.max(models.Review.id), func.max(models.Review.updated_at)
+    ).filter(models.Review.is_public == True)
+    payload_fields = selected or REVIEW_LIST_FIELDS
+    if "user" in payload_fields:
+        version_q = version_q.outerjoin(models.User, models.User.id == models.Review.user_id) \
+            .add_columns(func.max(models.User.updated_at))
+    if "game" in payload_fields:
+        version_q = version_q.outerjoin(models.Game, models.Game.id == models.Review.game_id) \
+            .add_columns(func.max(models.Game.updated_at))
+    total, *version = version_q.one()
+    etag = weak_etag("reviews-public", skip, limit, selected, total, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     items = (
-        q.options(joinedload(models.Review.user), joinedload(models.Review.game))
+        _project_reviews(q, selected)
          .order_by(models.Review.created_at.desc())
          .offset(skip).limit(limit).all()
     )
-    return {"total": total, "items": items}
+    items_out = serialize_many(review_serializer(selected), items)
+    return json_response({"total": total, "items": items_out}, headers={"ETag": etag})
 
 
 @router.get("/my", response_model=schemas.PaginatedReviews)
-def list_my_reviews(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def list_my_reviews(skip: int = 0, limit: int = 50, fields: Optional[str] = FIELDS_QUERY,
+                    db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
+    selected = parse_fields(fields, REVIEW_LIST_FIELDS)
     if skip < 0:
         skip = 0
     if limit <= 0:
@@ -39,14 +80,14 @@ def list_my_reviews(skip: int = 0, limit: int = 50, db: Session = Depends(get_db
     if limit > MAX_LIMIT:
         limit = MAX_LIMIT
 
-    q = db.query(models.Review).filter(models.Review.user_id == current_user.id)
+    q = db.query(models.Review).filter(models.Review.user_id == current_user_id)
     total = q.count()
     items = (
-        q.options(joinedload(models.Review.user), joinedload(models.Review.game))
+        _project_reviews(q, selected)
          .order_by(models.Review.created_at.desc())
          .offset(skip).limit(limit).all()
     )
-    return {"total": total, "items": items}
+    return json_response({"total": total, "items": serialize_many(review_serializer(selected), items)})
 
 
 @router.get("/me", response_model=Optional[schemas.ReviewOut])
@@ -89,6 +130,7 @@ def upsert_review(payload: schemas.ReviewUpsert, db: Session = Depends(get_db),
         raise HTTPException(status_code=400, detail="game_id or external_guid required")
 
     review = db.query(models.Review).filter_by(user_id=current_user.id, game_id=game.id).first()
+    before = crud.review_contribution(review)
     if review:
         for k, v in payload.dict(exclude_unset=True).items():
             if k in ("rating", "review_text", "is_public"):
@@ -104,6 +146,7 @@ def upsert_review(payload: schemas.ReviewUpsert, db: Session = Depends(get_db),
         )
         db.add(review)
 
+    crud.apply_review_stats(db, before, crud.review_contribution(review))
     db.commit()
     db.refresh(review)
     return review
@@ -132,6 +175,7 @@ def create_review(game_id: int, payload: schemas.ReviewCreate, db: Session = Dep
         raise HTTPException(status_code=409, detail="Review already exists")
     review = models.Review(**payload.dict(), user_id=current_user.id, game_id=game_id)
     db.add(review)
+    crud.apply_review_stats(db, None, crud.review_contribution(review))
     db.commit()
     db.refresh(review)
     return review
@@ -142,8 +186,10 @@ def update_review(review_id: int, payload: schemas.ReviewUpdate, db: Session = D
     review = db.query(models.Review).filter_by(id=review_id, user_id=current_user.id).first()
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
+    before = crud.review_contribution(review)
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(review, field, value)
+    crud.apply_review_stats(db, before, crud.review_contribution(review))
     db.commit()
     db.refresh(review)
     return review
@@ -154,8 +200,7 @@ def delete_review(review_id: int, db: Session = Depends(get_db), current_user=De
     review = db.query(models.Review).filter_by(id=review_id, user_id=current_user.id).first()
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
-    db.delete(review)
-    db.commit()
+    crud.delete_review(db, review)
     return
 
 
@@ -172,20 +217,17 @@ def list_public_reviews_grouped(
         limit = 5
     if reviews_per_game_limit <= 0:
         reviews_per_game_limit = 200
-    total_groups = db.query(func.count(func.distinct(models.Review.game_id))).filter(models.Review.is_public == True).scalar() or 0
+    stats = models.GameStats
+    total_groups = db.query(func.count(stats.game_id)).filter(stats.reviews_count > 0).scalar() or 0
 
     if total_groups == 0:
         return {"total": 0, "items": []}
 
+    avg_rating = (stats.rating_sum / func.nullif(stats.ratings_count, 0)).label("avg_rating")
     group_q = (
-        db.query(
-            models.Review.game_id,
-            func.count(models.Review.id).label("reviews_count"),
-            func.avg(models.Review.rating).label("avg_rating"),
-        )
-        .filter(models.Review.is_public == True)
-        .group_by(models.Review.game_id)
-        .order_by(desc("reviews_count"), desc("avg_rating"))
+        db.query(stats.game_id, stats.reviews_count, avg_rating)
+        .filter(stats.reviews_count > 0)
+        .order_by(desc(stats.reviews_count), desc("avg_rating"))
         .offset(skip)
         .limit(limit)
     )
@@ -1,34 +1,39 @@
-import os
-from uuid import uuid4
 from typing import Any, Optional, Dict, List
+from datetime import datetime
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
     status,
     UploadFile,
-    File,
     Request,
     Body,
     Path,
     Response,
     Query,
+    BackgroundTasks,
 )
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import logging
 from .. import schemas, crud, auth, models
 from ..database import get_db
+from ..friend_graph import queue_user_removed
+from ..principals import invalidate_principal
+from ..remember_tokens import invalidate_user_remember_tokens
+from ..serializers import json_response, serialize_game, serialize_many, parse_fields, USER_SEARCH_FIELDS
+from ..utils.http_cache import weak_etag, etag_matches, not_modified
+from ..utils.uploads import read_single_upload
+from .. import storage
+from ..avatar_variants import generate_avatar_variants
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-AVATAR_DIR = "static/avatars"
-ALLOWED_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
 MAX_AVATAR_SIZE = 2 * 1024 * 1024  # 2 MB
 
-os.makedirs(AVATAR_DIR, exist_ok=True)
-
 
 def _user_to_dict(user: models.User, games_count: Optional[int]) -> dict:
     gc = int(games_count or 0)
@@ -48,6 +53,7 @@ def _user_to_dict(user: models.User, games_count: Optional[int]) -> dict:
             "name": getattr(user, "name", None),
             "bio": getattr(user, "bio", None),
             "avatar_url": getattr(user, "avatar_url", None),
+            "avatar_variants": getattr(user, "avatar_variants", None),
             "is_active": getattr(user, "is_active", True),
             "created_at": getattr(user, "created_at", None),
         }
@@ -61,7 +67,7 @@ def _user_to_dict(user: models.User, games_count: Optional[int]) -> dict:
     status_code=status.HTTP_201_CREATED,
     operation_id="users_create_user_unique_v2"
 )
-def users_create(
+async def users_create(
     user_in: schemas.UserCreate,
     db: Session = Depends(get_db),
 ) -> Any:
@@ -74,15 +80,19 @@ def users_create(
     if not email:
         raise HTTPException(status_code=400, detail="Email é obrigatório")
 
-    existing = db.query(models.User).filter(models.User.email == email).first()
+    existing = await run_in_threadpool(crud.get_user_by_email, db, email)
     if existing:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
 
     pwd = payload.pop("password", None)
     if not pwd:
         raise HTTPException(status_code=400, detail="Senha é obrigatória")
-    payload["hashed_password"] = auth.get_password_hash(pwd)
+    payload["hashed_password"] = await auth.aget_password_hash(pwd)
+
+    return await run_in_threadpool(_insert_user, db, payload)
+
 
+def _insert_user(db: Session, payload: Dict[str, Any]) -> dict:
     try:
         u = models.User(**payload)
         db.add(u)
@@ -126,44 +136,57 @@ def users_get_by_id(
     response_model=schemas.UserOut,
     operation_id="users_update_user_by_id_unique_v2"
 )
-def users_update_by_id(
+async def users_update_by_id(
     user_id: int,
     user_in: schemas.UserUpdate,
     db: Session = Depends(get_db),
 ) -> Any:
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-
     try:
         payload = user_in.model_dump(exclude_unset=True) if hasattr(user_in, "model_dump") else user_in.dict(exclude_unset=True)
     except Exception:
         payload = dict(user_in) if not isinstance(user_in, dict) else user_in
 
-    if "email" in payload:
+    user = await run_in_threadpool(_load_user_for_update, db, user_id, payload.get("email"))
+
+    if "password" in payload:
+        pwd = payload.pop("password")
+        if pwd:
+            payload["hashed_password"] = await auth.aget_password_hash(pwd)
+
+    return await run_in_threadpool(_apply_user_update, db, user, payload)
+
+
+def _load_user_for_update(db: Session, user_id: int, email: Optional[str]) -> models.User:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+
+    if email is not None:
         other = db.query(models.User).filter(
-            models.User.email == payload["email"],
+            models.User.email == email,
             models.User.id != user_id
         ).first()
         if other:
             raise HTTPException(status_code=400, detail="Email já está em uso")
+    return user
 
-    if "password" in payload:
-        pwd = payload.pop("password")
-        if pwd:
-            payload["hashed_password"] = auth.get_password_hash(pwd)
-
-    for k, v in payload.items():
-        if hasattr(user, k):
-            setattr(user, k, v)
 
+def _apply_user_update(db: Session, user: models.User, payload: Dict[str, Any]) -> dict:
     try:
+        for k, v in payload.items():
+            if k == "avatar_url":
+                # passa pelo crud para manter media_blobs.ref_count e avatar_variants coerentes
+                crud.change_user_avatar(db, user, v)
+            elif k != "avatar_variants" and hasattr(user, k):
+                setattr(user, k, v)
+        user.updated_at = datetime.utcnow()
         db.add(user)
         db.commit()
         db.refresh(user)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Erro ao atualizar usuário") from e
+    invalidate_principal(user.id)
 
     try:
         games_count = db.query(models.Game).filter(models.Game.user_id == user.id).count()
@@ -187,11 +210,18 @@ def users_delete_by_id(
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     try:
+        crud.discount_user_reviews_from_stats(db, user.id)
+        avatar_sha = storage.blob_sha_from_url(user.avatar_url)
+        if avatar_sha:
+            crud.release_media_blob(db, avatar_sha)
+        queue_user_removed(db, user.id)
         db.delete(user)
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Erro ao remover usuário") from e
+    invalidate_principal(user_id)
+    invalidate_user_remember_tokens(user_id)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -199,15 +229,34 @@ def users_delete_by_id(
 
 @router.get("/me", response_model=schemas.UserOut)
 def read_users_me(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
+    # sonda de versão no banco: o Principal vem de um cache por worker e pode estar
+    # defasado em relação a escritas feitas em outro worker
+    games_count_sq = (
+        select(func.count(models.Game.id)).where(models.Game.user_id == models.User.id).scalar_subquery()
+    )
+    probe = (
+        db.query(models.User.updated_at, games_count_sq)
+        .filter(models.User.id == current_user.id)
+        .first()
+    )
+    if not probe:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    etag = weak_etag("user-me", current_user.id, probe[0], probe[1])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     data = crud.get_user_profile(db, current_user.id)
     if not data:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     user = data["user"]
     games_count = data["games_count"]
+    response.headers["ETag"] = etag
     return _user_to_dict(user, games_count)
 
 
@@ -215,7 +264,7 @@ def read_users_me(
 def update_users_me(
     user_in: schemas.UserUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     updated = crud.update_user(db, current_user.id, user_in)
     if not updated:
@@ -234,27 +283,13 @@ def update_users_me(
 def patch_users_me(
     payload: Dict[str, Any] = Body(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     # remover avatar (quando enviado como null)
     if "avatar_url" in payload and payload["avatar_url"] is None:
-        try:
-            old = getattr(current_user, "avatar_url", None)
-            if old and old.startswith("/static/"):
-                stored_path = old.lstrip("/")
-                if os.path.exists(stored_path):
-                    os.remove(stored_path)
-        except Exception:
-            pass
-
-        if hasattr(crud, "set_user_avatar"):
-            user = crud.set_user_avatar(db, current_user.id, None)
-        else:
-            current_user.avatar_url = None
-            db.add(current_user)
-            db.commit()
-            db.refresh(current_user)
-            user = current_user
+        _remove_old_avatar(getattr(current_user, "avatar_url", None))
+
+        crud.set_user_avatar(db, current_user.id, None)
 
         data = crud.get_user_profile(db, current_user.id)
         if not data:
@@ -275,120 +310,93 @@ def patch_users_me(
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     payload: schemas.ChangePassword,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
-    if not auth.verify_password(payload.old_password, current_user.hashed_password):
+    if not await auth.averify_password(payload.old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Senha antiga incorreta"
         )
 
-    hashed = auth.get_password_hash(payload.new_password)
-    updated = crud.set_user_password(db, current_user.id, hashed)
+    hashed = await auth.aget_password_hash(payload.new_password)
+    updated = await run_in_threadpool(crud.set_user_password, db, current_user.id, hashed)
     if not updated:
         raise HTTPException(status_code=500, detail="Erro ao atualizar senha")
-    return {"ok": True}
-
-
-def _save_avatar_file(contents: bytes, content_type: str) -> str:
-    if content_type not in ALLOWED_TYPES:
-        raise HTTPException(status_code=400, detail="Tipo de imagem não suportado")
+    # a troca de senha invalida os tokens anteriores; devolve um novo para esta sessão
+    user = await run_in_threadpool(crud.get_user_by_id, db, current_user.id)
+    return {"ok": True, "access_token": auth.create_user_access_token(user), "token_type": "bearer"}
 
-    if len(contents) > MAX_AVATAR_SIZE:
-        raise HTTPException(status_code=400, detail="Arquivo muito grande (máx 2MB)")
-
-    ext = ALLOWED_TYPES[content_type]
-    filename = f"{uuid4().hex}{ext}"
-    os.makedirs(AVATAR_DIR, exist_ok=True)
-    path = os.path.join(AVATAR_DIR, filename)
-
-    try:
-        with open(path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Falha ao salvar arquivo") from e
 
-    return f"/{AVATAR_DIR}/{filename}"
+def _remove_old_avatar(old: Optional[str]) -> None:
+    # só arquivos legados (nome uuid); blobs do store são liberados por contagem de referências
+    storage.remove_local_file_from_url(old)
 
 
-@router.post("/me/avatar")
+@router.post(
+    "/me/avatar",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_avatar(
     request: Request,
-    file: UploadFile = File(...),
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
-    content_type = getattr(file, "content_type", None)
-    if not content_type:
-        raise HTTPException(status_code=400, detail="Tipo de conteúdo ausente")
-
-    contents = await file.read()
-    public_path = _save_avatar_file(contents, content_type)
-
+    # corpo lido em streaming: aborta com 413 assim que passa de MAX_AVATAR_SIZE
+    file = await read_single_upload(request, "file", MAX_AVATAR_SIZE)
     try:
-        old = getattr(current_user, "avatar_url", None)
-        if old and old.startswith("/static/"):
-            stored_path = old.lstrip("/")
-            if os.path.exists(stored_path):
-                os.remove(stored_path)
-    except Exception:
-        pass
+        blob = await run_in_threadpool(storage.store_image, file.file, MAX_AVATAR_SIZE)
+    finally:
+        await file.close()
 
-    if hasattr(crud, "set_user_avatar"):
-        user = crud.set_user_avatar(db, current_user.id, public_path)
-    else:
-        current_user.avatar_url = public_path
-        db.add(current_user)
-        db.commit()
-        db.refresh(current_user)
-        user = current_user
+    await run_in_threadpool(_remove_old_avatar, getattr(current_user, "avatar_url", None))
 
     base = str(request.base_url).rstrip("/")
-    full_url = f"{base}{public_path}"
-
-    data = crud.get_user_profile(db, current_user.id)
-    if not data:
-        user_out = _user_to_dict(user, 0)
-    else:
-        user_out = _user_to_dict(data["user"], data["games_count"])
+    full_url = f"{base}{blob.url}"
 
+    user_out = await run_in_threadpool(_set_avatar_and_profile, db, current_user.id, blob)
+    # miniaturas em background (pool de processos); o original já pode ser usado
+    background_tasks.add_task(generate_avatar_variants, current_user.id, blob)
     return {"avatar_url": full_url, "user": user_out}
 
 
+def _set_avatar_and_profile(db: Session, user_id: int, blob: storage.StoredBlob) -> dict:
+    user = crud.set_user_avatar(db, user_id, blob.url, blob=blob)
+    data = crud.get_user_profile(db, user_id)
+    if not data:
+        return _user_to_dict(user, 0)
+    return _user_to_dict(data["user"], data["games_count"])
+
+
 @router.get("/me/games")
 def read_my_games(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     games = db.query(models.Game).filter(models.Game.user_id == current_user.id).all()
-
-    out = []
-    for g in games:
-        out.append(
-            {
-                "id": g.id,
-                "name": g.name,
-                "external_guid": g.external_guid,
-                "cover_url": g.cover_url,
-                "description": g.description,
-                "user_id": g.user_id,
-                "status": g.status,
-                "start_date": g.start_date.isoformat() if g.start_date else None,
-                "finish_date": g.finish_date.isoformat() if g.finish_date else None,
-                "created_at": g.created_at.isoformat() if g.created_at else None,
-                "updated_at": g.updated_at.isoformat() if g.updated_at else None,
-            }
-        )
-    return out
+    return json_response(serialize_many(serialize_game, games))
 
 
 @router.get("/{user_id}/games")
 def read_user_games(
     user_id: int = Path(..., description="ID do usuário"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     if current_user.id != user_id:
         raise HTTPException(
@@ -396,49 +404,35 @@ def read_user_games(
         )
 
     games = db.query(models.Game).filter(models.Game.user_id == user_id).all()
-
-    out = []
-    for g in games:
-        out.append(
-            {
-                "id": g.id,
-                "name": g.name,
-                "external_guid": g.external_guid,
-                "cover_url": g.cover_url,
-                "description": g.description,
-                "user_id": g.user_id,
-                "status": g.status,
-                "start_date": g.start_date.isoformat() if g.start_date else None,
-                "finish_date": g.finish_date.isoformat() if g.finish_date else None,
-                "created_at": g.created_at.isoformat() if g.created_at else None,
-                "updated_at": g.updated_at.isoformat() if g.updated_at else None,
-            }
-        )
-    return out
+    return json_response(serialize_many(serialize_game, games))
 
 @router.post("/me/sessions", response_model=schemas.UserGameOut, status_code=status.HTTP_201_CREATED)
-def create_my_session(payload: schemas.UserGameCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def create_my_session(payload: schemas.UserGameCreate, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     ug = crud.create_user_game(db, current_user.id, payload.game_id, started_at=payload.started_at, finished_at=payload.finished_at)
     return ug
 
 
 @router.get("/me/sessions", response_model=List[schemas.UserGameOut])
-def list_my_sessions(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    items = crud.get_user_games_by_user(db, current_user.id, skip=0, limit=200)
+def list_my_sessions(db: Session = Depends(get_db), current_user_id: int = Depends(auth.get_current_user_id)):
+    items = crud.get_user_games_by_user(db, current_user_id, skip=0, limit=200)
     return items
 
 
 @router.put("/me/sessions/{session_id}", response_model=schemas.UserGameOut)
-def update_my_session(session_id: int, payload: schemas.UserGameUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def update_my_session(session_id: int, payload: schemas.UserGameUpdate, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     ug = crud.get_user_game(db, session_id)
     if not ug or ug.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
-    updated = crud.update_user_game(db, ug, payload.model_dump(exclude_unset=True) if hasattr(payload, "model_dump") else payload.dict(exclude_unset=True))
+    data = payload.model_dump(exclude_unset=True) if hasattr(payload, "model_dump") else payload.dict(exclude_unset=True)
+    # update parcial: confere o intervalo resultante, não só o que veio no payload
+    if schemas.session_bounds_inverted(data.get("started_at") or ug.started_at, data.get("finished_at") or ug.finished_at):
+        raise HTTPException(status_code=422, detail="finished_at não pode ser anterior a started_at")
+    updated = crud.update_user_game(db, ug, data)
     return updated
 
 
 @router.delete("/me/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_my_session(session_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def delete_my_session(session_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     ug = crud.get_user_game(db, session_id)
     if not ug or ug.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
@@ -447,7 +441,7 @@ def delete_my_session(session_id: int, db: Session = Depends(get_db), current_us
 
 
 @router.get("/sessions/{session_id}/coplayers", response_model=List[schemas.ReviewUser])
-def get_coplayers_for_my_session(session_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def get_coplayers_for_my_session(session_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     ug = crud.get_user_game(db, session_id)
     if not ug or ug.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
@@ -458,7 +452,7 @@ def get_coplayers_for_my_session(session_id: int, db: Session = Depends(get_db),
     return out
 
 @router.post("/me/friends", response_model=schemas.FriendshipOut, status_code=status.HTTP_201_CREATED)
-def send_friend_request(payload: schemas.FriendshipCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def send_friend_request(payload: schemas.FriendshipCreate, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if payload.friend_id == current_user.id:
         raise HTTPException(status_code=400, detail="Não é possível enviar pedido para si mesmo")
     f = crud.create_friend_request(db, current_user.id, payload.friend_id, message=payload.message)
@@ -468,16 +462,35 @@ def send_friend_request(payload: schemas.FriendshipCreate, db: Session = Depends
 
 
 @router.get("/me/friends", response_model=List[schemas.ReviewUser])
-def list_my_friends(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    friends = crud.get_friends_for_user(db, current_user.id)
+def list_my_friends(db: Session = Depends(get_db), current_user_id: int = Depends(auth.get_current_user_id)):
+    friends = crud.get_friends_for_user(db, current_user_id)
     out = []
     for u in friends:
         out.append(schemas.ReviewUser.model_validate(u) if hasattr(schemas.ReviewUser, "model_validate") else schemas.ReviewUser.from_orm(u))
     return out
 
 
+@router.get("/me/friends/suggestions", response_model=List[schemas.FriendSuggestionOut])
+def list_friend_suggestions(
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+) -> Any:
+    # pré-calculadas por app.jobs.compute_friend_suggestions
+    rows = crud.get_friend_suggestions(db, current_user_id, limit=limit)
+    return [
+        schemas.FriendSuggestionOut(
+            user=schemas.ReviewUser.model_validate(r.suggested),
+            mutual_friends=r.mutual_friends,
+            shared_games=r.shared_games,
+            score=r.score,
+        )
+        for r in rows
+    ]
+
+
 @router.post("/me/friends/{request_id}/accept", response_model=schemas.FriendshipOut)
-def accept_friend(request_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def accept_friend(request_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     req = crud.get_friend_request(db, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
@@ -490,7 +503,7 @@ def accept_friend(request_id: int, db: Session = Depends(get_db), current_user:
 
 
 @router.post("/me/friends/{request_id}/reject", response_model=schemas.FriendshipOut)
-def reject_friend(request_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def reject_friend(request_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     req = crud.get_friend_request(db, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
@@ -503,10 +516,12 @@ def reject_friend(request_id: int, db: Session = Depends(get_db), current_user:
 
 
 @router.post("/me/friends/{user_id}/block", response_model=schemas.FriendshipOut)
-def block_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def block_user(user_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Não é possível bloquear a si mesmo")
     f = crud.block_user(db, current_user.id, user_id)
+    if not f:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
     return schemas.FriendshipOut.model_validate(f) if hasattr(schemas.FriendshipOut, "model_validate") else schemas.FriendshipOut.from_orm(f)
 
 
@@ -515,33 +530,26 @@ def search_users(
     q: str = Query(..., description="Termo de busca: nome ou email"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
+    fields: Optional[str] = Query(None, description="Campos a retornar, separados por vírgula: " + ",".join(USER_SEARCH_FIELDS)),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
+    selected = parse_fields(fields, USER_SEARCH_FIELDS)
     try:
-        res = crud.search_users(db, q, page=page, page_size=page_size)
+        res = crud.search_users(db, q, page=page, page_size=page_size,
+                                exclude_user_id=current_user.id, fields=selected)
     except Exception as e:
         logger.exception("Erro ao executar search_users: %s", e)
         raise HTTPException(status_code=500, detail="Erro na busca de usuários")
 
-    if isinstance(res, dict) and "items" in res:
-        items = res["items"]
-        filtered = [u for u in items if (getattr(u, "id", None) or u.get("id")) != current_user.id]
-        total = res.get("total", len(items))
-        adjusted_total = total - (len(items) - len(filtered))
-        return {"items": filtered, "total": max(0, adjusted_total)}
-    elif isinstance(res, list):
-        filtered = [u for u in res if (getattr(u, "id", None) or (u.get("id") if isinstance(u, dict) else None)) != current_user.id]
-        return filtered
-    else:
-        return res
+    return json_response({"items": res["items"], "total": res["total"]})
 
 @router.get("/me/friends/requests", response_model=List[schemas.FriendshipIncomingOut])
 def list_my_friend_requests(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user_id: int = Depends(auth.get_current_user_id),
 ) -> Any:
-    rows = crud.get_friend_requests_for_user(db, current_user.id, only_pending=True)
+    rows = crud.get_friend_requests_for_user(db, current_user_id, only_pending=True)
     out = []
     for r in rows:
         sender = r.requester
@@ -552,6 +560,7 @@ def list_my_friend_requests(
                 "name": sender.name,
                 "email": sender.email,
                 "avatar_url": sender.avatar_url,
+                "avatar_variants": sender.avatar_variants,
             }
         out.append(schemas.FriendshipIncomingOut(
             id=r.id,
@@ -568,9 +577,9 @@ def list_my_friend_requests(
 @router.get("/me/friends/requests/sent", response_model=List[schemas.FriendshipOutgoingOut])
 def list_my_sent_requests(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user_id: int = Depends(auth.get_current_user_id),
 ) -> Any:
-    rows = crud.get_sent_friend_requests(db, current_user.id)
+    rows = crud.get_sent_friend_requests(db, current_user_id)
     out = []
     for r in rows:
         target = r.receiver
@@ -581,6 +590,7 @@ def list_my_sent_requests(
                 "name": target.name,
                 "email": target.email,
                 "avatar_url": target.avatar_url,
+                "avatar_variants": target.avatar_variants,
             }
         out.append(schemas.FriendshipOutgoingOut(
             id=r.id,
@@ -598,36 +608,36 @@ def list_my_sent_requests(
 def get_friendship_status(
     target_user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user_id: int = Depends(auth.get_current_user_id),
 ) -> Any:
-    if target_user_id == current_user.id:
+    if target_user_id == current_user_id:
         return schemas.FriendshipStatusOut(status="self")
 
-    sent = crud.get_friendship_between(db, current_user.id, target_user_id)
-    if sent:
-        if sent.status == "blocked":
-            return schemas.FriendshipStatusOut(status="blocked", friendship_id=sent.id)
-        if sent.status == "accepted":
-            return schemas.FriendshipStatusOut(status="accepted", friendship_id=sent.id)
-        if sent.status == "pending":
-            return schemas.FriendshipStatusOut(status="pending_sent", friendship_id=sent.id)
+    # do índice em memória (app.friend_graph); se o outro bloqueou você, vem "none"
+    status_, friendship_id = crud.get_friendship_status(db, current_user_id, target_user_id)
+    return schemas.FriendshipStatusOut(status=status_, friendship_id=friendship_id)
 
-    received = crud.get_friendship_between(db, target_user_id, current_user.id)
-    if received:
-        if received.status == "accepted":
-            return schemas.FriendshipStatusOut(status="accepted", friendship_id=received.id)
-        if received.status == "pending":
-            return schemas.FriendshipStatusOut(status="pending_received", friendship_id=received.id)
-        # Se eles bloquearam você, não revele — retorna "none"
 
-    return schemas.FriendshipStatusOut(status="none")
+@router.post("/me/friends/status:batch", response_model=schemas.FriendshipStatusBatchOut)
+def get_friendship_statuses(
+    payload: schemas.FriendshipStatusBatchIn,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+) -> Any:
+    # uma chamada para todas as linhas de uma busca, em vez de um GET por usuário
+    statuses = crud.get_friendship_statuses(db, current_user_id, payload.user_ids)
+    items = []
+    for uid in dict.fromkeys(payload.user_ids):
+        status_, friendship_id = statuses[uid]
+        items.append(schemas.FriendshipStatusItem(user_id=uid, status=status_, friendship_id=friendship_id))
+    return schemas.FriendshipStatusBatchOut(items=items)
 
 
 @router.delete("/me/friends/{friend_id}", status_code=204)
 def remove_friend(
     friend_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     removed = crud.remove_friend(db, current_user.id, friend_id)
     if not removed:
@@ -639,7 +649,7 @@ def remove_friend(
 def cancel_friend_request(
     request_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ) -> Any:
     cancelled = crud.cancel_friend_request(db, request_id, current_user.id)
     if not cancelled:
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field, conint, ConfigDict
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, conint, ConfigDict, model_validator
+from typing import Optional, List, Dict
+from datetime import datetime, timezone
 from enum import Enum
 
 # --- Users / Auth ---
@@ -20,6 +20,7 @@ class UserOut(BaseModel):
     name: Optional[str] = None
     bio: Optional[str] = None
     avatar_url: Optional[str] = None
+    avatar_variants: Optional[Dict[str, str]] = None
     is_active: bool = True
     created_at: Optional[datetime] = None
     games_count: int = 0
@@ -46,6 +47,7 @@ class ReviewUser(BaseModel):
     id: int
     name: Optional[str] = None
     avatar_url: Optional[str] = None
+    avatar_variants: Optional[Dict[str, str]] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -140,6 +142,23 @@ class GameWithReviews(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class GameRankEntry(BaseModel):
+    rank: int
+    id: int
+    name: str
+    external_guid: Optional[str] = None
+    cover_url: Optional[str] = None
+    score: float
+    avg_rating: Optional[float] = None
+    ratings_count: int = 0
+
+
+class GameRanking(BaseModel):
+    window: str
+    refreshed_at: Optional[datetime] = None
+    items: List[GameRankEntry] = Field(default_factory=list)
+
+
 # --- Pagination wrappers ---
 class PaginatedGames(BaseModel):
     total: int
@@ -184,6 +203,17 @@ class ReviewAutoSave(BaseModel):
 
 
 # --- Novos: pivot user <-> game (registro de sessões/plays por usuário) --- #
+def session_bounds_inverted(started_at: Optional[datetime], finished_at: Optional[datetime]) -> bool:
+    """finished_at antes de started_at (datas sem fuso contam como UTC)."""
+    if started_at is None or finished_at is None:
+        return False
+    if started_at.tzinfo is None:
+        started_at = started_at.replace(tzinfo=timezone.utc)
+    if finished_at.tzinfo is None:
+        finished_at = finished_at.replace(tzinfo=timezone.utc)
+    return finished_at < started_at
+
+
 class UserGameBase(BaseModel):
     started_at: Optional[datetime] = Field(
         None, description="Quando o usuário começou a jogar/registrou a sessão"
@@ -194,6 +224,12 @@ class UserGameBase(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+    @model_validator(mode="after")
+    def check_session_bounds(self):
+        if session_bounds_inverted(self.started_at, self.finished_at):
+            raise ValueError("finished_at não pode ser anterior a started_at")
+        return self
+
 
 class UserGameCreate(UserGameBase):
     game_id: int = Field(..., description="ID do jogo")
@@ -218,6 +254,11 @@ class UserGameOut(UserGameBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+    @model_validator(mode="after")
+    def check_session_bounds(self):
+        # saída: linhas gravadas antes da validação continuam serializáveis
+        return self
+
 
 # --- Novos: friendships pivot (user <-> user) --- #
 class FriendshipStatus(str, Enum):
@@ -265,6 +306,7 @@ class FriendshipRequesterOut(BaseModel):
     name: Optional[str] = None
     email: str
     avatar_url: Optional[str] = None
+    avatar_variants: Optional[Dict[str, str]] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -293,3 +335,28 @@ class FriendshipStatusOut(BaseModel):
     """Status atual da relação entre dois usuários."""
     status: str  # "none" | "pending_sent" | "pending_received" | "accepted" | "blocked"
     friendship_id: Optional[int] = None
+
+
+FRIENDSHIP_STATUS_BATCH_MAX = 500
+
+
+class FriendshipStatusBatchIn(BaseModel):
+    user_ids: List[int] = Field(..., max_length=FRIENDSHIP_STATUS_BATCH_MAX,
+                                description=f"IDs dos usuários (até {FRIENDSHIP_STATUS_BATCH_MAX})")
+
+
+class FriendshipStatusItem(FriendshipStatusOut):
+    user_id: int
+
+
+class FriendshipStatusBatchOut(BaseModel):
+    items: List[FriendshipStatusItem]
+
+
+class FriendSuggestionOut(BaseModel):
+    user: ReviewUser
+    mutual_friends: int
+    shared_games: int
+    score: float
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,144 @@
+"""
+Serializadores pré-compilados para as listagens mais acessadas.
+
+Cada serializer é montado uma vez (attrgetter sobre uma tupla fixa de campos)
+e devolve um dict com os valores crus — datetimes inclusive — que o orjson
+converte direto para bytes; só contagens e flags passam por FIELD_COERCIONS. As rotas que usam `json_response` pulam a
+validação do response_model e o jsonable_encoder do FastAPI.
+"""
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+
+
+def _count(value: Any) -> int:
+    return int(value or 0)
+
+
+# Coerções que os loops manuais (e o response_model) faziam: COUNT() pode vir
+# como Decimal/None e o MySQL devolve tinyint em colunas calculadas.
+FIELD_COERCIONS: Dict[str, Callable[[Any], Any]] = {
+    "games_count": _count,
+    "reviews_count": _count,
+    "is_active": bool,
+    "is_public": bool,
+}
+
+
+def row_serializer(*fields: str) -> Callable[[Any], Dict[str, Any]]:
+    """Serializer para objetos ORM ou Rows do SQLAlchemy com os campos informados."""
+    getter = attrgetter(*fields)
+    coerced = tuple((f, FIELD_COERCIONS[f]) for f in fields if f in FIELD_COERCIONS)
+
+    if len(fields) == 1:
+        name = fields[0]
+        convert = FIELD_COERCIONS.get(name)
+
+        if convert is not None:
+            def serialize_one_coerced(row: Any) -> Dict[str, Any]:
+                return {name: convert(getter(row))}
+
+            return serialize_one_coerced
+
+        def serialize_one(row: Any) -> Dict[str, Any]:
+            return {name: getter(row)}
+
+        return serialize_one
+
+    if coerced:
+        def serialize_coerced(row: Any) -> Dict[str, Any]:
+            out = dict(zip(fields, getter(row)))
+            for f, convert in coerced:
+                out[f] = convert(out[f])
+            return out
+
+        return serialize_coerced
+
+    def serialize(row: Any) -> Dict[str, Any]:
+        return dict(zip(fields, getter(row)))
+
+    return serialize
+
+
+@lru_cache(maxsize=256)
+def fields_serializer(fields: Tuple[str, ...]) -> Callable[[Any], Dict[str, Any]]:
+    """row_serializer memoizado por conjunto de campos (usado com ?fields=)."""
+    return row_serializer(*fields)
+
+
+def parse_fields(raw: Optional[str], allowed: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Lê o parâmetro ?fields=a,b,c. Retorna None quando ausente (payload completo)
+    ou a tupla de campos pedidos, na ordem em que vieram. Campo desconhecido -> 400.
+    """
+    if raw is None or not raw.strip():
+        return None
+    requested = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def serialize_many(serializer: Callable[[Any], Dict[str, Any]], rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    return [serializer(r) for r in rows]
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> ORJSONResponse:
+    return ORJSONResponse(content=content, status_code=status_code, headers=headers)
+
+
+# --- Games ---
+GAME_FIELDS = (
+    "id", "name", "external_guid", "cover_url", "description", "user_id", "status",
+    "start_date", "finish_date", "created_at", "updated_at",
+)
+serialize_game = row_serializer(*GAME_FIELDS)
+
+ALL_GAMES_FIELDS = (
+    "external_guid", "reviews_count", "id", "name", "cover_url", "description", "status",
+    "start_date", "finish_date", "created_at", "updated_at",
+)
+
+
+# --- Users ---
+USER_SEARCH_FIELDS = (
+    "id", "email", "name", "bio", "avatar_url", "avatar_variants", "is_active", "created_at", "games_count",
+)
+
+
+# --- Reviews ---
+REVIEW_FIELDS = (
+    "id", "user_id", "game_id", "external_guid", "rating", "review_text", "is_public",
+    "created_at", "updated_at",
+)
+REVIEW_RELATIONS = ("user", "game")
+REVIEW_USER_FIELDS = ("id", "name", "avatar_url", "avatar_variants")
+REVIEW_GAME_FIELDS = ("id", "name", "cover_url")
+serialize_review_user = row_serializer(*REVIEW_USER_FIELDS)
+serialize_review_game = row_serializer(*REVIEW_GAME_FIELDS)
+
+
+@lru_cache(maxsize=256)
+def review_serializer(fields: Optional[Tuple[str, ...]] = None) -> Callable[[Any], Dict[str, Any]]:
+    """Serializer de review (com user/game aninhados) restrito a `fields`, se informado."""
+    selected = fields or REVIEW_FIELDS + REVIEW_RELATIONS
+    scalar = tuple(f for f in selected if f not in REVIEW_RELATIONS)
+    base = fields_serializer(scalar) if scalar else None
+    with_user = "user" in selected
+    with_game = "game" in selected
+
+    def serialize(review: Any) -> Dict[str, Any]:
+        out = base(review) if base else {}
+        if with_user:
+            user = review.user
+            out["user"] = serialize_review_user(user) if user is not None else None
+        if with_game:
+            game = review.game
+            out["game"] = serialize_review_game(game) if game is not None else None
+        return out
+
+    return serialize
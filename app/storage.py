@@ -1,51 +1,151 @@
+"""
+Armazenamento de avatares endereçado por conteúdo.
+
+Cada arquivo é gravado uma única vez como static/media/<aa>/<sha256><ext>
+(aa = dois primeiros hex do hash, para não encher um diretório só). Uploads
+com os mesmos bytes viram o mesmo arquivo; a tabela media_blobs conta as
+referências (ver crud.set_user_avatar). Como o nome nunca muda de conteúdo,
+/static/media é servido com Cache-Control immutable.
+
+Os diretórios antigos (static/avatars e static/uploads/avatars, nomes uuid)
+continuam servidos e removíveis via remove_local_file_from_url.
+
+Onde os blobs ficam depende do backend (app.storage_backends, STORAGE_BACKEND):
+disco local em static/media ou um bucket S3, servido via /media/<chave>.
+"""
 import os
-import uuid
+import re
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, Optional
-from fastapi import UploadFile
-
-UPLOAD_DIR = Path("static/uploads/avatars")
-MEDIA_URL_PREFIX = "/static/uploads/avatars"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-def _secure_ext(filename: str) -> str:
-    name = filename or ""
-    _, ext = os.path.splitext(name)
-    ext = ext.lower()
-    if ext not in (".jpg", ".jpeg", ".png", ".webp", ".gif"):
-        ext = ".png"
-    return ext
-
-def save_avatar_file(file: UploadFile, user_id: int) -> Tuple[str, Path]:
-    ext = _secure_ext(file.filename)
-    filename = f"{user_id}-{uuid.uuid4().hex}{ext}"
-    dest = UPLOAD_DIR / filename
-
-    with dest.open("wb") as f:
-        while True:
-            chunk = file.file.read(1024 * 64)
-            if not chunk:
-                break
-            f.write(chunk)
+from typing import BinaryIO, Optional
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+
+from app.storage_backends import get_backend
+from app.utils.static_files import invalidate_static_file
+from app.utils.uploads import CHUNK_SIZE, sniff_image_type, upload_too_large
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATIC_DIR = BASE_DIR / "static"
+MEDIA_DIR = STATIC_DIR / "media"
+MEDIA_URL_PREFIX = "/static/media"
+MEDIA_TMP_DIR = MEDIA_DIR / ".tmp"
+MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+MEDIA_TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+_BLOB_URL_RE = re.compile(r"^(?:/static/media|/media)/[0-9a-f]{2}/(?P<sha>[0-9a-f]{64})\.(?:jpg|png|webp)$")
+
+logger = logging.getLogger("app.storage")
+
+# diretórios legados (nomes uuid, um arquivo por upload)
+LEGACY_AVATAR_DIRS = {
+    "/static/avatars": STATIC_DIR / "avatars",
+    "/static/uploads/avatars": STATIC_DIR / "uploads" / "avatars",
+}
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    sha256: str
+    ext: str
+    content_type: str
+    size: int
+
+    @property
+    def relpath(self) -> str:
+        return f"{self.sha256[:2]}/{self.sha256}{self.ext}"
+
+    @property
+    def path(self) -> Path:
+        """Caminho no disco local (só vale para o backend local)."""
+        return MEDIA_DIR / self.relpath
+
+    @property
+    def url(self) -> str:
+        return get_backend().url(self.relpath)
+
+
+def blob_sha_from_url(url: Optional[str]) -> Optional[str]:
+    """sha256 do blob se a URL aponta para o store endereçado por conteúdo.
+
+    Aceita URL absoluta (full_url do upload) ou só o path: refcount e GC têm de concordar.
+    """
+    if not url:
+        return None
+    m = _BLOB_URL_RE.match(urlparse(url).path)
+    return m.group("sha") if m else None
+
+
+def store_image(src: BinaryIO, max_bytes: int) -> StoredBlob:
+    """
+    Valida pelos magic bytes, calcula o SHA-256 enquanto copia para um arquivo
+    temporário e publica no backend (os.replace atômico no local, multipart no
+    S3). Se o blob já existe, o temporário é descartado. Síncrono: chamar via
+    threadpool.
+    """
+    src.seek(0)
+    content_type = sniff_image_type(src.read(16))
+    if content_type not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Tipo de imagem não suportado")
+    src.seek(0)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=MEDIA_TMP_DIR, suffix=".part")
     try:
-        file.file.close()
-    except Exception:
-        pass
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise upload_too_large(max_bytes)
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+
+        blob = StoredBlob(digest.hexdigest(), IMAGE_EXTENSIONS[content_type], content_type, size)
+        backend = get_backend()
+        if backend.exists(blob.relpath):
+            os.remove(tmp_name)
+            # renova o mtime: a coleta de lixo (app.jobs.gc_uploads) respeita um
+            # período de carência e não apaga um blob que acabou de ser reaproveitado
+            backend.touch(blob.relpath)
+        else:
+            backend.save(blob.relpath, tmp_name, content_type)
+        return blob
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
 
-    url = f"{MEDIA_URL_PREFIX}/{filename}"
-    return url, dest
 
 def remove_local_file_from_url(avatar_url: Optional[str]) -> bool:
+    """Remove um arquivo legado (nome uuid). Blobs do store são liberados via media_blobs."""
     if not avatar_url:
         return False
-    if not avatar_url.startswith(MEDIA_URL_PREFIX):
-        return False
-    filename = avatar_url.split(MEDIA_URL_PREFIX, 1)[-1].lstrip("/")
-    path = UPLOAD_DIR / filename
-    try:
-        if path.exists():
-            path.unlink()
-            return True
-    except Exception:
-        pass
+    for prefix, directory in LEGACY_AVATAR_DIRS.items():
+        if avatar_url.startswith(prefix + "/"):
+            filename = avatar_url[len(prefix) + 1:]
+            if "/" in filename or filename in ("", ".", ".."):
+                return False
+            path = directory / filename
+            invalidate_static_file(path)
+            try:
+                path.unlink()
+                return True
+            except FileNotFoundError:
+                return False
+            except OSError:
+                # o arquivo fica para a coleta de lixo (app.jobs.gc_uploads)
+                logger.warning("Não consegui remover o avatar antigo %s", path, exc_info=True)
+                return False
     return False
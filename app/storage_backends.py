@@ -0,0 +1,239 @@
+"""
+Backends de armazenamento dos uploads (avatares e variantes).
+
+- local: arquivos em static/media, servidos pelo próprio app em /static/media
+  (comportamento original; cada nó tem o seu disco).
+- s3: bucket S3 ou compatível (MinIO etc. via S3_ENDPOINT_URL). O upload usa o
+  TransferManager do boto3 (multipart em streaming a partir do arquivo
+  temporário, sem carregar tudo em memória) e a leitura sai do bucket: a URL
+  gravada no usuário é /media/<chave>, que redireciona para uma URL pré-assinada
+  (ver routers/media_router.py). Os bytes da imagem não passam pelos workers.
+
+Escolha com STORAGE_BACKEND=local|s3. As chaves são sempre relativas
+("aa/<sha256>.png"); o backend decide onde e como ficam.
+"""
+import os
+import abc
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+from app.utils.cache import TTLCache
+from app.utils.static_files import invalidate_static_file
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "media/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+S3_PRESIGN_TTL_SECONDS = int(os.getenv("S3_PRESIGN_TTL_SECONDS", "3600"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024
+
+# blobs são endereçados por conteúdo: o objeto nunca muda
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageBackend(abc.ABC):
+    """Interface comum. Métodos síncronos (I/O de disco ou rede): chamar via threadpool."""
+
+    name = "base"
+    # prefixo das URLs gravadas no banco (avatar_url / avatar_variants)
+    url_prefix = ""
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def save(self, key: str, src_path: str, content_type: str) -> None:
+        """Publica o arquivo local `src_path` em `key`. O arquivo de origem é consumido."""
+
+    @abc.abstractmethod
+    def fetch(self, key: str, dest_path: str) -> None:
+        """Copia o objeto para um arquivo local."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove o objeto; não existir não é erro."""
+
+    @abc.abstractmethod
+    def touch(self, key: str) -> None:
+        """Marca o objeto como reaproveitado agora (carência da coleta de lixo)."""
+
+    @abc.abstractmethod
+    def modified_at(self, key: str) -> Optional[float]:
+        """Timestamp da última gravação/touch do objeto; None se não existe."""
+
+    def read_url(self, key: str) -> str:
+        """URL que o cliente deve buscar para ler o objeto."""
+        return self.url(key)
+
+
+class LocalStorageBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: Path, url_prefix: str) -> None:
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def save(self, key: str, src_path: str, content_type: str) -> None:
+        dest = self.path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(src_path, 0o644)
+        os.replace(src_path, dest)
+        invalidate_static_file(dest)
+
+    def fetch(self, key: str, dest_path: str) -> None:
+        shutil.copyfile(self.path(key), dest_path)
+
+    def delete(self, key: str) -> None:
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+        invalidate_static_file(self.path(key))
+
+    def touch(self, key: str) -> None:
+        os.utime(self.path(key))
+
+    def modified_at(self, key: str) -> Optional[float]:
+        try:
+            return self.path(key).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+
+class S3StorageBackend(StorageBackend):
+    name = "s3"
+    url_prefix = "/media"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, presign_ttl: int = 3600,
+                 multipart_threshold: int = 8 * 1024 * 1024,
+                 multipart_chunksize: int = 8 * 1024 * 1024, client=None) -> None:
+        if not bucket:
+            raise RuntimeError("S3_BUCKET é obrigatório com STORAGE_BACKEND=s3")
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_ttl = presign_ttl
+        self.client = client or boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region,
+            config=Config(signature_version="s3v4", retries={"max_attempts": 3, "mode": "standard"}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize,
+        )
+        # URL pré-assinada reaproveitada por metade da validade
+        self._presigned = TTLCache(maxsize=10000, ttl=max(1, presign_ttl // 2))
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _head(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def save(self, key: str, src_path: str, content_type: str) -> None:
+        try:
+            self.client.upload_file(
+                src_path, self.bucket, self._object_key(key),
+                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+                Config=self.transfer_config,
+            )
+        finally:
+            os.remove(src_path)
+
+    def fetch(self, key: str, dest_path: str) -> None:
+        self.client.download_file(self.bucket, self._object_key(key), dest_path, Config=self.transfer_config)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        self._presigned.pop(key)
+
+    def touch(self, key: str) -> None:
+        # S3 não tem utime: copiar o objeto sobre ele mesmo (no servidor) renova o LastModified
+        head = self._head(key)
+        if head is None:
+            return
+        object_key = self._object_key(key)
+        self.client.copy_object(
+            Bucket=self.bucket, Key=object_key,
+            CopySource={"Bucket": self.bucket, "Key": object_key},
+            MetadataDirective="REPLACE",
+            ContentType=head.get("ContentType", "application/octet-stream"),
+            CacheControl=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    def modified_at(self, key: str) -> Optional[float]:
+        head = self._head(key)
+        return head["LastModified"].timestamp() if head is not None else None
+
+    def read_url(self, key: str) -> str:
+        url = self._presigned.get(key)
+        if url is None:
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+                ExpiresIn=self.presign_ttl,
+            )
+            self._presigned.set(key, url)
+        return url
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend()
+    return _backend
+
+
+def set_backend(backend: Optional[StorageBackend]) -> None:
+    """Troca o backend do processo (ex.: apontar para um MinIO local)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def _build_backend() -> StorageBackend:
+    from app import storage
+
+    if STORAGE_BACKEND == "local":
+        return LocalStorageBackend(storage.MEDIA_DIR, storage.MEDIA_URL_PREFIX)
+    if STORAGE_BACKEND == "s3":
+        return S3StorageBackend(
+            S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION,
+            presign_ttl=S3_PRESIGN_TTL_SECONDS, multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        )
+    raise RuntimeError(f"STORAGE_BACKEND desconhecido: {STORAGE_BACKEND}")
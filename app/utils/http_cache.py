@@ -0,0 +1,33 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+
+def weak_etag(*parts: Any) -> str:
+    """ETag fraco a partir de valores baratos (ids, updated_at, contadores de versão)."""
+    raw = "|".join(
+        "" if p is None else (p.isoformat() if hasattr(p, "isoformat") else str(p))
+        for p in parts
+    )
+    return 'W/"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparação fraca (RFC 9110) contra If-None-Match."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(candidate) == wanted for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
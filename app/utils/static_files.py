@@ -0,0 +1,214 @@
+"""
+Serviço de /static com cache HTTP.
+
+- Cache-Control por prefixo de caminho (o prefixo mais longo vence).
+- Índice em memória (LRU + TTL) com o stat de cada arquivo, montado no
+  startup. Num acerto só se faz um os.stat do arquivo para conferir mtime e
+  tamanho (sem threadpool, sem lookup_path nem stat das variantes); se o
+  arquivo sumiu ou mudou, a entrada sai e o request segue pelo caminho normal.
+  Arquivos novos (uploads) entram no índice no primeiro acesso, e quem apaga
+  ou substitui arquivos servidos chama invalidate_static_file.
+- ETag forte (hash do conteúdo) calculado uma vez por versão do arquivo
+  (caminho + mtime + tamanho) e guardado em memória. Para blobs nomeados pelo
+  hash (ver app.storage) o próprio nome é o ETag, sem ler o arquivo.
+- Variantes pré-comprimidas (.br / .gz ao lado do arquivo) conforme o
+  Accept-Encoding, com Vary: Accept-Encoding.
+
+O corpo sai por FileResponse do Starlette, que já trata Range e usa o
+`http.response.pathsend` (sendfile no servidor) quando o servidor ASGI oferece.
+"""
+import os
+import re
+import stat
+import hashlib
+import weakref
+import mimetypes
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.utils.cache import TTLCache
+
+_HASH_NAME_RE = re.compile(r"^[0-9a-f]{64}(?:_\d+)?\.[a-z0-9]+$")
+# preferência do servidor quando o cliente aceita os dois
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def parse_cache_policies(raw: str) -> List[Tuple[str, str]]:
+    """'media/=public, max-age=31536000, immutable;avatars/=public, max-age=86400'"""
+    policies = []
+    for item in raw.split(";"):
+        if "=" not in item:
+            continue
+        prefix, value = item.split("=", 1)
+        policies.append((prefix.strip().lstrip("/"), value.strip()))
+    return policies
+
+
+@dataclass
+class _Entry:
+    full_path: str
+    stat_result: os.stat_result
+    etag: Optional[str] = None
+    encoded: Dict[str, Tuple[str, os.stat_result]] = field(default_factory=dict)
+
+
+def _same_file(full_path: str, cached: os.stat_result) -> bool:
+    try:
+        current = os.stat(full_path)
+    except OSError:
+        return False
+    return current.st_mtime_ns == cached.st_mtime_ns and current.st_size == cached.st_size
+
+
+# instâncias montadas, para invalidate_static_file
+_instances: "weakref.WeakSet[CachedStaticFiles]" = weakref.WeakSet()
+
+
+def invalidate_static_file(full_path) -> None:
+    """Tira um arquivo do índice de todas as instâncias (chamar ao apagar ou substituir)."""
+    for instance in list(_instances):
+        instance.invalidate(full_path)
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(self, *args, cache_policies: Sequence[Tuple[str, str]] = (),
+                 default_cache_control: Optional[str] = None, index_size: int = 50000,
+                 index_ttl: float = 300.0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # prefixo mais longo primeiro
+        self.cache_policies = sorted(cache_policies, key=lambda p: len(p[0]), reverse=True)
+        self.default_cache_control = default_cache_control
+        self._index = TTLCache(maxsize=index_size, ttl=index_ttl)
+        # (full_path, mtime_ns, size) -> etag; sobrevive à expiração do índice
+        self._etags = TTLCache(maxsize=index_size, ttl=24 * 60 * 60)
+        _instances.add(self)
+
+    # --- índice ---
+    def build_index(self) -> int:
+        """Varre o diretório e indexa o stat dos arquivos (chamar fora do event loop)."""
+        count = 0
+        for directory in self.all_directories:
+            root_dir = os.path.realpath(directory)
+            for root, dirs, files in os.walk(root_dir):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                for name in files:
+                    if name.endswith((".br", ".gz", ".part")):
+                        continue
+                    rel = os.path.relpath(os.path.join(root, name), root_dir)
+                    if self._load_entry(rel) is not None:
+                        count += 1
+                    if count >= self._index.maxsize:
+                        return count
+        return count
+
+    def _load_entry(self, path: str) -> Optional[_Entry]:
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            self._index.pop(path)
+            return None
+        entry = _Entry(full_path, stat_result)
+        entry.etag = self._etags.get((full_path, stat_result.st_mtime_ns, stat_result.st_size))
+        for encoding, suffix in _ENCODINGS:
+            try:
+                encoded_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(encoded_stat.st_mode):
+                entry.encoded[encoding] = (full_path + suffix, encoded_stat)
+        self._index.set(path, entry)
+        return entry
+
+    def _is_current(self, entry: _Entry) -> bool:
+        """O arquivo (e as variantes comprimidas) continua o mesmo do stat indexado."""
+        if not _same_file(entry.full_path, entry.stat_result):
+            return False
+        return all(_same_file(p, st) for p, st in entry.encoded.values())
+
+    def invalidate(self, full_path) -> None:
+        real = os.path.realpath(full_path)
+        for _, suffix in _ENCODINGS:
+            if real.endswith(suffix):
+                real = real[: -len(suffix)]
+        for directory in self.all_directories:
+            root_dir = os.path.realpath(directory)
+            if real.startswith(root_dir + os.sep):
+                self._index.pop(os.path.relpath(real, root_dir))
+
+    def _compute_etag(self, entry: _Entry) -> str:
+        name = os.path.basename(entry.full_path)
+        if _HASH_NAME_RE.match(name):
+            etag = f'"{name.rsplit(".", 1)[0]}"'
+        else:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(entry.full_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            etag = f'"{digest.hexdigest()}"'
+        st = entry.stat_result
+        self._etags.set((entry.full_path, st.st_mtime_ns, st.st_size), etag)
+        return etag
+
+    # --- resposta ---
+    def cache_control_for(self, path: str) -> Optional[str]:
+        normalized = path.replace(os.sep, "/")
+        for prefix, value in self.cache_policies:
+            if normalized.startswith(prefix):
+                return value
+        return self.default_cache_control
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        entry = self._index.get(path)
+        if entry is not None and not self._is_current(entry):
+            # apagado ou reescrito fora deste processo (ex.: app.jobs.gc_uploads)
+            self._index.pop(path)
+            entry = None
+        if entry is None:
+            try:
+                entry = await anyio.to_thread.run_sync(self._load_entry, path)
+            except PermissionError:
+                raise HTTPException(status_code=401)
+            except OSError:
+                entry = None
+            if entry is None:
+                # diretórios, html mode e 404 ficam com o StaticFiles padrão
+                return await super().get_response(path, scope)
+        if entry.etag is None:
+            entry.etag = await anyio.to_thread.run_sync(self._compute_etag, entry)
+
+        request_headers = Headers(scope=scope)
+        serve_path, serve_stat, encoding = entry.full_path, entry.stat_result, None
+        if entry.encoded:
+            accepted = request_headers.get("accept-encoding", "")
+            for name, _ in _ENCODINGS:
+                if name in entry.encoded and name in accepted:
+                    serve_path, serve_stat = entry.encoded[name]
+                    encoding = name
+                    break
+
+        response = FileResponse(
+            serve_path,
+            stat_result=serve_stat,
+            media_type=mimetypes.guess_type(entry.full_path)[0] or "text/plain",
+        )
+        response.headers["etag"] = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+        cache_control = self.cache_control_for(path)
+        if cache_control:
+            response.headers["cache-control"] = cache_control
+        if entry.encoded:
+            response.headers["vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["content-encoding"] = encoding
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,12 @@
+import re
+import html as _html
+from typing import Optional
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def strip_html(text: Optional[str]) -> str:
+    """Remove todas as tags HTML e decodifica entidades."""
+    if not text:
+        return ""
+    return _html.unescape(_TAG_RE.sub("", text)).strip()
@@ -0,0 +1,75 @@
+"""
+Leitura de uploads multipart em streaming, com limite de tamanho.
+
+O corpo é consumido em chunks direto do `request.stream()`; ao passar do
+limite a leitura é abortada com 413 (sem ler o resto). Partes de arquivo
+ficam no SpooledTemporaryFile do Starlette (até 1 MB em memória, depois
+disco), então nenhum upload é carregado inteiro em memória.
+"""
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+CHUNK_SIZE = 64 * 1024
+# folga para boundaries e cabeçalhos das partes do multipart
+MULTIPART_OVERHEAD = 16 * 1024
+
+# assinaturas (magic bytes) -> content type
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+def upload_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Arquivo muito grande (máx {max_bytes // (1024 * 1024)}MB)",
+    )
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Tipo real da imagem pelos primeiros bytes (ignora o content-type do cliente)."""
+    for signature, content_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def _limited(stream: AsyncIterator[bytes], limit: int, max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise upload_too_large(max_bytes)
+        yield chunk
+
+
+async def read_single_upload(request: Request, field: str, max_bytes: int) -> UploadFile:
+    """
+    Lê o corpo multipart e devolve o arquivo do campo `field`. Rejeita antes de
+    ler qualquer byte quando o Content-Length já passa do limite.
+    """
+    limit = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise upload_too_large(max_bytes)
+
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Envie o arquivo como multipart/form-data")
+
+    parser = MultiPartParser(request.headers, _limited(request.stream(), limit, max_bytes), max_files=1, max_fields=10)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message) from e
+
+    upload = form.get(field)
+    if not isinstance(upload, UploadFile):
+        raise HTTPException(status_code=400, detail=f"Campo '{field}' com o arquivo é obrigatório")
+    return upload
@@ -0,0 +1,59 @@
+"""
+Microbenchmark: custo de autenticação por request (decodificação do bearer).
+
+Compara a verificação completa do JWT (HMAC + parse das claims, o que era
+feito em todo request) com o caminho via cache de tokens decodificados, e
+projeta o tempo de CPU gasto por segundo nas taxas de request informadas.
+
+Uso: python -m benchmarks.bench_auth [n_tokens] [requests_por_segundo ...]
+"""
+import sys
+import timeit
+from datetime import timedelta
+
+from app import auth
+
+
+def _make_tokens(n: int):
+    return [
+        auth.create_access_token(subject=str(i), expires_delta=timedelta(minutes=30),
+                                 extra_claims={"ver": 0, "type": "access"})
+        for i in range(n)
+    ]
+
+
+def uncached(tokens):
+    for t in tokens:
+        auth._decode_with_keys(t)
+
+
+def cached(tokens):
+    for t in tokens:
+        auth.decode_access_token(t)
+
+
+def claims_dependency(tokens):
+    for t in tokens:
+        auth.get_token_claims(t)
+
+
+def main(n_tokens: int = 100, rates=(100, 1000, 5000), repeat: int = 50) -> None:
+    tokens = _make_tokens(n_tokens)
+    cached(tokens)  # aquece o cache
+    cases = [
+        ("jwt.decode (sem cache)", uncached),
+        ("decode_access_token (cache quente)", cached),
+        ("get_token_claims (cache quente)", claims_dependency),
+    ]
+    print(f"{n_tokens} tokens distintos, {repeat} repetições")
+    for label, fn in cases:
+        best = min(timeit.repeat(lambda: fn(tokens), number=1, repeat=repeat))
+        per_request = best / n_tokens
+        load = "  ".join(f"{r}/s: {per_request * r * 1e3:6.2f} ms CPU/s" for r in rates)
+        print(f"  {label:<36} {per_request * 1e6:8.2f} µs/req   {load}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rates = tuple(int(a) for a in sys.argv[2:]) or (100, 1000, 5000)
+    main(n, rates)
@@ -0,0 +1,85 @@
+"""
+Microbenchmark: custo por item da serialização das listagens de games.
+
+Compara o caminho antigo (dict montado à mão com .isoformat(), ou
+validação Pydantic do response_model, seguido de jsonable_encoder +
+json.dumps) com o novo (serializer pré-compilado + orjson).
+
+Uso: python -m benchmarks.bench_serialization [n_items] [repeticoes]
+"""
+import sys
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app import schemas
+from app.serializers import serialize_game, serialize_many
+
+
+def _make_games(n: int):
+    now = datetime(2025, 1, 1, 12, 30)
+    return [
+        SimpleNamespace(
+            id=i,
+            name=f"Game {i}",
+            external_guid=f"3030-{i}",
+            cover_url=f"https://example.com/covers/{i}.jpg",
+            description="<p>Descrição longa do jogo</p>" * 20,
+            user_id=1,
+            status="Playing",
+            start_date=now - timedelta(days=i),
+            finish_date=None,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def legacy_dicts(games):
+    out = []
+    for g in games:
+        out.append({
+            "id": g.id,
+            "name": g.name,
+            "external_guid": g.external_guid,
+            "cover_url": g.cover_url,
+            "description": g.description,
+            "user_id": g.user_id,
+            "status": g.status,
+            "start_date": g.start_date.isoformat() if g.start_date else None,
+            "finish_date": g.finish_date.isoformat() if g.finish_date else None,
+            "created_at": g.created_at.isoformat() if g.created_at else None,
+            "updated_at": g.updated_at.isoformat() if g.updated_at else None,
+        })
+    return JSONResponse(jsonable_encoder(out)).body
+
+
+def legacy_response_model(games):
+    validated = schemas.PaginatedGames.model_validate({"total": len(games), "items": games})
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def precompiled_orjson(games):
+    return ORJSONResponse({"total": len(games), "items": serialize_many(serialize_game, games)}).body
+
+
+def main(n_items: int = 200, repeat: int = 50) -> None:
+    games = _make_games(n_items)
+    cases = [
+        ("dict manual + jsonable_encoder + json", legacy_dicts),
+        ("response_model + jsonable_encoder + json", legacy_response_model),
+        ("serializer pré-compilado + orjson", precompiled_orjson),
+    ]
+    print(f"{n_items} itens por resposta, {repeat} repetições")
+    for label, fn in cases:
+        best = min(timeit.repeat(lambda: fn(games), number=1, repeat=repeat))
+        print(f"  {label:<42} {best * 1e6 / n_items:8.2f} µs/item")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,84 @@
+"""
+Verificação de concorrência: pedidos de amizade cruzados (A->B e B->A) ao mesmo tempo.
+
+Para cada rodada cria dois usuários descartáveis, dispara os dois pedidos em
+threads com sessões próprias (liberadas juntas por uma barreira) e confere o
+estado final: exatamente duas linhas em friendships, ambas accepted, e nenhum
+erro de chave duplicada. Roda contra o MySQL configurado (DB_*), que é onde o
+SELECT ... FOR UPDATE vale; no fim os usuários de teste são removidos.
+O mesmo cenário roda no pytest em tests/test_friend_requests_mysql.py.
+
+Uso: python -m benchmarks.race_friend_requests [rodadas]
+"""
+import sys
+import time
+import uuid
+import threading
+
+from app.database import SessionLocal
+from app import crud, models
+
+
+def _make_user(db) -> int:
+    u = models.User(email=f"race-{uuid.uuid4().hex}@example.invalid", hashed_password="!", is_active=True)
+    db.add(u)
+    db.commit()
+    return u.id
+
+
+def _send(session_factory, barrier: threading.Barrier, user_id: int, friend_id: int, errors: list) -> None:
+    db = session_factory()
+    try:
+        barrier.wait()
+        crud.create_friend_request(db, user_id, friend_id)
+    except Exception as e:
+        errors.append(repr(e))
+    finally:
+        db.close()
+
+
+def run_round(db, session_factory=SessionLocal) -> str:
+    a, b = _make_user(db), _make_user(db)
+    errors: list = []
+    barrier = threading.Barrier(2)
+    threads = [
+        threading.Thread(target=_send, args=(session_factory, barrier, a, b, errors)),
+        threading.Thread(target=_send, args=(session_factory, barrier, b, a, errors)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db.expire_all()
+    rows = db.query(models.Friendship.user_id, models.Friendship.status).filter(
+        models.Friendship.user_id.in_([a, b]), models.Friendship.friend_id.in_([a, b])
+    ).all()
+    db.query(models.User).filter(models.User.id.in_([a, b])).delete(synchronize_session=False)
+    db.commit()
+
+    if errors:
+        return "erro: " + "; ".join(errors)
+    if sorted(rows) != sorted([(a, "accepted"), (b, "accepted")]):
+        return f"estado inconsistente: {rows}"
+    return "ok"
+
+
+def main(rounds: int = 50) -> int:
+    db = SessionLocal()
+    failures = 0
+    started = time.perf_counter()
+    try:
+        for i in range(rounds):
+            result = run_round(db)
+            if result != "ok":
+                failures += 1
+                print(f"rodada {i}: {result}")
+    finally:
+        db.close()
+    print(f"{rounds} rodadas em {time.perf_counter() - started:.1f}s, {failures} falhas")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 50) else 0)
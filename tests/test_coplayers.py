@@ -0,0 +1,69 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from app import schemas
+from app.coplayers import IntervalTree, to_bound
+
+
+def _brute_force(intervals, start, end):
+    """Regra da consulta antiga, com os extremos de cada intervalo em ordem."""
+    if start > end:
+        start, end = end, start
+    return {iv[2] for iv in intervals if min(iv[0], iv[1]) <= end and max(iv[0], iv[1]) >= start}
+
+
+def _ids(tree, start, end):
+    return {iv[2] for iv in tree.overlapping(start, end)}
+
+
+def test_inverted_interval_does_not_recurse():
+    tree = IntervalTree([(10.0, 5.0, 1, 1)])
+    assert _ids(tree, 6.0, 7.0) == {1}
+    assert _ids(tree, 11.0, 12.0) == set()
+
+
+def test_inverted_query_is_normalized():
+    tree = IntervalTree([(0.0, 3.0, 1, 1), (8.0, 9.0, 2, 2)])
+    assert _ids(tree, 4.0, 1.0) == {1}
+
+
+def test_open_bounds():
+    tree = IntervalTree([
+        (-math.inf, 5.0, 1, 1),   # started_at NULL
+        (20.0, math.inf, 2, 2),   # finished_at NULL
+        (-math.inf, math.inf, 3, 3),
+        (math.inf, -math.inf, 4, 4),  # invertido e aberto nos dois lados
+    ])
+    assert _ids(tree, 0.0, 1.0) == {1, 3, 4}
+    assert _ids(tree, 10.0, 11.0) == {3, 4}
+    assert _ids(tree, 25.0, math.inf) == {2, 3, 4}
+    assert _ids(tree, -math.inf, math.inf) == {1, 2, 3, 4}
+
+
+def test_to_bound_null_values():
+    assert to_bound(None, -math.inf) == -math.inf
+    assert to_bound(None, math.inf) == math.inf
+
+
+def test_matches_brute_force():
+    rng = random.Random(50)
+    points = [float(p) for p in range(0, 40)] + [-math.inf, math.inf]
+    intervals = [(rng.choice(points), rng.choice(points), i, i) for i in range(300)]
+    tree = IntervalTree(intervals)
+    for _ in range(500):
+        start, end = rng.choice(points), rng.choice(points)
+        assert _ids(tree, start, end) == _brute_force(intervals, start, end)
+
+
+def test_schema_rejects_inverted_session():
+    now = datetime(2024, 1, 1, 12, 0)
+    with pytest.raises(ValidationError):
+        schemas.UserGameCreate(game_id=1, started_at=now, finished_at=now - timedelta(hours=1))
+    with pytest.raises(ValidationError):
+        schemas.UserGameUpdate(started_at=now, finished_at=now - timedelta(seconds=1))
+    assert schemas.UserGameCreate(game_id=1, started_at=now, finished_at=now).finished_at == now
+    assert schemas.UserGameCreate(game_id=1, started_at=None, finished_at=now).started_at is None
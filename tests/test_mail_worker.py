@@ -0,0 +1,77 @@
+"""
+MailWorker contra um servidor SMTP de verdade (aiosmtpd em thread): entrega
+dos lotes e reaproveitamento das conexões do pool. Pula se o aiosmtpd não
+estiver instalado (pip install aiosmtpd).
+"""
+import asyncio
+import socket
+from email.message import EmailMessage
+
+import pytest
+
+pytest.importorskip("aiosmtpd", reason="aiosmtpd não instalado")
+from aiosmtpd.controller import Controller
+
+from app.mail_worker import MailWorker, SMTPConnectionPool
+
+
+class _Inbox:
+    def __init__(self):
+        self.received = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append(envelope.rcpt_tos[0])
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _message(i):
+    msg = EmailMessage()
+    msg["From"] = "noreply@example.com"
+    msg["To"] = f"user{i}@example.com"
+    msg["Subject"] = f"teste {i}"
+    msg.set_content("olá")
+    return msg
+
+
+@pytest.fixture
+def smtp_server():
+    inbox = _Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        yield controller, inbox
+    finally:
+        controller.stop()
+
+
+def test_send_many_delivers_batches_over_pooled_connections(smtp_server):
+    controller, inbox = smtp_server
+
+    async def run():
+        pool = SMTPConnectionPool(controller.hostname, controller.port, start_tls=False, size=2)
+        worker = MailWorker(pool, batch_size=3)
+        try:
+            first = await worker.send_many([_message(i) for i in range(8)])
+            connects_after_first = pool.connects
+            second = await worker.send_many([_message(i) for i in range(8, 12)])
+            return first, second, connects_after_first, worker.metrics()
+        finally:
+            await worker.close()
+
+    first, second, connects_after_first, metrics = asyncio.run(run())
+
+    assert first == [None] * 8 and second == [None] * 4
+    assert sorted(inbox.received) == sorted(f"user{i}@example.com" for i in range(12))
+    # 3 + 2 lotes, mas nunca mais conexões que o tamanho do pool
+    assert metrics["batches"] == 5 and metrics["sent"] == 12 and metrics["failed"] == 0
+    assert connects_after_first <= 2
+    assert metrics["smtp_connects"] == connects_after_first
+    assert len(inbox.sessions) == metrics["smtp_connects"]
@@ -0,0 +1,85 @@
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from app import models, schemas
+from app.serializers import (
+    ALL_GAMES_FIELDS, USER_SEARCH_FIELDS, fields_serializer, review_serializer, serialize_game,
+)
+
+NOW = datetime(2024, 5, 1, 12, 30)
+
+
+def _search_row(**overrides):
+    """Linha como o MySQL devolve em search_users: COUNT() em Decimal, tinyint em is_active."""
+    row = dict(
+        id=7, email="ana@example.com", name="Ana", bio=None, avatar_url="/media/ab/x.png",
+        avatar_variants={"64": "/media/ab/x-64.webp"}, is_active=1, created_at=NOW,
+        games_count=Decimal("3"),
+    )
+    row.update(overrides)
+    return SimpleNamespace(**row)
+
+
+def _typed(payload):
+    """Decimal(3) == 3 e 1 == True: compara também o tipo, que é o que o orjson serializa."""
+    return {k: (type(v), v) for k, v in payload.items()}
+
+
+def _game():
+    return models.Game(
+        id=3, name="Celeste", external_guid="g-3", cover_url=None, description="plataforma",
+        user_id=7, status="finished", start_date=NOW, finish_date=None, created_at=NOW, updated_at=NOW,
+    )
+
+
+@pytest.mark.parametrize("row", [
+    _search_row(),
+    _search_row(is_active=0, games_count=0, avatar_variants=None),
+])
+def test_user_search_matches_user_out(row):
+    expected = schemas.UserOut.model_validate(row).model_dump()
+    assert _typed(fields_serializer(USER_SEARCH_FIELDS)(row)) == _typed(expected)
+
+
+def test_user_search_coerces_like_baseline():
+    out = fields_serializer(USER_SEARCH_FIELDS)(_search_row(games_count=None, is_active=1))
+    assert out["games_count"] == 0 and type(out["games_count"]) is int
+    assert out["is_active"] is True
+    assert fields_serializer(("games_count",))(_search_row(games_count=Decimal("2"))) == {"games_count": 2}
+
+
+def test_game_matches_game_out():
+    game = _game()
+    assert _typed(serialize_game(game)) == _typed(schemas.GameOut.model_validate(game).model_dump())
+
+
+def test_all_games_row_matches_game_with_rating():
+    row = SimpleNamespace(reviews_count=Decimal("5"), **{
+        f: getattr(_game(), f) for f in ALL_GAMES_FIELDS if f != "reviews_count"
+    })
+    out = fields_serializer(ALL_GAMES_FIELDS)(row)
+    expected = schemas.GameWithRating.model_validate(
+        SimpleNamespace(user_id=7, avg_rating=None, **vars(row))
+    ).model_dump(include=set(ALL_GAMES_FIELDS))
+    assert _typed(out) == _typed(expected)
+
+
+@pytest.mark.parametrize("fields", [None, ("id", "rating", "is_public", "user")])
+def test_review_matches_review_out(fields):
+    review = models.Review(
+        id=11, user_id=7, game_id=3, external_guid="g-3", rating=8, review_text="bom",
+        is_public=True, created_at=NOW, updated_at=NOW,
+    )
+    review.user = models.User(id=7, email="ana@example.com", name="Ana", avatar_url=None, avatar_variants=None)
+    review.game = _game()
+
+    out = review_serializer(fields)(review)
+    expected = schemas.ReviewOut.model_validate(review).model_dump(include=set(fields) if fields else None)
+    assert out.keys() == expected.keys()
+    for key in ("user", "game"):
+        if key in out:
+            assert out.pop(key) == expected.pop(key)
+    assert _typed(out) == _typed(expected)